@@ -0,0 +1,357 @@
+# bench/mock_services.py
+"""Local stand-ins for the external services used on the alert path.
+
+One asyncio HTTP server (keep-alive, HTTP/1.1) answers, by path prefix:
+    /rpc                   Solana JSON-RPC (getSignaturesForAddress, getTransaction, getTokenSupply)
+    /dex/latest/dex/...    Dexscreener tokens/pairs
+    /birdeye/defi/price    Birdeye price
+    /jup/v4/price          Jupiter price
+    /tg/bot<token>/<m>     Telegram Bot API (getMe, sendMessage, editMessageText, ...)
+
+SyntheticMarket produces KOL trades: background noise spread over many mints plus
+periodic "hot" tokens that a cluster of wallets buys within a short time, which is
+exactly what the multi-buy detector looks for. A share of trades (failed_rate) lands
+on-chain with an error. getTransaction honours the "json" / "jsonParsed" encodings,
+so response sizes track what the bot actually asks for.
+"""
+import asyncio
+import json
+import random
+import string
+import time
+from collections import defaultdict
+from urllib.parse import parse_qs, urlsplit
+
+SOL_MINT = "So11111111111111111111111111111111111111112"
+SYSTEM_PROGRAM = "11111111111111111111111111111111"
+TOKEN_PROGRAM = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+SWAP_PROGRAM = "JUP6LkbZbjS1jKKwapdHNy74zcZ3tLUZoi5QNyVTaV4"
+_B58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+
+def _b58(rng: random.Random, n: int = 44) -> str:
+    return "".join(rng.choice(_B58) for _ in range(n))
+
+
+class SyntheticMarket:
+    """In-memory chain: per-wallet signature lists and the transactions behind them."""
+
+    def __init__(self, n_wallets: int = 100, n_tokens: int = 200, seed: int = 1,
+                 trades_per_wallet_per_min: float = 0.5, hot_every_seconds: float = 20.0,
+                 cluster_size: int = 4, cluster_spread_seconds: float = 30.0, failed_rate: float = 0.0):
+        self.rng = random.Random(seed)
+        self.wallets = [_b58(self.rng) for _ in range(n_wallets)]
+        self.tokens = [_b58(self.rng) for _ in range(n_tokens)]
+        self.token_meta = {
+            mint: {
+                "symbol": "".join(self.rng.choice(string.ascii_uppercase) for _ in range(4)),
+                "supply": 1_000_000_000.0,
+                "price": self.rng.uniform(0.00005, 0.002),
+            }
+            for mint in self.tokens
+        }
+        self.trade_rate = trades_per_wallet_per_min / 60.0
+        self.hot_every = hot_every_seconds
+        self.cluster_size = max(1, cluster_size)
+        self.cluster_spread = cluster_spread_seconds
+        self.failed_rate = failed_rate
+        self.signatures = defaultdict(list)  # wallet -> [sig] newest first
+        self.transactions = {}               # sig -> getTransaction result (jsonParsed)
+        self._scheduled = []                 # [(due_ts, wallet, mint, side)]
+        self._last_step = time.time()
+        self._next_hot = self._last_step
+        self.trades_total = 0
+        self.hot_tokens = []
+
+    def _trade(self, wallet: str, mint: str, side: str, ts: float) -> None:
+        meta = self.token_meta[mint]
+        sol = round(self.rng.uniform(0.2, 5.0), 3)
+        tokens = sol * 150.0 / max(meta["price"], 1e-9)
+        held_before = 0.0 if side == "buy" else tokens
+        held_after = tokens if side == "buy" else 0.0
+        lamports_delta = int(sol * 1e9) * (-1 if side == "buy" else 1)
+        sig = _b58(self.rng, 88)
+        failed = self.rng.random() < self.failed_rate
+        if failed:
+            held_before = held_after = 0.0
+            lamports_delta = 0
+        pool, pool_vault = _b58(self.rng), _b58(self.rng)
+
+        def balance(amount: float) -> dict:
+            return {"accountIndex": 1, "mint": mint, "owner": wallet,
+                    "uiTokenAmount": {"uiAmount": amount, "decimals": 6,
+                                      "amount": str(int(amount * 1e6)), "uiAmountString": str(amount)}}
+
+        keys = [wallet, _b58(self.rng), pool, pool_vault, SYSTEM_PROGRAM, TOKEN_PROGRAM, SWAP_PROGRAM]
+
+        def transfer(src: int, dst: int, amount: int) -> dict:
+            return {"program": "spl-token", "programId": TOKEN_PROGRAM, "stackHeight": 2,
+                    "parsed": {"type": "transfer", "info": {"source": keys[src], "destination": keys[dst],
+                                                            "authority": wallet, "amount": str(amount)}}}
+
+        self.transactions[sig] = {
+            "slot": int(ts * 2.5),
+            "blockTime": int(ts),
+            "version": 0,
+            "meta": {
+                "err": {"InstructionError": [2, {"Custom": 6001}]} if failed else None,
+                "fee": 5000,
+                "computeUnitsConsumed": self.rng.randint(60_000, 240_000),
+                "preBalances": [10_000_000_000, 2_039_280, 2_039_280, 50_000_000_000, 1, 1, 1],
+                "postBalances": [10_000_000_000 + lamports_delta, 2_039_280, 2_039_280, 50_000_000_000 - lamports_delta, 1, 1, 1],
+                "preTokenBalances": [balance(held_before)] if held_before else [],
+                "postTokenBalances": [balance(held_after)] if held_after else [],
+                "innerInstructions": [] if failed else [{"index": 2, "instructions": [
+                    transfer(1, 3, int(sol * 1e9)), transfer(2, 1, int(tokens * 1e6))]}],
+                "logMessages": [f"Program {SWAP_PROGRAM} invoke [1]", "Program log: Instruction: Route",
+                                f"Program {TOKEN_PROGRAM} invoke [2]", f"Program {TOKEN_PROGRAM} success",
+                                f"Program {SWAP_PROGRAM} consumed 120000 of 1400000 compute units",
+                                f"Program {SWAP_PROGRAM} {'failed' if failed else 'success'}"],
+                "loadedAddresses": {"writable": [], "readonly": []},
+                "rewards": [],
+                "status": {"Err": {}} if failed else {"Ok": None},
+            },
+            "transaction": {
+                "signatures": [sig],
+                "message": {
+                    "accountKeys": [{"pubkey": k, "signer": i == 0, "writable": i < 4, "source": "transaction"}
+                                    for i, k in enumerate(keys)],
+                    "recentBlockhash": _b58(self.rng),
+                    "instructions": [
+                        {"programId": "ComputeBudget111111111111111111111111111111", "accounts": [], "data": "3ZmS6ZkUfXsm",
+                         "stackHeight": None},
+                        {"program": "system", "programId": SYSTEM_PROGRAM, "stackHeight": None,
+                         "parsed": {"type": "transfer", "info": {"source": wallet, "destination": keys[1],
+                                                                 "lamports": abs(lamports_delta)}}},
+                        {"programId": SWAP_PROGRAM, "accounts": keys[:4], "data": _b58(self.rng, 60), "stackHeight": None},
+                    ],
+                    "addressTableLookups": [],
+                },
+            },
+        }
+        self.signatures[wallet].insert(0, sig)
+        del self.signatures[wallet][1000:]
+        self.trades_total += 1
+
+    def step(self, now: float | None = None) -> None:
+        now = now or time.time()
+        dt = max(0.0, now - self._last_step)
+        self._last_step = now
+        # background noise: Poisson-ish trades on random mints
+        expected = dt * self.trade_rate * len(self.wallets)
+        n = int(expected) + (1 if self.rng.random() < expected - int(expected) else 0)
+        for _ in range(n):
+            self._trade(self.rng.choice(self.wallets), self.rng.choice(self.tokens),
+                        "buy" if self.rng.random() < 0.6 else "sell", now)
+        # hot token: a cluster of wallets buys the same mint within cluster_spread seconds
+        while self.hot_every > 0 and now >= self._next_hot:
+            mint = self.rng.choice(self.tokens)
+            self.hot_tokens.append(mint)
+            for wallet in self.rng.sample(self.wallets, min(self.cluster_size, len(self.wallets))):
+                self._scheduled.append((self._next_hot + self.rng.uniform(0, self.cluster_spread), wallet, mint, "buy"))
+            self._next_hot += self.hot_every
+        due = [s for s in self._scheduled if s[0] <= now]
+        if due:
+            self._scheduled = [s for s in self._scheduled if s[0] > now]
+            for ts, wallet, mint, side in sorted(due):
+                self._trade(wallet, mint, side, ts)
+
+    async def run(self, tick: float = 0.25) -> None:
+        while True:
+            self.step()
+            await asyncio.sleep(tick)
+
+    # --- service views ---
+    def encoded_transaction(self, sig: str, encoding: str = "json") -> dict | None:
+        """getTransaction result in the requested encoding (stored form is jsonParsed)."""
+        tx = self.transactions.get(sig)
+        if tx is None or encoding == "jsonParsed":
+            return tx
+        message = tx["transaction"]["message"]
+        keys = [k["pubkey"] for k in message["accountKeys"]]
+        index = {k: i for i, k in enumerate(keys)}
+
+        def compiled(ins: dict) -> dict:
+            accounts = ins.get("accounts") or list((ins.get("parsed") or {}).get("info", {}).values())[:3]
+            return {"programIdIndex": index[ins["programId"]] if ins["programId"] in index else 0,
+                    "accounts": [index.get(a, 0) for a in accounts], "data": ins.get("data", "3Bxs4h24hBtQy9rw"),
+                    "stackHeight": ins.get("stackHeight")}
+
+        meta = dict(tx["meta"])
+        meta["innerInstructions"] = [{"index": g["index"], "instructions": [compiled(i) for i in g["instructions"]]}
+                                     for g in meta["innerInstructions"]]
+        return {**tx, "meta": meta, "transaction": {
+            "signatures": tx["transaction"]["signatures"],
+            "message": {
+                "header": {"numRequiredSignatures": 1, "numReadonlySignedAccounts": 0, "numReadonlyUnsignedAccounts": 3},
+                "accountKeys": keys,
+                "recentBlockhash": message["recentBlockhash"],
+                "instructions": [compiled(i) for i in message["instructions"]],
+                "addressTableLookups": [],
+            },
+        }}
+
+    def pair(self, mint: str) -> dict | None:
+        if mint == SOL_MINT:
+            return {"pairAddress": _b58(self.rng), "baseToken": {"address": SOL_MINT, "symbol": "SOL"},
+                    "priceUsd": "150.0", "liquidity": {"usd": 1e8}, "fdv": 7e10, "marketCap": 7e10}
+        meta = self.token_meta.get(mint)
+        if meta is None:
+            return None
+        mc = meta["price"] * meta["supply"]
+        return {"pairAddress": f"pair{mint[:40]}", "baseToken": {"address": mint, "symbol": meta["symbol"]},
+                "priceUsd": f"{meta['price']:.10f}", "liquidity": {"usd": mc / 10}, "fdv": mc, "marketCap": mc}
+
+
+class MockServices:
+    """HTTP server routing to the mocks; latency/jitter/429 rate apply to every request."""
+
+    def __init__(self, market: SyntheticMarket, latency_ms: float = 50.0, jitter_ms: float = 20.0,
+                 rate_429: float = 0.0, seed: int = 1):
+        self.market = market
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.rate_429 = rate_429
+        self.rng = random.Random(seed + 1)
+        self.requests = defaultdict(int)   # "rpc:getTransaction" / "dex" / "tg:sendMessage" -> count
+        self.throttled = defaultdict(int)
+        self.telegram_messages = []        # (received_at, method, chat_id, text)
+        self._message_id = 0
+        self._server = None
+        self.port = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, port: int = 0) -> "MockServices":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- HTTP plumbing ---
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line or line in (b"\r\n", b"\n"):
+                        break
+                    k, _, v = line.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                body = b""
+                if int(headers.get("content-length", "0") or 0):
+                    body = await reader.readexactly(int(headers["content-length"]))
+                method, target = request_line.decode("latin-1").split()[:2]
+                status, payload, extra = await self._route(method, target, headers, body)
+                data = json.dumps(payload).encode()
+                head = f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                for k, v in (extra or {}).items():
+                    head += f"{k}: {v}\r\n"
+                writer.write(head.encode() + b"\r\n" + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _delay(self) -> None:
+        d = self.latency + (self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if d > 0:
+            await asyncio.sleep(d)
+
+    async def _route(self, method: str, target: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+        path = url.path
+        await self._delay()
+        if path.startswith("/tg/"):
+            return self._telegram(path, headers, body)
+        service = "rpc" if path.startswith("/rpc") else path.strip("/").split("/", 1)[0]
+        if self.rate_429 and self.rng.random() < self.rate_429:
+            self.throttled[service] += 1
+            return "429 Too Many Requests", {"error": "rate limited"}, {"Retry-After": "1"}
+        if path.startswith("/rpc"):
+            return "200 OK", self._rpc(json.loads(body or b"{}")), None
+        if path.startswith("/dex/"):
+            self.requests["dex"] += 1
+            mint = path.rstrip("/").rsplit("/", 1)[-1]
+            pair = self.market.pair(mint)
+            return "200 OK", {"schemaVersion": "1.0.0", "pairs": [pair] if pair else None}, None
+        if path.startswith("/birdeye/"):
+            self.requests["birdeye"] += 1
+            mint = (parse_qs(url.query).get("address") or [""])[0]
+            pair = self.market.pair(mint)
+            return "200 OK", {"success": True, "data": {"value": float(pair["priceUsd"]) if pair else 0}}, None
+        if path.startswith("/jup/"):
+            self.requests["jupiter"] += 1
+            mint = (parse_qs(url.query).get("ids") or [""])[0]
+            pair = self.market.pair(mint)
+            return "200 OK", {"data": {mint: {"id": mint, "price": float(pair["priceUsd"])}} if pair else {}}, None
+        return "404 Not Found", {"error": "not found"}, None
+
+    def _rpc(self, request):
+        if isinstance(request, list):
+            return [self._rpc_one(r) for r in request]
+        return self._rpc_one(request)
+
+    def _rpc_one(self, request: dict) -> dict:
+        method = request.get("method")
+        params = request.get("params") or []
+        self.requests[f"rpc:{method}"] += 1
+        result = None
+        if method in ("getSignaturesForAddress", "getConfirmedSignaturesForAddress2"):
+            opts = params[1] if len(params) > 1 else {}
+            sigs = self.market.signatures.get(params[0], [])
+            until = opts.get("until")
+            if until in sigs:
+                sigs = sigs[:sigs.index(until)]
+            result = []
+            for sig in sigs[: int(opts.get("limit", 1000))]:
+                tx = self.market.transactions[sig]
+                result.append({"signature": sig, "slot": tx["slot"], "blockTime": tx["blockTime"],
+                               "err": tx["meta"]["err"], "confirmationStatus": "confirmed", "memo": None})
+        elif method == "getTransaction":
+            opts = params[1] if len(params) > 1 else {}
+            result = self.market.encoded_transaction(params[0], opts.get("encoding", "json"))
+        elif method == "getTokenSupply":
+            meta = self.market.token_meta.get(params[0])
+            if meta:
+                result = {"context": {"slot": 0}, "value": {"amount": str(int(meta["supply"] * 1e6)), "decimals": 6,
+                                                             "uiAmount": meta["supply"]}}
+        else:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": -32601, "message": "Method not found"}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+    def _telegram(self, path: str, headers: dict, body: bytes):
+        api_method = path.rstrip("/").rsplit("/", 1)[-1]
+        self.requests[f"tg:{api_method}"] += 1
+        params = {}
+        if body:
+            ctype = headers.get("content-type", "")
+            if "json" in ctype:
+                params = json.loads(body)
+            else:
+                params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        if api_method == "getMe":
+            return "200 OK", {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}}, None
+        if api_method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            self.telegram_messages.append((time.time(), api_method, chat_id, params.get("text", "")))
+            if api_method == "sendMessage":
+                self._message_id += 1
+            message_id = int(params.get("message_id", self._message_id))
+            return "200 OK", {"ok": True, "result": {
+                "message_id": message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}}, None
+        return "200 OK", {"ok": True, "result": True}, None
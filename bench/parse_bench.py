@@ -0,0 +1,79 @@
+# bench/parse_bench.py
+"""Parser throughput over a raw transaction archive (TX_ARCHIVE_DIR).
+
+    python bench/parse_bench.py ./tx_archive [--repeat 3]
+
+Streams every archived getTransaction payload once to measure decompression, then
+runs wallet_token_changes() for each signer --repeat times and reports tx/sec.
+Finally re-encodes each payload as a getTransaction response body and times
+decode + parse_transaction() per available JSON backend (see helpers/jsoncodec.py).
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers import jsoncodec  # noqa: E402
+from helpers.multibuy_logic import parse_transaction, wallet_token_changes  # noqa: E402
+from helpers.replay import tx_signers  # noqa: E402
+from helpers.tx_archive import TxArchive  # noqa: E402
+
+
+def _decoders() -> dict:
+    """name -> bytes → getTransaction result, for every backend installed here."""
+    out = {"json": lambda b: json.loads(b)["result"]}
+    if jsoncodec.orjson is not None:
+        out["orjson"] = lambda b: jsoncodec.orjson.loads(b)["result"]
+    if jsoncodec.msgspec is not None:
+        generic = jsoncodec.msgspec.json.Decoder()
+        out["msgspec"] = lambda b: generic.decode(b)["result"]
+        typed = jsoncodec.msgspec.json.Decoder(jsoncodec.TransactionResponse)
+        out["msgspec-typed"] = lambda b: jsoncodec.msgspec.to_builtins(typed.decode(b))["result"]
+    return out
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("archive")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    archive = TxArchive(args.archive)
+    t0 = time.perf_counter()
+    txs = [tx for _, tx in archive.iter_records() if tx]
+    read_s = time.perf_counter() - t0
+    archive.close()
+    if not txs:
+        sys.exit("archive is empty")
+    pairs = [(tx, owner) for tx in txs for owner in tx_signers(tx)]
+
+    t0 = time.perf_counter()
+    changes_total = 0
+    for _ in range(max(1, args.repeat)):
+        for tx, owner in pairs:
+            changes, _ = wallet_token_changes(tx, owner)
+            changes_total += len(changes)
+    parse_s = time.perf_counter() - t0
+    parsed = len(pairs) * max(1, args.repeat)
+
+    print(f"read+decompress  {len(txs)} tx in {read_s:.2f}s ({len(txs) / read_s:.0f} tx/s)")
+    print(f"parse            {parsed} tx×owner in {parse_s:.2f}s ({parsed / parse_s:.0f}/s, {parse_s / parsed * 1e6:.1f}µs each)")
+    print(f"token changes    {changes_total // max(1, args.repeat)} per pass")
+
+    bodies = [json.dumps({"jsonrpc": "2.0", "id": 1, "result": tx}).encode() for tx in txs]
+    mb = sum(len(b) for b in bodies) / 1e6
+    for name, decode in _decoders().items():
+        t0 = time.perf_counter()
+        for _ in range(max(1, args.repeat)):
+            for body in bodies:
+                parse_transaction(decode(body))
+        took = time.perf_counter() - t0
+        n = len(bodies) * max(1, args.repeat)
+        print(f"decode+parse     {name:<14} {took / n * 1e6:7.1f}µs/tx  ({mb * max(1, args.repeat) / took:.0f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# bench/run_bench.py
+"""Offline benchmark of the alert pipeline against local mock services.
+
+    python bench/run_bench.py --wallets 200 --duration 60 --latency-ms 40 --rate-429 0.02
+
+Drives sequential_tracker + the shared alert monitor (check_for_multi_events) and a
+separate get_token_info pass, then reports wallets/sec, RPC calls per alert, alert
+latency percentiles (block time → Telegram delivery) and peak RSS. --json writes the
+report for comparing runs.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from bench.mock_services import MockServices, SyntheticMarket  # noqa: E402
+
+BENCH_CHAT_ID = 424242
+BENCH_TOKEN = "123456:BENCH"
+
+
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--wallets", type=int, default=100)
+    ap.add_argument("--tokens", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=60.0, help="seconds of tracking")
+    ap.add_argument("--latency-ms", type=float, default=40.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--rate-429", type=float, default=0.0, help="probability of a 429 per request")
+    ap.add_argument("--trades-per-min", type=float, default=0.5, help="background trades per wallet per minute")
+    ap.add_argument("--hot-every", type=float, default=15.0, help="seconds between hot tokens")
+    ap.add_argument("--cluster", type=int, default=4, help="wallets buying each hot token")
+    ap.add_argument("--failed-rate", type=float, default=0.05, help="share of trades that fail on-chain")
+    ap.add_argument("--workers", type=int, default=0, help="INGEST_WORKERS (0 = poll in the main loop)")
+    ap.add_argument("--poll-interval", type=int, default=2)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", dest="json_path", help="write the report to this file")
+    return ap.parse_args(argv)
+
+
+def _configure_env(args, base_url: str) -> None:
+    """Module-level config is read at import time, so this must run before importing helpers.*"""
+    os.environ.update({
+        "SOLANA_RPC_ENDPOINT": f"{base_url}/rpc",
+        "DEXSCREENER_API_BASE": f"{base_url}/dex",
+        "BIRDEYE_API_BASE": f"{base_url}/birdeye",
+        "JUPITER_PRICE_API_BASE": f"{base_url}/jup",
+        "POLL_INTERVAL_SECONDS": str(args.poll_interval),
+        "INGEST_WORKERS": str(args.workers),
+        "WINDOW_CHECK_INTERVAL_SECONDS": "1",
+        "RPC_DELAY_SECONDS": os.getenv("RPC_DELAY_SECONDS", "0"),
+        "RPC_JITTER_MAX": os.getenv("RPC_JITTER_MAX", "0"),
+        "WALLET_SPACING_SECONDS": os.getenv("WALLET_SPACING_SECONDS", "0"),
+        "MIN_MARKET_CAP": "0",
+        "METRICS_PORT": "0",
+        "DISCORD_WEBHOOK_URL": "",
+        "TG_CHAT_RATE": os.getenv("TG_CHAT_RATE", "20"),
+    })
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except Exception:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _pct(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round((len(values) - 1) * q)))]
+
+
+async def _bench_token_info(mlogic, mints: list) -> dict:
+    """Cold then warm get_token_info over the same mints."""
+    out = {}
+    mlogic._token_info_cache.clear()
+    for label in ("cold", "warm"):
+        samples = []
+        for mint in mints:
+            t0 = time.perf_counter()
+            await mlogic.get_token_info(mint)
+            samples.append(time.perf_counter() - t0)
+        out[label] = {"calls": len(samples), "p50_ms": _pct(samples, 0.5) * 1000, "p99_ms": _pct(samples, 0.99) * 1000}
+    return out
+
+
+async def run(args) -> dict:
+    market = SyntheticMarket(
+        n_wallets=args.wallets, n_tokens=args.tokens, seed=args.seed,
+        trades_per_wallet_per_min=args.trades_per_min, hot_every_seconds=args.hot_every,
+        cluster_size=args.cluster, failed_rate=args.failed_rate,
+    )
+    services = await MockServices(market, args.latency_ms, args.jitter_ms, args.rate_429, args.seed).start()
+    _configure_env(args, services.base_url)
+
+    from telegram.ext import Application
+    from helpers import multibuy_logic as mlogic, tracing, wallet_registry as wr
+    from helpers.delivery import stop_delivery_queue
+    from helpers.ingest_workers import stop_ingest_pool
+    from helpers.processing import stop_processing_stage
+    from helpers.watchdog import recent_loop_lag, recent_stalls, start_watchdog
+
+    application = Application.builder().token(BENCH_TOKEN).base_url(f"{services.base_url}/tg/bot").updater(None).build()
+    await application.initialize()
+
+    reg = wr.get_registry(application.bot_data)
+    wr.set_kol_wallets(reg, [{"address": a, "name": f"kol{i}"} for i, a in enumerate(market.wallets)])
+    st = wr.get_user_state(application.bot_data, application.user_data[BENCH_CHAT_ID])
+    wr.apply_kol_refresh(reg, st, auto_track=True)
+
+    market_task = asyncio.create_task(market.run())
+    watchdog = start_watchdog(0.05)
+    started = time.perf_counter()
+    await mlogic.start_multibuy_tracker(BENCH_CHAT_ID, application)
+    await asyncio.sleep(args.duration)
+    elapsed = time.perf_counter() - started
+
+    for task in getattr(application, "_runtime_tracking_tasks", {}).get(str(BENCH_CHAT_ID), {}).values():
+        task.cancel()
+    monitor = getattr(application, "_runtime_alert_monitor", None)
+    if monitor:
+        monitor.cancel()
+    market_task.cancel()
+    await stop_ingest_pool(application)
+    await asyncio.sleep(0.5)  # let queued deliveries finish
+    await stop_delivery_queue(application)
+    watchdog.stop()
+    loop_lag = recent_loop_lag()
+
+    from helpers import metrics
+    rpc_bytes = {labels[0]: int(v) for labels, v in metrics.RPC_RESPONSE_BYTES._values.items()}
+    rpc_calls = sum(v for k, v in services.requests.items() if k.startswith("rpc:"))
+    alerts = sum(1 for _, method, _, _ in services.telegram_messages if method == "sendMessage")
+    wallet_scans = services.requests.get("rpc:getSignaturesForAddress", 0)
+    staleness = [t["delivered_at"] - t["block_time"] for t in tracing.recent_traces() if t.get("block_time")]
+
+    token_info = await _bench_token_info(mlogic, market.tokens[:20])
+    await stop_processing_stage()
+    await application.shutdown()
+    await services.stop()
+
+    return {
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 2),
+        "trades_generated": market.trades_total,
+        "wallet_scans": wallet_scans,
+        "wallets_per_sec": round(wallet_scans / elapsed, 2) if elapsed else 0.0,
+        "rpc_calls": rpc_calls,
+        "rpc_by_method": {k[4:]: v for k, v in sorted(services.requests.items()) if k.startswith("rpc:")},
+        "rpc_bytes_by_method": rpc_bytes,
+        "rpc_bytes_per_scan": round(sum(rpc_bytes.values()) / wallet_scans) if wallet_scans else 0,
+        "throttled": dict(services.throttled),
+        "external_calls": {k: v for k, v in services.requests.items() if not k.startswith(("rpc:", "tg:"))},
+        "alerts_sent": alerts,
+        "telegram_edits": services.requests.get("tg:editMessageText", 0),
+        "rpc_calls_per_alert": round(rpc_calls / alerts, 1) if alerts else None,
+        "alert_latency_s": {"n": len(staleness), "p50": round(_pct(staleness, 0.5), 2), "p99": round(_pct(staleness, 0.99), 2)},
+        "stages": tracing.summarize(),
+        "loop_lag_ms": {"p50": round(_pct(loop_lag, 0.5) * 1000, 2), "p99": round(_pct(loop_lag, 0.99) * 1000, 2),
+                        "max": round(max(loop_lag, default=0.0) * 1000, 2)},
+        "loop_stalls": [{"ms": round(s["duration"] * 1000), "at": s["frame"]} for s in recent_stalls()],
+        "token_info": token_info,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def _print_report(report: dict) -> None:
+    print(f"elapsed            {report['elapsed_s']}s, trades generated {report['trades_generated']}")
+    print(f"wallets/sec        {report['wallets_per_sec']}  ({report['wallet_scans']} scans)")
+    print(f"rpc calls          {report['rpc_calls']}  {report['rpc_by_method']}  throttled={report['throttled']}")
+    print(f"rpc bytes          {report['rpc_bytes_per_scan']}/scan  {report['rpc_bytes_by_method']}")
+    print(f"external calls     {report['external_calls']}")
+    print(f"alerts sent        {report['alerts_sent']} (+{report['telegram_edits']} edits)")
+    print(f"rpc calls/alert    {report['rpc_calls_per_alert']}")
+    lat = report["alert_latency_s"]
+    print(f"alert latency      p50={lat['p50']}s p99={lat['p99']}s (n={lat['n']}, block time → delivery)")
+    for label, s in report["stages"].items():
+        print(f"  {label:<16} p50={s['p50']:.2f}s p99={s['p99']:.2f}s")
+    lag = report["loop_lag_ms"]
+    print(f"event loop lag     p50={lag['p50']}ms p99={lag['p99']}ms max={lag['max']}ms")
+    for stall in report["loop_stalls"]:
+        print(f"  stall {stall['ms']}ms at {stall['at']}")
+    for label, s in report["token_info"].items():
+        print(f"get_token_info {label:<4} p50={s['p50_ms']:.1f}ms p99={s['p99_ms']:.1f}ms ({s['calls']} calls)")
+    print(f"peak RSS           {report['peak_rss_mb']} MB")
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    report = asyncio.run(run(args))
+    _print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
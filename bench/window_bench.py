@@ -0,0 +1,73 @@
+# bench/window_bench.py
+"""Window-count sweep over a large event store: per-token bisect vs NumPy columns.
+
+    python bench/window_bench.py [--events 100000] [--tokens 5000] [--wallets 500] [--repeat 5]
+
+Fills the shared event store through store_event() with synthetic events spread over
+the lookback, then counts unique wallets for every token/side/window both ways
+(multibuy_logic.window_count and helpers/event_columns.py) and checks they agree.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers import event_columns  # noqa: E402
+from helpers import multibuy_logic as mlogic  # noqa: E402
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--events", type=int, default=100_000)
+    ap.add_argument("--tokens", type=int, default=5000)
+    ap.add_argument("--wallets", type=int, default=500)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+    if not event_columns.available():
+        sys.exit("numpy is not installed")
+
+    rnd = random.Random(args.seed)
+    now_ts = time.time()
+    lookback = mlogic.MAX_LOOKBACK_MINUTES * 60
+    columns = event_columns.EventColumns()
+    mlogic._columns = columns
+    stored = 0
+    for i in range(args.events):
+        ts = now_ts - lookback + lookback * i / args.events
+        token = f"T{rnd.randrange(args.tokens):06d}"
+        side = 'buys' if rnd.random() < 0.7 else 'sells'
+        wallet = f"W{rnd.randrange(args.wallets):05d}"
+        stored += mlogic.store_event(token, side, wallet, wallet, rnd.uniform(0.1, 5), datetime.fromtimestamp(ts, tz=timezone.utc),
+                                     cap=rnd.uniform(1e4, 1e7))
+    windows = mlogic.MULTI_WINDOWS_SECONDS
+    tokens = list(mlogic.recent_events)
+    print(f"{stored} events stored ({args.events} generated), {len(tokens)} tokens, windows={windows}")
+
+    def python_sweep() -> dict:
+        return {(t, s, w): mlogic.window_count(t, s, w, now_ts) for t in tokens for s in ('buys', 'sells') for w in windows}
+
+    def numpy_sweep() -> dict:
+        counts = columns.window_counts(now_ts, windows)
+        return {(t, s, w): counts.get(t, s, w) for t in tokens for s in ('buys', 'sells') for w in windows}
+
+    def timed(fn) -> float:
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
+
+    assert python_sweep() == numpy_sweep(), "window counts differ"
+    print(f"per-token bisect, all lookups : {timed(python_sweep):8.2f} ms")
+    print(f"numpy sweep, all lookups      : {timed(numpy_sweep):8.2f} ms")
+    print(f"numpy sweep only              : {timed(lambda: columns.window_counts(now_ts, windows)):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
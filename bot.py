@@ -4,7 +4,7 @@ import os
 import sys
 import psutil
 import asyncio
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, PicklePersistence
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
 from dotenv import load_dotenv
 import time
 
@@ -23,7 +23,15 @@ from helpers.menu_handlers import (
     select_all_wallets,
     deselect_all_wallets,
     auto_refresh_kols_for_all_users,
+    latency_command,
 )
+from helpers.sqlite_persistence import SqlitePersistence
+from helpers.delivery import stop_delivery_queue
+from helpers.ingest_workers import stop_ingest_pool
+from helpers.discord_sink import stop_discord_sink
+from helpers.metrics import start_metrics_server
+from helpers.processing import stop_processing_stage
+from helpers.watchdog import start_watchdog
 
 # Enable logging (configurable)
 LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
@@ -63,6 +71,8 @@ async def main() -> None:
             os.remove(lock_file)
 
     application = None
+    metrics_server = None
+    watchdog = None
     try:
         with open(lock_file, 'w') as f:
             f.write(str(os.getpid()))
@@ -72,13 +82,18 @@ async def main() -> None:
             logging.error("TELEGRAM_BOT_TOKEN not found in .env file!")
             return
             
-        # Use the library's built-in persistence
-        persistence = PicklePersistence(filepath="bot_data.pickle")
+        # Incremental SQLite persistence: only changed users are written, off the event loop.
+        # An existing bot_data.pickle is imported once on first start.
+        persistence = SqlitePersistence(
+            filepath=os.getenv("PERSISTENCE_DB_PATH", "bot_data.sqlite3"),
+            update_interval=float(os.getenv("PERSISTENCE_UPDATE_INTERVAL_SECONDS", "60")),
+        )
         
         application = Application.builder().token(token).persistence(persistence).build()
 
         # Main menu and wallet management handlers
         application.add_handler(CommandHandler("start", start))
+        application.add_handler(CommandHandler("latency", latency_command))
         application.add_handler(CallbackQueryHandler(toggle_wallet, pattern=r'^toggle_wallet:'))
         application.add_handler(CallbackQueryHandler(remove_wallet, pattern=r'^remove_wallet:'))
         application.add_handler(CallbackQueryHandler(select_all_wallets, pattern=r'^select_all:'))
@@ -93,6 +108,10 @@ async def main() -> None:
         await application.bot.delete_webhook(drop_pending_updates=True)
         await application.start()
         await application.updater.start_polling()
+        # Prometheus-style /metrics on METRICS_HOST:METRICS_PORT (METRICS_PORT=0 disables)
+        metrics_server = await start_metrics_server()
+        # Loop lag + stack of anything that blocks the loop longer than WATCHDOG_STALL_MS
+        watchdog = start_watchdog()
 
         # Schedule auto-refresh job with respect to last refresh time
         try:
@@ -115,7 +134,7 @@ async def main() -> None:
             )
             logging.info(f"Scheduled kol_auto_refresh job every {interval_seconds} seconds (first run in {first_delay}s)")
             # Schedule cache cleanup daily
-            from helpers.multibuy_logic import cache_cleanup_job
+            from helpers.cache_cleanup import cache_cleanup_job
             application.job_queue.run_repeating(
                 cache_cleanup_job,
                 interval=24*60*60,
@@ -134,6 +153,14 @@ async def main() -> None:
         logging.info("Bot stopping...")
     finally:
         if application:
+            await stop_ingest_pool(application)
+            await stop_delivery_queue(application)
+            await stop_discord_sink()
+            await stop_processing_stage()
+            if watchdog is not None:
+                watchdog.stop()
+            if metrics_server is not None:
+                metrics_server.close()
             await application.updater.stop()
             await application.stop()
             await application.shutdown()
@@ -0,0 +1,208 @@
+# helpers/cache_cleanup.py
+"""Background cleanup of browser caches (Playwright/pyppeteer downloads).
+
+The sweep runs on its own low-priority thread and works in slices: after
+CACHE_CLEANUP_SLICE_MS of filesystem work it sleeps CACHE_CLEANUP_PAUSE_MS, so a
+large cache never holds the GIL or the disk for long. Per target it
+  1. deletes files not used (max of atime/mtime) for CACHE_CLEANUP_MAX_AGE_DAYS,
+  2. evicts whole installs (top-level entries such as ms-playwright/firefox-1425),
+     least recently used first, until the target fits CACHE_CLEANUP_MAX_MB,
+  3. removes directories left empty.
+The browser install in use is never touched: kolscan registers
+p.chromium.executable_path via protect_path(), and if nothing is registered yet the
+job asks Playwright for it before sweeping. Every chromium* entry of the same
+revision is protected with it, since headless launches run chromium_headless_shell-<rev>.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_CLEANUP_ENABLED = os.getenv("CACHE_CLEANUP_ENABLED", "1") == "1"
+CACHE_CLEANUP_TARGETS = [p.strip() for p in os.getenv(
+    "CACHE_CLEANUP_TARGETS",
+    "~/.cache/ms-playwright,~/.local/share/pyppeteer"
+).split(',') if p.strip()]
+CACHE_CLEANUP_MAX_AGE_DAYS = int(os.getenv("CACHE_CLEANUP_MAX_AGE_DAYS", "7"))
+CACHE_CLEANUP_MAX_MB = int(os.getenv("CACHE_CLEANUP_MAX_MB", "2048"))  # per target, 0 → no quota
+CACHE_CLEANUP_SLICE_MS = float(os.getenv("CACHE_CLEANUP_SLICE_MS", "20"))
+CACHE_CLEANUP_PAUSE_MS = float(os.getenv("CACHE_CLEANUP_PAUSE_MS", "20"))
+
+_protected: set = set()   # absolute paths of browser executables in use
+_running = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+
+
+def protect_path(path: str | None) -> None:
+    """Never delete the install that contains this file (e.g. the running browser binary)."""
+    if path:
+        _protected.add(os.path.realpath(path))
+
+
+def _protected_roots(base: str) -> set:
+    """Top-level entries of base that hold a protected file (e.g. ms-playwright/chromium-1091),
+    plus the other chromium* installs of that revision (chromium_headless_shell-1091)."""
+    names = set()
+    for path in _protected:
+        rel = os.path.relpath(path, base)
+        if rel != os.curdir and not rel.startswith(os.pardir):
+            names.add(rel.split(os.sep, 1)[0])
+    revisions = {n.rsplit('-', 1)[1] for n in names if n.startswith('chromium') and '-' in n}
+    if revisions:
+        try:
+            siblings = os.listdir(base)
+        except OSError:
+            siblings = []
+        names.update(n for n in siblings if n.startswith('chromium') and '-' in n and n.rsplit('-', 1)[1] in revisions)
+    return {os.path.join(base, n) for n in names}
+
+
+class _Budget:
+    """Cooperative time slicing for the sweep thread."""
+
+    def __init__(self, slice_ms: float, pause_ms: float):
+        self.slice = max(0.001, slice_ms / 1000.0)
+        self.pause = max(0.0, pause_ms / 1000.0)
+        self.started = time.perf_counter()
+        self.slices = 1
+
+    def tick(self) -> None:
+        if time.perf_counter() - self.started >= self.slice:
+            time.sleep(self.pause)
+            self.slices += 1
+            self.started = time.perf_counter()
+
+
+def _remove_file(path: str, stats: dict, size: int) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        return
+    stats['removed_files'] += 1
+    stats['removed_bytes'] += size
+
+
+def sweep_target(base: str, now_ts: float, max_age: float, quota_bytes: int, budget: _Budget, stats: dict) -> None:
+    """Age + quota sweep of one cache directory (blocking; run on the cleanup thread)."""
+    base = os.path.realpath(os.path.expanduser(os.path.expandvars(base)))
+    if not os.path.isdir(base):
+        return
+    skip = _protected_roots(base)
+    installs = {}  # top-level entry -> [last used, bytes, [(size, path)]] of files that survive the age pass
+    dirs = []
+    stack = [base]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            budget.tick()
+            path = entry.path
+            if path in skip:
+                stats['protected'] += 1
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(path)
+                    stack.append(path)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            stats['scanned_files'] += 1
+            last_used = max(st.st_atime, st.st_mtime)
+            if now_ts - last_used > max_age:
+                _remove_file(path, stats, st.st_size)
+            else:
+                root = os.path.join(base, os.path.relpath(path, base).split(os.sep, 1)[0])
+                install = installs.setdefault(root, [0.0, 0, []])
+                install[0] = max(install[0], last_used)
+                install[1] += st.st_size
+                install[2].append((st.st_size, path))
+    kept = sum(install[1] for install in installs.values())
+    if quota_bytes > 0 and kept > quota_bytes:
+        # LRU by install: a browser with half its files gone is worse than no browser
+        for _, install_bytes, files in sorted(installs.values(), key=lambda i: i[0]):
+            if kept <= quota_bytes:
+                break
+            for size, path in files:
+                budget.tick()
+                _remove_file(path, stats, size)
+            kept -= install_bytes
+    stats['kept_bytes'] += kept
+    # deepest first so parents empty out as we go; rmdir fails harmlessly on non-empty dirs
+    for path in sorted(dirs, key=lambda d: d.count(os.sep), reverse=True):
+        budget.tick()
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+
+def sweep(targets: list = CACHE_CLEANUP_TARGETS, max_age_days: float = CACHE_CLEANUP_MAX_AGE_DAYS,
+          max_mb: float = CACHE_CLEANUP_MAX_MB, slice_ms: float = CACHE_CLEANUP_SLICE_MS,
+          pause_ms: float = CACHE_CLEANUP_PAUSE_MS) -> dict:
+    """Sweep every target; returns counters. Only one sweep runs at a time."""
+    stats = {'scanned_files': 0, 'removed_files': 0, 'removed_bytes': 0, 'kept_bytes': 0, 'protected': 0,
+             'slices': 0, 'seconds': 0.0, 'skipped': False}
+    if not _running.acquire(blocking=False):
+        stats['skipped'] = True
+        return stats
+    started = time.perf_counter()
+    budget = _Budget(slice_ms, pause_ms)
+    try:
+        for target in targets:
+            try:
+                sweep_target(target, time.time(), max_age_days * 86400, int(max_mb * 1024 * 1024), budget, stats)
+            except Exception as e:
+                logger.warning(f"Cache cleanup of {target} failed: {e}")
+    finally:
+        _running.release()
+    stats['slices'] = budget.slices
+    stats['seconds'] = time.perf_counter() - started
+    metrics.CACHE_CLEANUP_REMOVED_BYTES.inc(stats['removed_bytes'])
+    metrics.CACHE_CLEANUP_KEPT_BYTES.set(stats['kept_bytes'])
+    return stats
+
+
+def _lower_priority() -> None:
+    try:
+        # Linux applies nice per thread
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except Exception:
+        pass
+
+
+async def _resolve_active_browser() -> None:
+    try:
+        from playwright.async_api import async_playwright
+        async with async_playwright() as p:
+            protect_path(p.chromium.executable_path)
+    except Exception as e:
+        logger.debug(f"Could not resolve the Playwright browser path: {e}")
+
+
+async def cache_cleanup_job(context) -> None:
+    """Periodically remove old cached browser data to avoid disk fill (job_queue callback)."""
+    global _executor
+    if not CACHE_CLEANUP_ENABLED:
+        return
+    if not _protected:
+        await _resolve_active_browser()
+    if _executor is None:
+        _executor = ThreadPoolExecutor(1, thread_name_prefix="cache-cleanup", initializer=_lower_priority)
+    stats = await asyncio.get_running_loop().run_in_executor(_executor, sweep)
+    if stats['skipped']:
+        logger.info("Cache cleanup still running from the previous run, skipped")
+    elif stats['removed_bytes'] > 0:
+        logger.info(f"Cache cleanup removed ~{int(stats['removed_bytes']/1024/1024)} MB in {stats['removed_files']} files "
+                    f"({stats['scanned_files']} scanned, {stats['slices']} slices, {stats['seconds']:.1f}s)")
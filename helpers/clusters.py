@@ -0,0 +1,98 @@
+# helpers/clusters.py
+"""Streaming co-buy index: which tracked wallets keep entering the same tokens.
+
+Every buy stored by multibuy_logic.store_event() is paired with the other wallets
+that bought the same token within CLUSTER_PAIR_WINDOW_SECONDS. Each (wallet, wallet)
+pair carries an exponentially decayed weight (half-life CLUSTER_HALF_LIFE_HOURS)
+that grows by 1 per shared token, so affinity ≈ "tokens co-entered recently". Each
+wallet buys a token once in the store, so a pair is counted once per token.
+
+Memory is bounded: past CLUSTER_MAX_PAIRS pairs the weakest (after decay) are
+dropped, down to 3/4 of the limit.
+
+observe() checks a new buy against the existing affinities *before* adding the
+token's own pairs, so a hit means the group is known from earlier tokens. The
+detector turns hits into a 'cluster' alert as soon as CLUSTER_MIN_WALLETS members
+of one cluster are in — usually before the wallet-count threshold, with no extra RPC.
+"""
+import logging
+import os
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_ALERTS = os.getenv("CLUSTER_ALERTS", "1") == "1"
+CLUSTER_HALF_LIFE_HOURS = float(os.getenv("CLUSTER_HALF_LIFE_HOURS", "48"))
+CLUSTER_PAIR_WINDOW_SECONDS = int(os.getenv("CLUSTER_PAIR_WINDOW_SECONDS", "3600"))
+CLUSTER_MIN_AFFINITY = float(os.getenv("CLUSTER_MIN_AFFINITY", "2.0"))  # ≈ co-entered tokens
+CLUSTER_MIN_WALLETS = int(os.getenv("CLUSTER_MIN_WALLETS", "2"))
+CLUSTER_MAX_PAIRS = int(os.getenv("CLUSTER_MAX_PAIRS", "200000"))
+CLUSTER_MAX_PARTNERS = int(os.getenv("CLUSTER_MAX_PARTNERS", "64"))  # most recent co-buyers paired per event
+
+
+class CoBuyIndex:
+    def __init__(self, half_life_hours: float = CLUSTER_HALF_LIFE_HOURS, max_pairs: int = CLUSTER_MAX_PAIRS):
+        self.half_life = max(1.0, half_life_hours * 3600)
+        self.max_pairs = max(16, max_pairs)
+        self._pairs: dict = {}  # (wallet_a, wallet_b) sorted -> [weight, ts of last update]
+        metrics.CLUSTER_PAIRS.set_function(lambda: len(self._pairs))
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    @staticmethod
+    def _key(a: str, b: str) -> tuple:
+        return (a, b) if a < b else (b, a)
+
+    def _decayed(self, entry: list, ts: float) -> float:
+        weight, last = entry
+        return weight * 0.5 ** (max(0.0, ts - last) / self.half_life)
+
+    def affinity(self, a: str, b: str, ts: float) -> float:
+        entry = self._pairs.get(self._key(a, b))
+        return self._decayed(entry, ts) if entry else 0.0
+
+    def observe(self, wallet: str, partners: list, ts: float, min_affinity: float = CLUSTER_MIN_AFFINITY) -> list:
+        """Record that wallet bought alongside partners at ts.
+
+        Returns the partners whose affinity with wallet was already >= min_affinity.
+        """
+        hits = []
+        for partner in partners[-CLUSTER_MAX_PARTNERS:]:
+            if partner == wallet:
+                continue
+            key = self._key(wallet, partner)
+            entry = self._pairs.get(key)
+            if entry is None:
+                self._pairs[key] = [1.0, ts]
+                continue
+            weight = self._decayed(entry, ts)
+            if weight >= min_affinity:
+                hits.append(partner)
+            entry[0] = weight + 1.0
+            entry[1] = max(entry[1], ts)
+        if len(self._pairs) > self.max_pairs:
+            self._prune(ts)
+        return hits
+
+    def _prune(self, ts: float) -> None:
+        keep = self.max_pairs * 3 // 4
+        ranked = sorted(self._pairs.items(), key=lambda kv: self._decayed(kv[1], ts), reverse=True)
+        self._pairs = dict(ranked[:keep])
+        logger.debug(f"co-buy index pruned to {keep} pairs")
+
+    def top_pairs(self, ts: float, limit: int = 20) -> list:
+        """[(wallet_a, wallet_b, affinity)] strongest first — for inspection."""
+        ranked = sorted(((a, b, self._decayed(e, ts)) for (a, b), e in self._pairs.items()), key=lambda r: r[2], reverse=True)
+        return ranked[:limit]
+
+
+_index: CoBuyIndex | None = None
+
+
+def get_index() -> CoBuyIndex:
+    global _index
+    if _index is None:
+        _index = CoBuyIndex()
+    return _index
@@ -0,0 +1,288 @@
+# helpers/delivery.py
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+from collections import deque
+from time import monotonic
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+# Telegram limits: ~30 msg/s per bot overall, ~1 msg/s per chat
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_SEND_MAX_RETRIES = int(os.getenv("TG_SEND_MAX_RETRIES", "5"))
+TG_SEND_CONCURRENCY = int(os.getenv("TG_SEND_CONCURRENCY", "8"))
+TG_QUEUE_WARN_DEPTH = int(os.getenv("TG_QUEUE_WARN_DEPTH", "200"))
+# how often drained chats are forgotten (their bucket is full again, nothing is queued)
+TG_IDLE_PRUNE_SECONDS = float(os.getenv("TG_IDLE_PRUNE_SECONDS", "300"))
+
+
+class TokenBucket:
+    """Classic token bucket; delay() says how long until a token is available, take() consumes one."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = max(0.001, float(rate))
+        self.capacity = max(1.0, float(capacity if capacity is not None else rate))
+        self.tokens = self.capacity
+        self.last = monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.last:
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1.0
+
+
+class _Job:
+    __slots__ = ("chat_id", "kwargs", "future", "attempts", "edit_of")
+
+    def __init__(self, chat_id, kwargs: dict, future: asyncio.Future, edit_of: int | None = None):
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+        # message_id for edit_message_text jobs, None for send_message
+        self.edit_of = edit_of
+
+
+class DeliveryQueue:
+    """Outbound Telegram queue with a global and per-chat token bucket.
+
+    submit() never blocks the caller: jobs are queued per chat and a single
+    dispatcher hands them to the Bot API as fast as the limits allow. RetryAfter
+    pauses only the affected chat; transient network errors are retried with
+    backoff on the scheduler instead of inline.
+    """
+
+    def __init__(self, bot, global_rate: float = TG_GLOBAL_RATE, chat_rate: float = TG_CHAT_RATE,
+                 max_retries: int = TG_SEND_MAX_RETRIES, concurrency: int = TG_SEND_CONCURRENCY):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.max_retries = max(0, max_retries)
+        self._global = TokenBucket(global_rate)
+        self._chat_buckets: dict = {}
+        self._chat_jobs: dict = {}
+        self._blocked_until: dict = {}
+        self._in_flight_chats: set = set()
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._task: asyncio.Task | None = None
+        self._send_tasks: set = set()
+        self._pending_edits: dict = {}
+        self._depth = 0
+        self._next_prune = monotonic() + TG_IDLE_PRUNE_SECONDS
+        self.sent_total = 0
+        self.failed_total = 0
+        self.retried_total = 0
+
+    # --- public API ---
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch_loop(), name="tg_delivery_queue")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for t in list(self._send_tasks):
+            t.cancel()
+        await asyncio.gather(*self._send_tasks, return_exceptions=True)
+
+    def depth(self) -> int:
+        return self._depth
+
+    def submit(self, chat_id, text: str, **kwargs) -> asyncio.Future:
+        """Queue a send_message call; the returned future resolves to the Message (or None on failure)."""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_Job(chat_id, {"text": text, **kwargs}, future))
+        return future
+
+    def submit_edit(self, chat_id, message_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Queue an edit_message_text call. An edit still waiting in the queue for the same
+        message is replaced, so a burst of updates costs a single API call."""
+        pending = self._pending_edits.get((chat_id, message_id))
+        if pending is not None and not pending.future.done():
+            pending.kwargs = {"text": text, **kwargs}
+            return pending.future
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(chat_id, {"text": text, **kwargs}, future, edit_of=message_id)
+        self._pending_edits[(chat_id, message_id)] = job
+        self._enqueue(job)
+        return future
+
+    def _enqueue(self, job: _Job) -> None:
+        if monotonic() >= self._next_prune:
+            self._prune_idle_chats()
+        self._chat_jobs.setdefault(job.chat_id, deque()).append(job)
+        self._depth += 1
+        if self._depth and self._depth % TG_QUEUE_WARN_DEPTH == 0:
+            logger.warning(f"Telegram delivery queue depth={self._depth}")
+        self._schedule_chat(job.chat_id)
+
+    def _prune_idle_chats(self) -> None:
+        """Drop per-chat state a fresh chat would get anyway: full bucket, no jobs, no block."""
+        now = monotonic()
+        self._next_prune = now + TG_IDLE_PRUNE_SECONDS
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if (chat_id in self._in_flight_chats or self._chat_jobs.get(chat_id)
+                    or self._blocked_until.get(chat_id, 0.0) > now or not bucket.is_full(now)):
+                continue
+            del self._chat_buckets[chat_id]
+            self._chat_jobs.pop(chat_id, None)
+            self._blocked_until.pop(chat_id, None)
+
+    # --- scheduling ---
+    def _chat_ready_at(self, chat_id, now: float) -> float:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return max(now + bucket.delay(now), self._blocked_until.get(chat_id, 0.0))
+
+    def _schedule_chat(self, chat_id) -> None:
+        if chat_id in self._in_flight_chats or not self._chat_jobs.get(chat_id):
+            return
+        heapq.heappush(self._heap, (self._chat_ready_at(chat_id, monotonic()), next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _sleep_or_wakeup(self, timeout: float | None) -> None:
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            if not self._heap:
+                await self._sleep_or_wakeup(None)
+                continue
+            now = monotonic()
+            ready_at, _, chat_id = self._heap[0]
+            if ready_at > now:
+                await self._sleep_or_wakeup(ready_at - now)
+                continue
+            heapq.heappop(self._heap)
+            # stale heap entries (chat already in flight / drained / re-blocked)
+            if chat_id in self._in_flight_chats or not self._chat_jobs.get(chat_id):
+                continue
+            real_ready = self._chat_ready_at(chat_id, now)
+            if real_ready > now:
+                heapq.heappush(self._heap, (real_ready, next(self._seq), chat_id))
+                continue
+            gdelay = self._global.delay(now)
+            if gdelay > 0:
+                heapq.heappush(self._heap, (now + gdelay, next(self._seq), chat_id))
+                await asyncio.sleep(gdelay)
+                continue
+            await self._sem.acquire()
+            now = monotonic()
+            self._global.take(now)
+            self._chat_buckets[chat_id].take(now)
+            job = self._chat_jobs[chat_id].popleft()
+            if job.edit_of is not None:
+                # from now on a newer edit must be queued separately
+                self._pending_edits.pop((chat_id, job.edit_of), None)
+            self._in_flight_chats.add(chat_id)
+            task = asyncio.create_task(self._send(job))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, job: _Job) -> None:
+        requeue_delay = None
+        method = "edit_message_text" if job.edit_of is not None else "send_message"
+        outcome = "error"
+        started = monotonic()
+        try:
+            if job.edit_of is not None:
+                msg = await self.bot.edit_message_text(chat_id=job.chat_id, message_id=job.edit_of, **job.kwargs)
+            else:
+                msg = await self.bot.send_message(chat_id=job.chat_id, **job.kwargs)
+            outcome = "ok"
+            self.sent_total += 1
+            self._finish(job, msg)
+        except RetryAfter as e:
+            outcome = "retry_after"
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+            logger.warning(f"Telegram RetryAfter {retry_after}s for chat {job.chat_id}")
+            requeue_delay = retry_after
+        except BadRequest as e:
+            self._on_bad_request(job, e)
+        except (TimedOut, NetworkError) as e:
+            logger.warning(f"Telegram send to {job.chat_id} failed (attempt {job.attempts + 1}): {e}")
+            requeue_delay = min(60.0, 2.0 ** job.attempts)
+        except Exception as e:
+            logger.error(f"Failed to send Telegram message to {job.chat_id}: {e}")
+            self.failed_total += 1
+            self._finish(job, None)
+        finally:
+            metrics.TELEGRAM_SEND_SECONDS.observe(monotonic() - started, method=method, outcome=outcome)
+            self._sem.release()
+            if requeue_delay is not None:
+                self._requeue(job, requeue_delay)
+            self._in_flight_chats.discard(job.chat_id)
+            self._schedule_chat(job.chat_id)
+
+    def _on_bad_request(self, job: _Job, e: BadRequest) -> None:
+        if job.edit_of is not None and "not modified" in str(e).lower():
+            self._finish(job, None)
+            return
+        # Markup is validated locally before it is queued (helpers.tg_html), so a BadRequest
+        # is not worth a second round trip with another parse mode.
+        logger.error(f"Failed to send Telegram message to {job.chat_id}: {e}")
+        self.failed_total += 1
+        self._finish(job, None)
+
+    def _requeue(self, job: _Job, delay: float) -> None:
+        job.attempts += 1
+        if job.attempts > self.max_retries:
+            logger.error(f"Giving up on Telegram message to {job.chat_id} after {job.attempts} attempts")
+            self.failed_total += 1
+            self._finish(job, None)
+            return
+        self.retried_total += 1
+        if delay > 0:
+            self._blocked_until[job.chat_id] = max(self._blocked_until.get(job.chat_id, 0.0), monotonic() + delay)
+        # keep per-chat ordering: the retried job goes first
+        self._chat_jobs.setdefault(job.chat_id, deque()).appendleft(job)
+
+    def _finish(self, job: _Job, result) -> None:
+        self._depth -= 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+
+def get_delivery_queue(application) -> DeliveryQueue:
+    """Lazily create (and start) the application-wide delivery queue."""
+    queue = getattr(application, "_runtime_delivery_queue", None)
+    if queue is None:
+        queue = DeliveryQueue(application.bot)
+        application._runtime_delivery_queue = queue
+        metrics.TELEGRAM_QUEUE_DEPTH.set_function(queue.depth)
+    queue.start()
+    return queue
+
+
+async def stop_delivery_queue(application) -> None:
+    queue = getattr(application, "_runtime_delivery_queue", None)
+    if queue is not None:
+        await queue.stop()
@@ -0,0 +1,276 @@
+# helpers/discord_sink.py
+import asyncio
+import logging
+import os
+import re
+from collections import OrderedDict
+from time import monotonic
+
+import httpx
+
+from helpers import processing
+
+logger = logging.getLogger(__name__)
+
+DISCORD_FLUSH_SECONDS = float(os.getenv("DISCORD_FLUSH_SECONDS", "2.0"))
+DISCORD_MAX_EMBEDS = 10  # hard limit of the webhook API
+DISCORD_MAX_MESSAGE_CHARS = 6000  # summed text of all embeds in one message
+DISCORD_MAX_RETRIES = int(os.getenv("DISCORD_MAX_RETRIES", "3"))
+# How many posted messages to remember for later edits
+DISCORD_EDIT_MEMORY = int(os.getenv("DISCORD_EDIT_MEMORY", "500"))
+
+_ANCHOR_RE = re.compile(r'<a\s+href=\"([^\"]+)\">([^<]+)</a>')
+_DEX_URL_RE = re.compile(r'https?://[^\s]*dexscreener\.com/\S+')
+
+
+def html_to_discord_embed(message: str) -> dict:
+    """Convert our Telegram HTML alert into a Discord embed."""
+    raw = str(message)
+    # Replace anchor tags with "Text: URL"
+    raw = _ANCHOR_RE.sub(r'\2: \1', raw)
+    # Basic sanitization
+    discord_message = (
+        raw
+        .replace('\n\n', '\n')
+        .replace('<b>', '**').replace('</b>', '**')
+        .replace('<i>', '*').replace('</i>', '*')
+        .replace('<code>', '`').replace('</code>', '`')
+        .replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
+    )
+    lines = [l for l in discord_message.split('\n') if l.strip()]
+    title = lines[0][:256] if lines else "Multi Event"
+    description = "\n".join(lines[1:])[:4000] if len(lines) > 1 else ''
+    # Try to set embed.url to Dexscreener link
+    m = _DEX_URL_RE.search(discord_message)
+    return {
+        "title": title,
+        "description": description,
+        "color": 0x00C853 if ('Buy' in title or '🔥' in title) else 0xD50000,
+        **({"url": m.group(0)} if m else {}),
+    }
+
+
+def _embed_chars(embed: dict) -> int:
+    return len(embed.get("title") or '') + len(embed.get("description") or '')
+
+
+def _split_batches(embeds: list) -> list:
+    """[(start, end)] slices of embeds that fit DISCORD_MAX_EMBEDS and DISCORD_MAX_MESSAGE_CHARS."""
+    slices = []
+    start, chars = 0, 0
+    for i, embed in enumerate(embeds):
+        size = _embed_chars(embed)
+        if i > start and (i - start >= DISCORD_MAX_EMBEDS or chars + size > DISCORD_MAX_MESSAGE_CHARS):
+            slices.append((start, i))
+            start, chars = i, 0
+        chars += size
+    if start < len(embeds):
+        slices.append((start, len(embeds)))
+    return slices
+
+
+class DiscordSink:
+    """Batches alert embeds into webhook calls and edits earlier messages in place.
+
+    New embeds are collected for DISCORD_FLUSH_SECONDS (or until 10 are queued)
+    and posted as one message, split further when their text would exceed the
+    6000-char message limit. Messages are queued as HTML and converted on the
+    processing executor at flush time. Embeds submitted with a thread key can later be
+    replaced through the webhook message-edit endpoint; an edit that arrives while
+    its post is in flight waits for the message id, and one that would push the
+    message past 6000 chars goes out as a new post. X-RateLimit-* headers and
+    429 retry_after are honoured before the next call.
+    """
+
+    def __init__(self, webhook_url: str, flush_seconds: float = DISCORD_FLUSH_SECONDS):
+        url = httpx.URL(webhook_url)
+        self.webhook_url = str(url.copy_with(query=None)).rstrip('/')
+        self._query = dict(url.params)    # e.g. ?thread_id=… — sent with every call, also the edits
+        self.flush_seconds = max(0.0, flush_seconds)
+        self._posts: list = []            # [(thread_key | None, html message)]
+        self._edits: OrderedDict = OrderedDict()  # thread_key -> html message (latest wins)
+        self._messages: OrderedDict = OrderedDict()  # message_id -> [embeds]
+        self._threads: dict = {}          # thread_key -> (message_id, index)
+        self._sending: dict = {}          # thread_key of a post in flight -> edit held until it lands (or None)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._not_before = 0.0
+        self._last_status = 0
+        self.calls_total = 0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="discord_sink")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    def post(self, message: str, thread_key=None) -> None:
+        self._posts.append((thread_key, message))
+        self.start()
+        self._wakeup.set()
+
+    def edit(self, message: str, thread_key) -> None:
+        """Replace the embed posted under thread_key; falls back to a new post if it is unknown."""
+        if thread_key in self._sending:
+            # its POST is in flight: apply once the message id is known
+            self._sending[thread_key] = message
+            return
+        if thread_key not in self._threads:
+            # still waiting for the flush window → replace the queued embed instead
+            for i, (key, _) in enumerate(self._posts):
+                if key == thread_key:
+                    self._posts[i] = (key, message)
+                    return
+            self._posts.append((thread_key, message))
+            self.start()
+            self._wakeup.set()
+            return
+        self._edits[thread_key] = message
+        self.start()
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # short flush window to coalesce a burst into one call
+            if len(self._posts) < DISCORD_MAX_EMBEDS and self.flush_seconds:
+                await asyncio.sleep(self.flush_seconds)
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"Discord sink flush failed: {e}", exc_info=True)
+
+    async def _flush(self) -> None:
+        while self._posts:
+            batch = self._posts[:DISCORD_MAX_EMBEDS]
+            del self._posts[:DISCORD_MAX_EMBEDS]
+            keys = [k for k, _ in batch if k is not None]
+            self._sending.update((k, None) for k in keys)
+            try:
+                embeds = await self._embeds([m for _, m in batch])
+                for start, end in _split_batches(embeds):
+                    await self._post(batch[start:end], embeds[start:end])
+            finally:
+                for key in keys:
+                    held = self._sending.pop(key, None)
+                    if held is not None:
+                        self.edit(held, key)
+        # Group pending edits per message so one PATCH carries all of its changed embeds
+        by_message: dict = {}
+        edits = list(self._edits.items())
+        self._edits.clear()
+        for (thread_key, message), embed in zip(edits, await self._embeds([m for _, m in edits])):
+            loc = self._threads.get(thread_key)
+            if not loc or loc[0] not in self._messages:
+                self._posts.append((thread_key, message))
+                continue
+            message_id, index = loc
+            others = sum(_embed_chars(e) for i, e in enumerate(self._messages[message_id]) if i != index)
+            if others + _embed_chars(embed) > DISCORD_MAX_MESSAGE_CHARS:
+                # the grown embed no longer fits its message (PATCH would get a 400) → post it anew
+                self._threads.pop(thread_key, None)
+                self._posts.append((thread_key, message))
+                continue
+            self._messages[message_id][index] = embed
+            by_message[message_id] = self._messages[message_id]
+        for message_id, embeds in by_message.items():
+            await self._request("PATCH", f"{self.webhook_url}/messages/{message_id}", {"embeds": embeds}, params=self._query)
+        if self._posts:
+            self._wakeup.set()
+
+    async def _post(self, batch: list, embeds: list) -> None:
+        body = await self._request("POST", self.webhook_url, {"embeds": embeds}, params={**self._query, "wait": "true"})
+        if body and body.get("id"):
+            self._remember(str(body["id"]), embeds, [k for k, _ in batch])
+        elif body is None and len(embeds) > 1 and self._last_status == 400:
+            # one bad embed must not drop the whole batch → post them one by one
+            for item, embed in zip(batch, embeds):
+                await self._post([item], [embed])
+
+    @staticmethod
+    async def _embeds(messages: list) -> list:
+        return list(await asyncio.gather(*(processing.run(html_to_discord_embed, m) for m in messages)))
+
+    def _remember(self, message_id: str, embeds: list, keys: list) -> None:
+        self._messages[message_id] = list(embeds)
+        for index, key in enumerate(keys):
+            if key is not None:
+                self._threads[key] = (message_id, index)
+        while len(self._messages) > max(1, DISCORD_EDIT_MEMORY):
+            old_id, _ = self._messages.popitem(last=False)
+            for key in [k for k, loc in self._threads.items() if loc[0] == old_id]:
+                self._threads.pop(key, None)
+
+    async def _request(self, method: str, url: str, payload: dict, params: dict | None = None) -> dict | None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10)
+        self._last_status = 0
+        for attempt in range(DISCORD_MAX_RETRIES + 1):
+            wait = self._not_before - monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                resp = await self._client.request(method, url, json=payload, params=params)
+            except httpx.HTTPError as e:
+                logger.warning(f"Discord webhook {method} failed (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(min(30.0, 2.0 ** attempt))
+                continue
+            self.calls_total += 1
+            self._last_status = resp.status_code
+            self._note_rate_limit(resp)
+            if resp.status_code == 429:
+                try:
+                    retry_after = float((resp.json() or {}).get("retry_after", 1.0))
+                except Exception:
+                    retry_after = 1.0
+                self._not_before = max(self._not_before, monotonic() + retry_after)
+                logger.warning(f"Discord rate limited, retry in {retry_after:.1f}s")
+                continue
+            if resp.status_code >= 500:
+                await asyncio.sleep(min(30.0, 2.0 ** attempt))
+                continue
+            if resp.status_code >= 400:
+                logger.error(f"Discord webhook {method} rejected ({resp.status_code}): {resp.text[:300]}")
+                return None
+            logger.info(f"Discord webhook {method} ok ({len(payload.get('embeds', []))} embeds)")
+            try:
+                return resp.json() if resp.content else {}
+            except Exception:
+                return {}
+        logger.error(f"Discord webhook {method} gave up after {DISCORD_MAX_RETRIES + 1} attempts")
+        return None
+
+    def _note_rate_limit(self, resp: httpx.Response) -> None:
+        try:
+            remaining = resp.headers.get("X-RateLimit-Remaining")
+            reset_after = resp.headers.get("X-RateLimit-Reset-After")
+            if remaining is not None and reset_after is not None and int(float(remaining)) <= 0:
+                self._not_before = max(self._not_before, monotonic() + float(reset_after))
+        except Exception:
+            pass
+
+
+_sink: DiscordSink | None = None
+
+
+def get_discord_sink(webhook_url: str | None) -> DiscordSink | None:
+    global _sink
+    if not webhook_url:
+        return None
+    if _sink is None:
+        _sink = DiscordSink(webhook_url)
+    return _sink
+
+
+async def stop_discord_sink() -> None:
+    if _sink is not None:
+        await _sink.stop()
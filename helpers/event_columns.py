@@ -0,0 +1,140 @@
+# helpers/event_columns.py
+"""Optional NumPy columnar mirror of the event store for high-cardinality sweeps.
+
+With EVENT_COLUMNS=1 and numpy installed, store_event() also appends every event to
+flat arrays (timestamp, token/side key, wallet id). When a detection
+pass has many candidate tokens, window_counts() computes the unique-wallet count of
+every token/side for every window at once:
+
+    start = searchsorted(ts, now - w)              # one bisect per window
+    pairs = unique(key[start:] * n_wallets + wallet[start:])
+    counts = bincount(pairs // n_wallets)          # per token/side
+
+so a pass over ~100k live events costs a few milliseconds instead of one Python
+bisect per token/side/window. The dict-of-lists store stays the source of truth for
+participants; this buffer only answers counts (WindowCounts.get has the same
+signature as multibuy_logic.window_count).
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # optional dependency
+    np = None
+
+EVENT_COLUMNS = os.getenv("EVENT_COLUMNS", "0") == "1"
+# below this many candidate tokens per pass the per-token bisect path is cheaper
+EVENT_COLUMNS_MIN_CANDIDATES = int(os.getenv("EVENT_COLUMNS_MIN_CANDIDATES", "256"))
+
+_SIDES = {'buys': 0, 'sells': 1}
+_COLUMNS = ('ts', 'key', 'wallet')  # all window_counts() needs; amounts/caps stay in the dict store
+
+
+def available() -> bool:
+    return np is not None
+
+
+class WindowCounts:
+    """Result of one sweep: counts[window_index, token_id * 2 + side]."""
+
+    def __init__(self, counts, window_index: dict, token_ids: dict):
+        self._counts = counts.tolist()  # plain ints: per-lookup numpy scalar indexing is slower than bisect
+        self._window_index = window_index
+        self._token_ids = token_ids
+
+    def get(self, token_addr: str, side_key: str, seconds: float, now_ts: float | None = None) -> int:
+        token_id = self._token_ids.get(token_addr)
+        wi = self._window_index.get(seconds)
+        if token_id is None or wi is None:
+            return 0
+        key = token_id * 2 + _SIDES[side_key]
+        row = self._counts[wi]
+        return row[key] if key < len(row) else 0
+
+
+class EventColumns:
+    def __init__(self, capacity: int = 4096):
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        self.n = 0
+        self._alloc(max(16, capacity))
+        self._token_ids: dict = {}
+        self._wallet_ids: dict = {}
+        self._sorted = True
+
+    def _alloc(self, capacity: int) -> None:
+        old = getattr(self, 'ts', None)
+        cols = {
+            'ts': np.empty(capacity, dtype=np.float64),
+            'key': np.empty(capacity, dtype=np.int64),
+            'wallet': np.empty(capacity, dtype=np.int64),
+        }
+        if old is not None:
+            for name, arr in cols.items():
+                arr[:self.n] = getattr(self, name)[:self.n]
+        for name, arr in cols.items():
+            setattr(self, name, arr)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def append(self, token_addr: str, side_key: str, wallet_address: str, ts: float) -> None:
+        if self.n == self.ts.shape[0]:
+            self._alloc(self.n * 2)
+        token_id = self._token_ids.setdefault(token_addr, len(self._token_ids))
+        i = self.n
+        if i and ts < self.ts[i - 1]:
+            self._sorted = False
+        self.ts[i] = ts
+        self.key[i] = token_id * 2 + _SIDES[side_key]
+        self.wallet[i] = self._wallet_ids.setdefault(wallet_address, len(self._wallet_ids))
+        self.n = i + 1
+
+    def _sort(self) -> None:
+        if self._sorted:
+            return
+        order = np.argsort(self.ts[:self.n], kind='stable')
+        for name in _COLUMNS:
+            arr = getattr(self, name)
+            arr[:self.n] = arr[:self.n][order]
+        self._sorted = True
+
+    def expire(self, cutoff_ts: float) -> int:
+        """Drop events older than cutoff_ts; returns how many were dropped."""
+        self._sort()
+        drop = int(np.searchsorted(self.ts[:self.n], cutoff_ts, side='left'))
+        if not drop:
+            return 0
+        keep = self.n - drop
+        for name in _COLUMNS:
+            arr = getattr(self, name)
+            arr[:keep] = arr[drop:self.n]
+        self.n = keep
+        # tokens churn: re-intern once most ids point at nothing
+        if len(self._token_ids) > 4096 and len(self._token_ids) > 2 * len(np.unique(self.key[:keep] // 2)):
+            self._reintern_tokens()
+        return drop
+
+    def _reintern_tokens(self) -> None:
+        live, inverse = np.unique(self.key[:self.n] // 2, return_inverse=True)
+        by_id = {v: k for k, v in self._token_ids.items()}
+        self._token_ids = {by_id[int(old)]: new for new, old in enumerate(live)}
+        self.key[:self.n] = inverse * 2 + self.key[:self.n] % 2
+
+    def window_counts(self, now_ts: float, windows: list) -> WindowCounts:
+        """Unique wallets per token/side for every window ending at now_ts."""
+        self._sort()
+        ts = self.ts[:self.n]
+        n_keys = len(self._token_ids) * 2
+        n_wallets = max(1, len(self._wallet_ids))
+        starts = np.searchsorted(ts, now_ts - np.asarray(windows, dtype=np.float64), side='left')
+        counts = np.zeros((len(windows), n_keys), dtype=np.int64)
+        for wi, start in enumerate(starts):
+            if start >= self.n:
+                continue
+            pairs = np.unique(self.key[start:self.n] * n_wallets + self.wallet[start:self.n])
+            counts[wi] = np.bincount(pairs // n_wallets, minlength=n_keys)
+        return WindowCounts(counts, {w: i for i, w in enumerate(windows)}, self._token_ids)
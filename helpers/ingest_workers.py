@@ -0,0 +1,236 @@
+# helpers/ingest_workers.py
+"""Sharded ingestion: wallet polling and transaction parsing in worker processes.
+
+With INGEST_WORKERS=N (N > 0) tracked wallets are spread over N processes by
+crc32(address) % N. Each worker runs its own asyncio loop and RPC client, polls
+its shard every POLL_INTERVAL_SECONDS exactly like sequential_tracker does and
+streams compact event tuples back. The main process keeps what needs shared state:
+the event store (cap snapshot via get_token_info), detection and Telegram I/O.
+
+Wallet sets are per chat; the pool polls the union once, so a wallet tracked by
+several chats costs one poll per cycle. Notes:
+  * RPC_CONCURRENCY / WALLET_CONCURRENCY apply per worker.
+  * RPC metrics of workers stay in the workers (the main /metrics shows the main process).
+  * SIMPLE_TX_FEED is per chat and is not available in sharded mode.
+  * The tx archive (TX_ARCHIVE_DIR) needs a single writer: with one worker that
+    worker captures, with INGEST_WORKERS > 1 capture is off in the workers.
+"""
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import zlib
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))  # 0 → poll in the bot's own event loop
+INGEST_EVENT_BATCH = int(os.getenv("INGEST_EVENT_BATCH", "256"))
+# batches waiting for the recorders; when full the reader thread blocks and the workers' queue absorbs the burst
+INGEST_INBOX_BATCHES = int(os.getenv("INGEST_INBOX_BATCHES", "64"))
+
+
+def shard_of(address: str, shards: int) -> int:
+    return zlib.crc32(address.encode()) % max(1, shards)
+
+
+# --- worker side ---
+def _worker_main(shard: int, shards: int, commands, events) -> None:
+    logging.basicConfig(level=os.getenv("INGEST_WORKER_LOG_LEVEL", "WARNING"),
+                        format=f"%(asctime)s ingest[{shard}] %(levelname)s %(name)s: %(message)s")
+    if shards > 1:
+        # segments/index.tsv offsets come from one process's tell(): several appenders corrupt them
+        from helpers import tx_archive
+        tx_archive.TX_ARCHIVE_DIR = ""
+    try:
+        asyncio.run(_worker_loop(shard, commands, events))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(shard: int, commands, events) -> None:
+    import httpx
+    from helpers import multibuy_logic as mlogic
+
+    parent = os.getppid()
+    wallets: dict = {}            # address -> name
+    last_sigs_by_wallet: dict = {}
+
+    async def emit(token_addr, side_key, wallet_address, wallet_name, amount, event_time,
+                   log=False, discovered_at=None, fetched_at=None, token_amount=None):
+        events.put((token_addr, side_key, wallet_address, wallet_name, amount, event_time.timestamp(),
+                    log, discovered_at, fetched_at, token_amount))
+
+    async with httpx.AsyncClient(verify=mlogic.SSL_CONTEXT) as client:
+        while True:
+            if os.getppid() != parent:
+                return  # bot died without stopping us
+            try:
+                while True:
+                    cmd = commands.get_nowait()
+                    if cmd is None:
+                        return
+                    wallets = dict(cmd)
+                    for address in list(last_sigs_by_wallet):
+                        if address not in wallets:
+                            del last_sigs_by_wallet[address]
+            except queue.Empty:
+                pass
+            if wallets:
+                sem = asyncio.Semaphore(max(1, mlogic.WALLET_CONCURRENCY))
+                spacing = float(os.getenv("WALLET_SPACING_SECONDS", "0.1"))
+
+                async def one(address: str, name: str) -> None:
+                    try:
+                        async with sem:
+                            await mlogic.scan_wallet(client, address, name, last_sigs_by_wallet, record=emit)
+                    finally:
+                        await asyncio.sleep(spacing)
+
+                await asyncio.gather(*(one(a, n) for a, n in wallets.items()), return_exceptions=True)
+            await asyncio.sleep(mlogic.POLL_INTERVAL_SECONDS)
+
+
+# --- main side ---
+class IngestPool:
+    def __init__(self, workers: int = INGEST_WORKERS):
+        self.workers = max(1, workers)
+        self._ctx = mp.get_context("spawn")  # the bot's loop/threads must not be forked
+        self._events = self._ctx.Queue()
+        self._commands = [self._ctx.Queue() for _ in range(self.workers)]
+        self._procs = []
+        self._by_chat: dict = {}      # chat_id -> {address: name}
+        self._sent: list = [None] * self.workers
+        self._inbox: asyncio.Queue | None = None
+        self._reader = None
+        self._consumer = None
+        self._stopping = threading.Event()
+        self._recorders: list = []
+        self.events_received = 0
+
+    def start(self) -> "IngestPool":
+        loop = asyncio.get_running_loop()
+        self._inbox = asyncio.Queue(maxsize=max(1, INGEST_INBOX_BATCHES))
+        for shard in range(self.workers):
+            proc = self._ctx.Process(target=_worker_main, args=(shard, self.workers, self._commands[shard], self._events),
+                                     name=f"ingest-{shard}", daemon=True)
+            proc.start()
+            self._procs.append(proc)
+        self._reader = threading.Thread(target=self._read_events, args=(loop,), name="ingest-reader", daemon=True)
+        self._reader.start()
+        self._consumer = asyncio.create_task(self._consume())
+        logger.info(f"Ingest pool started: {self.workers} worker processes")
+        return self
+
+    def set_chat_wallets(self, chat_id, wallets: list) -> None:
+        wanted = {w['address']: w['name'] for w in wallets}
+        if self._by_chat.get(str(chat_id), {}) == wanted:
+            return
+        if wanted:
+            self._by_chat[str(chat_id)] = wanted
+        else:
+            self._by_chat.pop(str(chat_id), None)
+        self._distribute()
+
+    def _distribute(self) -> None:
+        union: dict = {}
+        for wallets in self._by_chat.values():
+            union.update(wallets)
+        shards = [dict() for _ in range(self.workers)]
+        for address, name in union.items():
+            shards[shard_of(address, self.workers)][address] = name
+        for shard, wallets in enumerate(shards):
+            if wallets != self._sent[shard]:
+                self._sent[shard] = wallets
+                self._commands[shard].put(sorted(wallets.items()))
+
+    def _read_events(self, loop) -> None:
+        """Blocking reads off the mp queue, handed to the loop in batches."""
+        while not self._stopping.is_set():
+            try:
+                batch = [self._events.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            try:
+                while len(batch) < INGEST_EVENT_BATCH:
+                    batch.append(self._events.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                put = asyncio.run_coroutine_threadsafe(self._inbox.put(batch), loop)
+            except RuntimeError:
+                return  # loop closed
+            while not self._stopping.is_set():
+                try:
+                    put.result(timeout=0.5)
+                    break
+                except TimeoutError:
+                    continue  # inbox full: recorders are behind
+                except Exception:
+                    return
+
+    async def _consume(self) -> None:
+        """Unpack inbox batches for a fixed pool of WALLET_CONCURRENCY recorders."""
+        from helpers import multibuy_logic as mlogic
+        recorders = max(1, mlogic.WALLET_CONCURRENCY)
+        # bounded: when every recorder waits on a slow cap lookup, reading the inbox pauses too
+        pending = asyncio.Queue(maxsize=recorders * 4)
+
+        async def recorder() -> None:
+            while True:
+                ev = await pending.get()
+                token_addr, side_key, wallet_address, wallet_name, amount, ts, log, discovered_at, fetched_at, token_amount = ev
+                try:
+                    await mlogic._record_event(token_addr, side_key, wallet_address, wallet_name, amount,
+                                               datetime.fromtimestamp(ts, tz=timezone.utc), log=log,
+                                               discovered_at=discovered_at, fetched_at=fetched_at, token_amount=token_amount)
+                except Exception as e:
+                    logger.error(f"Failed to record ingested event {token_addr}/{wallet_address}: {e}")
+
+        # cap snapshots hit the network: record concurrently, don't let one slow token stall the stream
+        self._recorders = [asyncio.create_task(recorder(), name=f"ingest-recorder-{i}") for i in range(recorders)]
+        while True:
+            batch = await self._inbox.get()
+            self.events_received += len(batch)
+            for ev in batch:
+                await pending.put(ev)
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        for commands in self._commands:
+            try:
+                commands.put(None)
+            except Exception:
+                pass
+        self._stopping.set()
+        if self._consumer:
+            self._consumer.cancel()
+        for task in self._recorders:
+            task.cancel()
+        self._recorders = []
+        loop = asyncio.get_running_loop()
+        for proc in self._procs:
+            await loop.run_in_executor(None, proc.join, timeout)
+            if proc.is_alive():
+                proc.terminate()
+        self._procs.clear()
+        logger.info("Ingest pool stopped")
+
+
+def get_ingest_pool(application) -> IngestPool:
+    """Application-wide pool, started on first use (from inside the running loop)."""
+    pool = getattr(application, "_runtime_ingest_pool", None)
+    if pool is None:
+        pool = IngestPool(INGEST_WORKERS).start()
+        application._runtime_ingest_pool = pool
+    return pool
+
+
+async def stop_ingest_pool(application) -> None:
+    pool = getattr(application, "_runtime_ingest_pool", None)
+    if pool is not None:
+        application._runtime_ingest_pool = None
+        await pool.stop()
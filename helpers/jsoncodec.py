@@ -0,0 +1,144 @@
+# helpers/jsoncodec.py
+"""Pluggable JSON codec for the RPC hot path.
+
+Picks the fastest available backend: orjson → msgspec → stdlib json (JSON_CODEC
+forces one). loads() accepts bytes or str, so callers can hand it response.content
+directly and decode each body exactly once.
+
+With JSON_TYPED_TX=1 and msgspec installed, decode_transaction_response() decodes a
+getTransaction body into structs holding only the fields parse_transaction() reads
+(blockTime, balances, token balances, account keys); everything else — instructions,
+logs, inner instructions — is skipped by the decoder instead of being materialised.
+"""
+import json
+import logging
+import os
+from typing import Any, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson  # type: ignore
+except Exception:  # optional dependency
+    orjson = None
+
+try:
+    import msgspec  # type: ignore
+except Exception:  # optional dependency
+    msgspec = None
+
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+JSON_TYPED_TX = os.getenv("JSON_TYPED_TX", "0") == "1"
+
+
+def _pick_backend(name: str) -> str:
+    available = {"orjson": orjson is not None, "msgspec": msgspec is not None, "json": True}
+    if name != "auto":
+        if available.get(name):
+            return name
+        logger.warning(f"JSON_CODEC={name} is not available, falling back to auto")
+    return next(n for n in ("orjson", "msgspec", "json") if available[n])
+
+
+BACKEND = _pick_backend(JSON_CODEC)
+
+if BACKEND == "orjson":
+    def loads(data: bytes | str) -> Any:
+        return orjson.loads(data)
+
+    def dumpb(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str)
+elif BACKEND == "msgspec":
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder(enc_hook=str)
+
+    def loads(data: bytes | str) -> Any:
+        return _decoder.decode(data)
+
+    def dumpb(obj: Any) -> bytes:
+        return _encoder.encode(obj)
+else:
+    def loads(data: bytes | str) -> Any:
+        return json.loads(data)
+
+    def dumpb(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON text (no spaces), same output across backends."""
+    return dumpb(obj).decode()
+
+
+# --- typed getTransaction decoding (msgspec only) ---
+if msgspec is not None:
+    class UiTokenAmount(msgspec.Struct, omit_defaults=True):
+        uiAmountString: Optional[str] = None
+        uiAmount: Optional[float] = None
+        amount: Optional[str] = None
+        decimals: Optional[int] = None
+
+    class TokenBalance(msgspec.Struct, omit_defaults=True):
+        mint: Optional[str] = None
+        owner: Optional[str] = None
+        uiTokenAmount: Optional[UiTokenAmount] = None
+
+    class LoadedAddresses(msgspec.Struct, omit_defaults=True):
+        writable: list[str] = []
+        readonly: list[str] = []
+
+    class TxMeta(msgspec.Struct, omit_defaults=True):
+        err: Any = None
+        preBalances: list[int] = []
+        postBalances: list[int] = []
+        preTokenBalances: list[TokenBalance] = []
+        postTokenBalances: list[TokenBalance] = []
+        loadedAddresses: Optional[LoadedAddresses] = None
+
+    class AccountKey(msgspec.Struct, omit_defaults=True):
+        pubkey: str
+        signer: bool = False
+        writable: bool = False
+
+    class MessageHeader(msgspec.Struct, omit_defaults=True):
+        numRequiredSignatures: int = 1
+
+    class TxMessage(msgspec.Struct, omit_defaults=True):
+        accountKeys: list[Union[str, AccountKey]] = []
+        header: Optional[MessageHeader] = None
+
+    class TxEnvelope(msgspec.Struct, omit_defaults=True):
+        message: TxMessage = msgspec.field(default_factory=TxMessage)
+
+    class Transaction(msgspec.Struct, omit_defaults=True):
+        blockTime: Optional[int] = None
+        slot: Optional[int] = None
+        meta: Optional[TxMeta] = None
+        transaction: TxEnvelope = msgspec.field(default_factory=TxEnvelope)
+
+    class TransactionResponse(msgspec.Struct):
+        result: Optional[Transaction] = None
+        error: Any = None
+
+    _tx_decoder = msgspec.json.Decoder(TransactionResponse)
+else:
+    _tx_decoder = None
+
+
+def typed_transactions_enabled() -> bool:
+    return JSON_TYPED_TX and _tx_decoder is not None
+
+
+def decode_transaction_response(data: bytes | str) -> dict:
+    """{"result": tx | None, ...} of a getTransaction body, as plain dicts/lists.
+
+    In typed mode the tx only carries the fields the balance parser needs.
+    """
+    if not typed_transactions_enabled():
+        return loads(data)
+    try:
+        return msgspec.to_builtins(_tx_decoder.decode(data))
+    except msgspec.ValidationError as e:
+        # unexpected shape from some RPC — fall back to a full decode rather than drop the tx
+        logger.debug(f"typed getTransaction decode failed ({e}), using full decode")
+        return loads(data)
@@ -10,6 +10,8 @@ import time
 
 from kolscan import get_kolscan_wallets
 from helpers.multibuy_logic import start_multibuy_tracker, stop_multibuy_tracker
+from helpers import wallet_registry as wr
+from helpers import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -18,10 +20,13 @@ KOL_REFRESH_LOCK = asyncio.Lock()
 
 USER_DATA_FILE = "user_data.json"
 
+# Чаты с доступом к служебным командам (/latency). Пусто → доступно всем.
+ADMIN_CHAT_IDS = {s.strip() for s in os.getenv("ADMIN_CHAT_IDS", "").split(',') if s.strip()}
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = str(update.effective_chat.id)
     # Use context.user_data for session state management
-    context.user_data.setdefault('wallets', [])
+    wr.get_user_state(context.bot_data, context.user_data)
     context.user_data.setdefault('is_adding_wallet', False)
     # Ничего не обновляем автоматически при старте, только показываем меню
     await show_main_menu(update, context)
@@ -116,9 +121,10 @@ async def receive_wallet_address(update: Update, context: ContextTypes.DEFAULT_T
     if not context.user_data.get('is_adding_wallet'): return
     try:
         address, name = update.message.text.split(' ', 1)
+        reg = wr.get_registry(context.bot_data)
+        st = wr.get_user_state(context.bot_data, context.user_data)
         # Prevent duplicates
-        if not any(w['address'] == address for w in context.user_data['wallets']):
-            context.user_data['wallets'].append({'address': address, 'name': name, 'is_tracking': False})
+        if wr.add_wallet(reg, st, address, name):
             await update.message.reply_text(f"Added '{name}'.")
         else:
             await update.message.reply_text(f"Wallet '{name}' with address {address} is already in the list.")
@@ -134,15 +140,16 @@ async def view_wallets(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
                       else lambda text, reply_markup: context.bot.send_message(chat_id, text, reply_markup=reply_markup))
     if update and update.callback_query: await update.callback_query.answer()
 
-    # Use context.user_data to get wallets
-    wallets = context.user_data.get('wallets', [])
-    if not wallets:
+    reg = wr.get_registry(context.bot_data)
+    st = wr.get_user_state(context.bot_data, context.user_data)
+    wallet_ids = wr.user_wallet_ids(reg, st)
+    if not wallet_ids:
         await message_sender(text="No wallets to display.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to Main Menu", callback_data='back_to_main_menu')]]))
         return
     
     items_per_page = 10
     start_index = page * items_per_page
-    paginated_wallets = wallets[start_index : start_index + items_per_page]
+    paginated_wallets = [wr.wallet_view(reg, st, wid) for wid in wallet_ids[start_index : start_index + items_per_page]]
     keyboard = []
     for w in paginated_wallets:
         keyboard.append([
@@ -151,7 +158,7 @@ async def view_wallets(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
         ])
     nav_buttons = []
     if page > 0: nav_buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f'view_wallets_page_{page-1}'))
-    if start_index + items_per_page < len(wallets): nav_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f'view_wallets_page_{page+1}'))
+    if start_index + items_per_page < len(wallet_ids): nav_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f'view_wallets_page_{page+1}'))
     if nav_buttons: keyboard.append(nav_buttons)
 
     # Add "Select All" / "Deselect All" buttons
@@ -164,7 +171,7 @@ async def view_wallets(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
     keyboard.append([InlineKeyboardButton("⬅️ Back to Main Menu", callback_data='back_to_main_menu')])
     
     try:
-        await message_sender(text=f"Wallets (Page {page + 1}/{ -(-len(wallets) // items_per_page) }):", reply_markup=InlineKeyboardMarkup(keyboard))
+        await message_sender(text=f"Wallets (Page {page + 1}/{ -(-len(wallet_ids) // items_per_page) }):", reply_markup=InlineKeyboardMarkup(keyboard))
     except BadRequest as e:
         if "Message is not modified" in str(e):
             # Ignore this error as it's harmless (e.g., clicking "Select All" when all are already selected)
@@ -177,9 +184,7 @@ async def select_all_wallets(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     page = int(query.data.split(':')[1])
-    # Use context.user_data to modify wallets
-    for w in context.user_data.get('wallets', []):
-        w['is_tracking'] = True
+    wr.select_all(wr.get_registry(context.bot_data), wr.get_user_state(context.bot_data, context.user_data))
     # No manual save needed
     await view_wallets(update, context, page=page)
 
@@ -187,9 +192,7 @@ async def deselect_all_wallets(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     page = int(query.data.split(':')[1])
-    # Use context.user_data to modify wallets
-    for w in context.user_data.get('wallets', []):
-        w['is_tracking'] = False
+    wr.deselect_all(wr.get_registry(context.bot_data), wr.get_user_state(context.bot_data, context.user_data))
     # No manual save needed
     await view_wallets(update, context, page=page)
 
@@ -198,10 +201,7 @@ async def toggle_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     _, page_str, address = query.data.split(':', 2)
     page = int(page_str)
-    # Use context.user_data to modify wallets
-    for w in context.user_data.get('wallets', []):
-        if w['address'] == address:
-            w['is_tracking'] = not w.get('is_tracking', False)
+    wr.toggle_wallet(wr.get_registry(context.bot_data), wr.get_user_state(context.bot_data, context.user_data), address)
     # No manual save needed
     await view_wallets(update, context, page=page)
 
@@ -210,8 +210,7 @@ async def remove_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     _, page_str, address = query.data.split(':', 2)
     page = int(page_str)
-    # Use context.user_data to modify wallets
-    context.user_data['wallets'] = [w for w in context.user_data.get('wallets', []) if w['address'] != address]
+    wr.remove_wallet(wr.get_registry(context.bot_data), wr.get_user_state(context.bot_data, context.user_data), address)
     # No manual save needed
     await view_wallets(update, context, page=page)
 
@@ -221,7 +220,7 @@ async def start_tracking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = str(query.message.chat_id)
     
     # Use context.user_data to check for selected wallets
-    wallets_to_track = [w for w in context.user_data.get('wallets', []) if w.get('is_tracking')]
+    wallets_to_track = wr.tracked_wallets(wr.get_registry(context.bot_data), wr.get_user_state(context.bot_data, context.user_data))
     
     if not wallets_to_track:
         await query.message.reply_text("⚠️ No wallets selected for tracking. Please select wallets from the 'View & Select Wallets' menu first.")
@@ -276,35 +275,17 @@ async def _background_load_kols(chat_id: int, context: ContextTypes.DEFAULT_TYPE
             await context.bot.send_message(chat_id, "🚨 Could not fetch wallets from kolscan.io.")
             return
         
-        # SMART MERGE SYNC: объединяем новый список с закреплёнными трекаемыми адресами
+        # SMART MERGE SYNC: общий реестр обновляется один раз, у пользователя меняются только битовые маски
         async with KOL_REFRESH_LOCK:
-            prev_wallets = context.user_data.get('wallets', []) or []
-            prev_by_addr = {w.get('address'): {'is_tracking': w.get('is_tracking', False), 'name': w.get('name', w.get('address'))} for w in prev_wallets if w.get('address')}
-            fresh = [w for w in kols_wallets if w.get('address')]
-            new_wallets = []
-            used = set()
-            for w in fresh:
-                addr = w['address']
-                name = w.get('name', addr)
-                # prefer previous custom name if existed
-                if addr in prev_by_addr and prev_by_addr[addr].get('name'):
-                    name = prev_by_addr[addr]['name']
-                is_tr = prev_by_addr.get(addr, {}).get('is_tracking', False)
-                new_wallets.append({'name': name, 'address': addr, 'is_tracking': is_tr})
-                used.add(addr)
-            # keep pinned tracked wallets not present in fresh
-            kept = 0
-            for addr, meta in prev_by_addr.items():
-                if meta.get('is_tracking') and addr not in used:
-                    new_wallets.append({'name': meta.get('name', addr), 'address': addr, 'is_tracking': True})
-                    kept += 1
+            reg = wr.get_registry(context.bot_data)
+            st = wr.get_user_state(context.bot_data, context.user_data)
+            wr.set_kol_wallets(reg, kols_wallets)
             # If chat had tracking enabled, optionally auto-track refreshed list
             had_tracking = bool(context.user_data.get('tracking_tasks'))
-            if had_tracking and os.getenv("KOL_AUTO_TRACK_REFRESH", "1") == "1":
-                for item in new_wallets:
-                    item['is_tracking'] = True
-            context.user_data['wallets'] = new_wallets
-            total_count = len(new_wallets)
+            auto_track = had_tracking and os.getenv("KOL_AUTO_TRACK_REFRESH", "1") == "1"
+            # tracked wallets missing from the fresh list stay pinned
+            kept = wr.apply_kol_refresh(reg, st, auto_track=auto_track)
+            total_count = wr.wallet_count(reg, st)
         
         await context.bot.send_message(chat_id, f"✅ Все кошельки собраны. Всего: {total_count}. Закреплённых сохранено: {kept}.")
         # No manual save needed
@@ -358,43 +339,27 @@ async def auto_refresh_kols_for_all_users(context: ContextTypes.DEFAULT_TYPE):
             if not kols_wallets:
                 logger.warning("Auto-refresh: no wallets fetched from kolscan.io")
                 return
-            # Новый список из Kolscan
-            fresh = [w for w in kols_wallets if w.get('address')]
+            # Новый список из Kolscan → общий реестр (один раз на всех пользователей)
+            reg = wr.get_registry(context.application.bot_data)
+            wr.set_kol_wallets(reg, kols_wallets)
             total_users = 0
             notify = os.getenv("KOL_AUTO_REFRESH_NOTIFY", "0") == "1"
             auto_track_refresh = os.getenv("KOL_AUTO_TRACK_REFRESH", "1") == "1"
             for user_id, udata in list(context.application.user_data.items()):
                 try:
-                    prev_wallets = udata.get('wallets', []) or []
-                    prev_by_addr = {w.get('address'): {'is_tracking': w.get('is_tracking', False), 'name': w.get('name', w.get('address'))} for w in prev_wallets if w.get('address')}
-                    new_wallets = []
-                    used = set()
-                    for w in fresh:
-                        addr = w['address']
-                        name = w.get('name', addr)
-                        if addr in prev_by_addr and prev_by_addr[addr].get('name'):
-                            name = prev_by_addr[addr]['name']
-                        is_tr = prev_by_addr.get(addr, {}).get('is_tracking', False)
-                        new_wallets.append({'name': name, 'address': addr, 'is_tracking': is_tr})
-                        used.add(addr)
-                    # keep pinned tracked wallets not present in fresh
-                    for addr, meta in prev_by_addr.items():
-                        if meta.get('is_tracking') and addr not in used:
-                            new_wallets.append({'name': meta.get('name', addr), 'address': addr, 'is_tracking': True})
+                    st = wr.get_user_state(context.application.bot_data, udata)
                     # If chat had tracking enabled, optionally auto-track refreshed list
                     had_tracking = bool(udata.get('tracking_tasks'))
-                    if had_tracking and auto_track_refresh:
-                        for item in new_wallets:
-                            item['is_tracking'] = True
-                    udata['wallets'] = new_wallets
+                    # keep pinned tracked wallets not present in fresh (O(1) bitmap merge)
+                    wr.apply_kol_refresh(reg, st, auto_track=had_tracking and auto_track_refresh)
                     total_users += 1
                     # Авто‑уведомление (по умолчанию выключено)
                     if notify:
                         try:
-                            await context.bot.send_message(chat_id=int(user_id), text=f"🔄 Авто‑синхронизация KOL: {len(new_wallets)} кошельков. Отметки трекинга сохранены; закреплённые адреса сохранены.")
+                            await context.bot.send_message(chat_id=int(user_id), text=f"🔄 Авто‑синхронизация KOL: {wr.wallet_count(reg, st)} кошельков. Отметки трекинга сохранены; закреплённые адреса сохранены.")
                         except Exception:
                             try:
-                                await context.bot.send_message(chat_id=user_id, text=f"🔄 Авто‑синхронизация KOL: {len(new_wallets)} кошельков. Отметки трекинга сохранены; закреплённые адреса сохранены.")
+                                await context.bot.send_message(chat_id=user_id, text=f"🔄 Авто‑синхронизация KOL: {wr.wallet_count(reg, st)} кошельков. Отметки трекинга сохранены; закреплённые адреса сохранены.")
                             except Exception as e:
                                 logger.warning(f"Failed to notify user {user_id} about smart KOL sync: {e}")
                     # Гарантируем, что трекер активен для чата, где был запущен трекинг
@@ -406,6 +371,11 @@ async def auto_refresh_kols_for_all_users(context: ContextTypes.DEFAULT_TYPE):
                 except Exception as e:
                     logger.warning(f"Auto-refresh smart sync failed for user {user_id}: {e}", exc_info=True)
             logger.info(f"Auto-refresh KOL smart merge complete. Users updated: {total_users}.")
+            # user_data was changed outside of a handler → mark it so the next flush writes those rows
+            try:
+                context.application.mark_data_for_update_persistence(user_ids=list(context.application.user_data.keys()))
+            except Exception:
+                pass
 
             # Зафиксируем момент успешного авто‑обновления для восстановления таймера после рестарта
             try:
@@ -421,3 +391,10 @@ async def auto_refresh_kols_for_all_users(context: ContextTypes.DEFAULT_TYPE):
 
 async def back_to_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await show_main_menu(update, context)
+
+async def latency_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/latency — percentiles of alert staleness per pipeline stage."""
+    chat_id = str(update.effective_chat.id)
+    if ADMIN_CHAT_IDS and chat_id not in ADMIN_CHAT_IDS:
+        return
+    await update.message.reply_text(tracing.format_summary(), parse_mode='HTML')
@@ -0,0 +1,225 @@
+# helpers/metrics.py
+"""Minimal Prometheus-style metrics (no external dependency).
+
+Counters, gauges and histograms live in a process-wide registry and are served
+in the text exposition format on http://METRICS_HOST:METRICS_PORT/metrics.
+"""
+import asyncio
+import logging
+import os
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 → disabled
+
+_DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry: dict = {}
+
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    return tuple(str(labels.get(n, "")) for n in labelnames)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labelnames: tuple, key: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape_label(v)}"' for n, v in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    return repr(float(v)) if v != int(v) else f"{int(v)}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def render(self) -> list:
+        return self.header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict = {}
+        self._callbacks: dict = {}
+
+    def set(self, value: float, **labels) -> None:
+        self._values[_label_key(self.labelnames, labels)] = float(value)
+
+    def set_function(self, fn, **labels) -> None:
+        """Evaluate fn() at scrape time (e.g. a queue length)."""
+        self._callbacks[_label_key(self.labelnames, labels)] = fn
+
+    def render(self) -> list:
+        values = dict(self._values)
+        for key, fn in self._callbacks.items():
+            try:
+                values[key] = float(fn())
+            except Exception:
+                continue
+        return self.header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = _DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+        idx = bisect_left(self.buckets, value)
+        if idx < len(self.buckets):
+            series[idx] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list:
+        lines = self.header()
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            le_inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le_inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(series[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def _register(metric):
+    existing = _registry.get(metric.name)
+    if existing is not None:
+        return existing
+    _registry[metric.name] = metric
+    return metric
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return _register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = _DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in list(_registry.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Alert pipeline metrics ---
+RPC_REQUESTS = counter("rpc_requests_total", "Solana JSON-RPC calls by method and HTTP status", ("method", "status"))
+RPC_LATENCY = histogram("rpc_request_seconds", "Solana JSON-RPC round trip time", ("method",))
+RPC_RESPONSE_BYTES = counter("rpc_response_bytes_total", "Bytes of Solana JSON-RPC response bodies", ("method",))
+RPC_QUEUE_WAIT = histogram("rpc_queue_wait_seconds", "Time spent waiting for the RPC concurrency semaphore", ("method",))
+SIGNATURE_TO_PARSE = histogram("signature_to_parse_seconds", "Signature discovered → transaction parsed")
+PARSE_TO_ALERT = histogram("parse_to_alert_seconds", "Triggering event parsed → alert queued for delivery", ("kind",))
+TX_CACHE = counter("tx_cache_total", "Parsed-transaction cache lookups (hit / inflight / miss)", ("result",))
+TOKEN_INFO_CACHE = counter("token_info_cache_total", "get_token_info cache lookups", ("result",))
+TOKEN_INFO_SOURCE = counter("token_info_source_total", "Where get_token_info caps came from (trade = local price engine, external = price APIs)", ("source",))
+KOL_SCRAPE_SECONDS = histogram("kol_scrape_seconds", "Kolscan leaderboard scrape duration", buckets=(5, 15, 30, 60, 120, 300, 600, 1200))
+KOL_SCRAPE_WALLETS = gauge("kol_scrape_wallets", "Wallets returned by the last Kolscan scrape")
+TELEGRAM_SEND_SECONDS = histogram("telegram_send_seconds", "Telegram Bot API call latency", ("method", "outcome"))
+TELEGRAM_QUEUE_DEPTH = gauge("telegram_queue_depth", "Messages waiting in the Telegram delivery queue")
+SCAN_CYCLE_SECONDS = histogram("scan_cycle_seconds", "Full wallet scan cycle duration per chat")
+ALERTS_TOTAL = counter("alerts_total", "Alerts published", ("kind", "side"))
+EVENT_LOOP_LAG = histogram("event_loop_lag_seconds", "How late the event loop ran a timer it had scheduled",
+                           buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+EVENT_LOOP_LAG_MAX = gauge("event_loop_lag_max_seconds", "Worst event loop lag over the last minute")
+EVENT_LOOP_STALLS = counter("event_loop_stalls_total", "Times the event loop was blocked longer than WATCHDOG_STALL_MS")
+EVENT_LOOP_STALL_SECONDS = histogram("event_loop_stall_seconds", "Duration of detected event loop stalls",
+                                     buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+CACHE_CLEANUP_REMOVED_BYTES = counter("cache_cleanup_removed_bytes_total", "Bytes deleted from browser caches")
+CACHE_CLEANUP_KEPT_BYTES = gauge("cache_cleanup_kept_bytes", "Browser cache bytes left after the last sweep")
+PROCESSING_QUEUE_DEPTH = gauge("processing_queue_depth", "CPU-bound jobs waiting for the processing executor")
+PROCESSING_BATCH_SECONDS = histogram("processing_batch_seconds", "Processing executor batch run time (submit → results)")
+CLUSTER_PAIRS = gauge("cluster_pairs", "Wallet pairs tracked by the co-buy cluster index")
+SCORE_GATED = counter("score_gated_total", "Wallet-count threshold reached but score below MULTI_SCORE_THRESHOLD (not enriched)", ("side",))
+ENRICH_DEFERRED = counter("enrich_deferred_total", "Events stored without a cap lookup (token below ENRICH_INTEREST_THRESHOLD)")
+CAP_FILLS = counter("cap_fills_total", "Event caps filled after the token became interesting", ("source",))
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # drain headers
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            if not line or line in (b"\r\n", b"\n"):
+                break
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?", 1)[0] if len(parts) > 1 else "/"
+        if path == "/metrics":
+            body = render_metrics().encode()
+            status, ctype = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, status, ctype = b"not found\n", "404 Not Found", "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except Exception:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve /metrics on a local port; returns the asyncio server (or None if disabled)."""
+    if not port:
+        return None
+    try:
+        server = await asyncio.start_server(_handle, host, port)
+        logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+        return server
+    except OSError as e:
+        logger.warning(f"Could not start metrics endpoint on {host}:{port}: {e}")
+        return None
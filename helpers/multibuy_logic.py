@@ -12,9 +12,15 @@ import importlib.util
 from html import escape as html_escape
 from time import perf_counter
 from math import ceil
-import re
-import shutil
+from bisect import bisect_left, bisect_right
 import time
+from cachetools import TTLCache
+
+from helpers import wallet_registry as wr
+from helpers.delivery import get_delivery_queue
+from helpers.tg_html import render_telegram_html
+from helpers.discord_sink import get_discord_sink
+from helpers import clusters, event_columns, ingest_workers, jsoncodec, metrics, price_engine, processing, scoring, tracing, tx_archive
 
 # Попытка подключить готовые функции из SolanaTrackerBot (не копируя код)
 ST_WALLET_TRACKER = None
@@ -52,6 +58,12 @@ MIN_MARKET_CAP = int(os.getenv("MIN_MARKET_CAP", 75000))
 MAX_MARKET_CAP = int(os.getenv("MAX_MARKET_CAP")) if os.getenv("MAX_MARKET_CAP") else None
 SOLANA_RPC_ENDPOINT = os.getenv("SOLANA_RPC_ENDPOINT", "https://api.mainnet-beta.solana.com")
 SIMPLE_TX_FEED = os.getenv("SIMPLE_TX_FEED", "0") == "1"  # Optional per-tx debug feed
+# getTransaction payload: plain "json" is enough for balance deltas; the per-tx feed reads parsed instructions
+TX_ENCODING = os.getenv("TX_ENCODING", "jsonParsed" if SIMPLE_TX_FEED else "json")
+RPC_COMMITMENT = os.getenv("RPC_COMMITMENT", "confirmed")
+# getTransaction and getSignaturesForAddress reject "processed" → the closest they accept
+READ_COMMITMENT = "confirmed" if RPC_COMMITMENT == "processed" else RPC_COMMITMENT
+SIGNATURES_LIMIT = int(os.getenv("SIGNATURES_LIMIT", "10"))
 # Включение подробного дебага
 DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "0") == "1"
 # Сколько последних сигнатур обработать при первом заходе (для быстрой проверки конвейера)
@@ -61,7 +73,13 @@ ENABLE_PREALERT = os.getenv("ENABLE_PREALERT", "1") == "1"
 PREALERT_THRESHOLD = int(os.getenv("PREALERT_THRESHOLD", "2"))
 # Управление отправкой UPDATE-сообщений
 ENABLE_UPDATES = os.getenv("ENABLE_UPDATES", "1") == "1"
+# UPDATE-сообщения редактируют исходный алерт; серия новых кошельков схлопывается в одну правку
+UPDATE_DEBOUNCE_SECONDS = int(os.getenv("UPDATE_DEBOUNCE_SECONDS", "10"))
+UPDATE_MAX_DELAY_SECONDS = int(os.getenv("UPDATE_MAX_DELAY_SECONDS", "60"))
 DEX_TTL_SECONDS = int(os.getenv("DEX_TTL_SECONDS", "60"))
+# Staged enrichment: events are stored without a cap; once a token side has this many wallets
+# its caps are filled (implied swap price × supply, else the current cap). 0 → fill on every event
+ENRICH_INTEREST_THRESHOLD = int(os.getenv("ENRICH_INTEREST_THRESHOLD", "2"))
 
 
 # NEW: SOL price cache TTL and cache
@@ -69,21 +87,27 @@ SOL_PRICE_TTL_SECONDS = int(os.getenv("SOL_PRICE_TTL_SECONDS", "60"))
 _sol_price_cache = {"price": 0.0, "ts": 0.0}
 # Optional Birdeye API key to avoid 401 responses on some endpoints
 BIRDEYE_API_KEY = os.getenv("BIRDEYE_API_KEY", "")
+# Base URLs of the price/market data APIs (overridable for local mocks, see bench/)
+DEXSCREENER_API_BASE = os.getenv("DEXSCREENER_API_BASE", "https://api.dexscreener.com").rstrip('/')
+BIRDEYE_API_BASE = os.getenv("BIRDEYE_API_BASE", "https://public-api.birdeye.so").rstrip('/')
+JUPITER_PRICE_API_BASE = os.getenv("JUPITER_PRICE_API_BASE", "https://price.jup.ag").rstrip('/')
 # Discord forwarding controls
 DISCORD_ALLOWED_CHAT_IDS = {s.strip() for s in os.getenv("DISCORD_ALLOWED_CHAT_IDS", "").split(',') if s.strip()}
-DISCORD_DEDUPE_TTL_SECONDS = int(os.getenv("DISCORD_DEDUPE_TTL_SECONDS", "60"))
-_discord_dedupe: dict[str, float] = {}
-# Cache cleanup controls
-CACHE_CLEANUP_ENABLED = os.getenv("CACHE_CLEANUP_ENABLED", "1") == "1"
-CACHE_CLEANUP_TARGETS = [p.strip() for p in os.getenv(
-    "CACHE_CLEANUP_TARGETS",
-    "~/.cache/ms-playwright,~/.local/share/pyppeteer"
-).split(',') if p.strip()]
-CACHE_CLEANUP_MAX_AGE_DAYS = int(os.getenv("CACHE_CLEANUP_MAX_AGE_DAYS", "7"))
-
-# (Удалено) Ранее были флаги SHOW_TOTAL_STATS / SHOW_RECENT_EXITS — больше не используются
+# Append every parsed event as JSONL for offline replay (python -m helpers.replay)
+EVENT_RECORD_PATH = os.getenv("EVENT_RECORD_PATH", "")
+_event_record_file = None
+# Signature → parsed transaction, shared by every wallet and chat
+TX_CACHE_SIZE = int(os.getenv("TX_CACHE_SIZE", "5000"))
+TX_CACHE_TTL_SECONDS = int(os.getenv("TX_CACHE_TTL_SECONDS", "900"))
+_parsed_tx_cache = TTLCache(maxsize=max(1, TX_CACHE_SIZE), ttl=max(1, TX_CACHE_TTL_SECONDS))
+_tx_inflight = {}
+ALERT_DEDUPE_TTL_SECONDS = int(os.getenv("ALERT_DEDUPE_TTL_SECONDS", "3600"))
+# Identical alerts (same token/side/window/participants) are built and published once
+_emitted_alerts = TTLCache(maxsize=10000, ttl=max(1, ALERT_DEDUPE_TTL_SECONDS))
+# (token, side) -> {chat_id: message_id} of the initial alert, for edit-in-place updates
+_alert_message_ids = TTLCache(maxsize=20000, ttl=max(1, ALERT_DEDUPE_TTL_SECONDS))
+# (Удалено) Ранее были флаги SHOW_TOTAL_STATS / SHOW_RECENT_EXITS / RECENT_EXITS_MAX — больше не используются
 # Они убраны из кода, чтобы сообщение было короче и стабильнее.
-RECENT_EXITS_MAX = int(os.getenv("RECENT_EXITS_MAX", "3"))
 
 # Если модуль SolanaTrackerBot найден — используем его RPC URL
 if ST_WALLET_TRACKER is not None:
@@ -93,23 +117,29 @@ if ST_WALLET_TRACKER is not None:
         pass
 
 # Multiple detection windows (minutes), earliest window wins
+def parse_windows(raw: str) -> list:
+    """'30s,1,5m' → sorted window lengths in seconds (bare numbers are minutes)."""
+    windows = []
+    for w in (w.strip() for w in raw.split(',')):
+        if not w:
+            continue
+        try:
+            wl = w.lower()
+            if wl.endswith('s'):
+                windows.append(max(1, int(wl[:-1])))
+            elif wl.endswith('m'):
+                windows.append(max(1, int(wl[:-1])) * 60)
+            else:
+                # Backward-compatible: bare numbers are minutes
+                windows.append(max(1, int(w)) * 60)
+        except ValueError:
+            continue
+    return sorted(set(windows))
+
 _raw_windows = [w.strip() for w in os.getenv("MULTI_WINDOWS", "1,5,10,30,60").split(',') if w.strip()]
-MULTI_WINDOWS_SECONDS = []
-for w in _raw_windows:
-    try:
-        wl = w.lower()
-        if wl.endswith('s'):
-            MULTI_WINDOWS_SECONDS.append(max(1, int(wl[:-1])))
-        elif wl.endswith('m'):
-            MULTI_WINDOWS_SECONDS.append(max(1, int(wl[:-1])) * 60)
-        else:
-            # Backward-compatible: bare numbers are minutes
-            MULTI_WINDOWS_SECONDS.append(max(1, int(w)) * 60)
-    except ValueError:
-        continue
+MULTI_WINDOWS_SECONDS = parse_windows(",".join(_raw_windows))
 if not MULTI_WINDOWS_SECONDS:
     MULTI_WINDOWS_SECONDS = [max(1, int(TIME_WINDOW_MINUTES)) * 60]
-MULTI_WINDOWS_SECONDS = sorted(set(MULTI_WINDOWS_SECONDS))
 
 # Store events up to this lookback horizon (minutes)
 # If not provided, derive from the largest detection window (in seconds) but at least 360 minutes.
@@ -136,10 +166,74 @@ def _to_float_token_amount(ui_token_amount: dict | None) -> float:
                 continue
     return 0.0
 
+# SOL / USDC / USDT legs are not "tokens" for multi-buy purposes
+IGNORED_MINTS = frozenset({
+    "So11111111111111111111111111111111111111112",
+    "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v",
+    "Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB",
+})
+
+def _implied_token_amount(changes: dict) -> float | None:
+    """Token delta to price the swap with, or None when the SOL delta is not its price.
+
+    Only for a single traded token paid in native SOL: with a second token or a
+    USDC/USDT/wSOL leg the wallet's SOL change is fees/rent, not what the token cost.
+    """
+    traded = [c for t, c in changes.items() if t not in IGNORED_MINTS and c]
+    if len(traded) != 1 or any(c for t, c in changes.items() if t in IGNORED_MINTS):
+        return None
+    return abs(traded[0])
+
+def parse_transaction(tx_data: dict) -> dict:
+    """Parse a getTransaction result once: token and SOL deltas for every owner in it."""
+    meta = tx_data.get('meta') or {}
+    token_changes = {}
+    for sign, key in ((-1, "preTokenBalances"), (1, "postTokenBalances")):
+        for balance in meta.get(key) or []:
+            owner = balance.get('owner')
+            if not owner:
+                continue
+            changes = token_changes.setdefault(owner, {})
+            mint = balance.get('mint')
+            changes[mint] = changes.get(mint, 0) + sign * _to_float_token_amount(balance.get('uiTokenAmount'))
+    account_keys = (tx_data.get('transaction') or {}).get('message', {}).get('accountKeys', [])
+    if account_keys and not isinstance(account_keys[0], dict):
+        # "json" encoding lists address-table lookups separately, after the static keys
+        loaded = meta.get('loadedAddresses') or {}
+        account_keys = list(account_keys) + list(loaded.get('writable') or []) + list(loaded.get('readonly') or [])
+    pre, post = meta.get('preBalances') or [], meta.get('postBalances') or []
+    sol_changes = {}
+    for idx, key in enumerate(account_keys):
+        pubkey = key.get('pubkey') if isinstance(key, dict) else key
+        if pubkey in sol_changes or idx >= len(pre) or idx >= len(post):
+            continue
+        sol_changes[pubkey] = (post[idx] - pre[idx]) / 1e9
+    return {
+        'block_time': tx_data.get('blockTime'),
+        'err': meta.get('err'),
+        'token_changes': token_changes,
+        'sol_changes': sol_changes,
+        'fetched_at': time.time(),
+        # raw payload is only needed by the per-tx debug feed
+        'raw': tx_data if SIMPLE_TX_FEED else None,
+    }
+
+def project_owner(parsed: dict, owner: str) -> tuple:
+    """({mint: token balance change}, SOL change) of one wallet from a parsed transaction."""
+    return dict(parsed['token_changes'].get(owner) or {}), parsed['sol_changes'].get(owner, 0.0)
+
+def wallet_token_changes(tx_data: dict, wallet_address: str) -> tuple:
+    """({mint: token balance change}, SOL change) of one wallet in a getTransaction result."""
+    return project_owner(parse_transaction(tx_data), wallet_address)
+
 # При старте модуля зафиксируем ключевые настройки
 dlog(f"ST_WALLET_TRACKER loaded: {bool(ST_WALLET_TRACKER)}; RPC={SOLANA_RPC_ENDPOINT}")
 dlog(f"MULTI_EVENT_THRESHOLD={MULTI_EVENT_THRESHOLD}, WINDOWS={os.getenv('MULTI_WINDOWS','1,5,10,30,60')}, MIN_CAP={MIN_MARKET_CAP}, MAX_CAP={MAX_MARKET_CAP}")
 dlog(f"WINDOWS_SECONDS={MULTI_WINDOWS_SECONDS}")
+dlog(f"JSON codec={jsoncodec.BACKEND} typed_tx={jsoncodec.typed_transactions_enabled()}")
+
+# Один TLS-контекст на все короткоживущие клиенты: каждый новый контекст грузит CA bundle (~30 мс блокировки loop)
+SSL_CONTEXT = httpx.create_ssl_context()
 
 # --- RPC rate limiting (serialize requests to avoid 429) ---
 RPC_SEMAPHORE = asyncio.Semaphore(int(os.getenv("RPC_CONCURRENCY", "2")))
@@ -147,88 +241,144 @@ WALLET_CONCURRENCY = int(os.getenv("WALLET_CONCURRENCY", "6"))
 RPC_DELAY_SECONDS = float(os.getenv("RPC_DELAY_SECONDS", "0.6"))
 RPC_JITTER_MAX = float(os.getenv("RPC_JITTER_MAX", "0.2"))
 
+def transaction_request(signature: str) -> dict:
+    return {
+        "jsonrpc": "2.0", "id": 1, "method": "getTransaction",
+        "params": [signature, {
+            "encoding": TX_ENCODING,
+            "commitment": READ_COMMITMENT,
+            "maxSupportedTransactionVersion": 0,
+        }]
+    }
+
 async def rpc_post(client: httpx.AsyncClient, payload: dict, timeout: float = 30.0):
+    method = payload.get("method", "unknown")
+    queued_at = perf_counter()
     async with RPC_SEMAPHORE:
-        response = await client.post(SOLANA_RPC_ENDPOINT, json=payload, timeout=timeout)
+        started = perf_counter()
+        metrics.RPC_QUEUE_WAIT.observe(started - queued_at, method=method)
+        try:
+            response = await client.post(SOLANA_RPC_ENDPOINT, json=payload, timeout=timeout)
+        except Exception:
+            metrics.RPC_REQUESTS.inc(method=method, status="error")
+            raise
+        finally:
+            metrics.RPC_LATENCY.observe(perf_counter() - started, method=method)
+        metrics.RPC_REQUESTS.inc(method=method, status=response.status_code)
+        metrics.RPC_RESPONSE_BYTES.inc(len(response.content), method=method)
         # small pacing to be nice to public endpoints + jitter to avoid thundering herd
         delay = max(0.0, RPC_DELAY_SECONDS) + (random.uniform(0, RPC_JITTER_MAX) if RPC_JITTER_MAX > 0 else 0)
         await asyncio.sleep(delay)
         return response
 
+def _decode_transaction_body(response: httpx.Response) -> dict | None:
+    """getTransaction result, decoded once; slim typed decode unless the per-tx feed needs instructions."""
+    if SIMPLE_TX_FEED:
+        return jsoncodec.loads(response.content).get('result')
+    return jsoncodec.decode_transaction_response(response.content).get('result')
+
+async def _fetch_transaction(client: httpx.AsyncClient, signature: str, wallet_name: str, context: str = "") -> dict | None:
+    """getTransaction result: local archive first, then SolanaTrackerBot, then direct RPC.
+    Freshly fetched payloads are captured into the archive (TX_ARCHIVE_DIR)."""
+    archive = await tx_archive.aget_archive()
+    if archive is not None:
+        tx_data = await archive.aget(signature)
+        if tx_data is not None:
+            return tx_data
+    tx_data = None
+    # 1) Если доступен модуль SolanaTrackerBot — используем его функцию
+    if ST_WALLET_TRACKER is not None:
+        try:
+            details = await ST_WALLET_TRACKER.get_transaction_details(signature)  # type: ignore
+            if isinstance(details, dict):
+                tx_data = details.get('result')
+        except Exception as e:
+            logger.warning(f"ST_WALLET_TRACKER.get_transaction_details{context} failed: {e}")
+    # 2) Фолбэк на прямой RPC
+    if tx_data is None:
+        tx_payload = transaction_request(signature)
+        tx_response = await rpc_post(client, tx_payload, timeout=30.0)
+        if tx_response.status_code == 429:
+            logger.warning(f"Rate limited on getTransaction{context} for {wallet_name}, skip sleep.")
+            return None
+        tx_data = _decode_transaction_body(tx_response)
+    if tx_data and archive is not None:
+        try:
+            await archive.aput(signature, tx_data)
+        except Exception as e:
+            dlog(f"tx archive write failed sig={signature}: {e}")
+    return tx_data
+
+async def get_parsed_transaction(client: httpx.AsyncClient, signature: str, wallet_name: str, context: str = "") -> dict | None:
+    """Parsed transaction for a signature, fetched at most once across wallets and chats.
+
+    Results live in a bounded TTL cache; concurrent callers for the same signature
+    wait on the first caller's fetch instead of issuing their own getTransaction.
+    """
+    parsed = _parsed_tx_cache.get(signature)
+    if parsed is not None:
+        metrics.TX_CACHE.inc(result="hit")
+        return parsed
+    pending = _tx_inflight.get(signature)
+    if pending is not None:
+        metrics.TX_CACHE.inc(result="inflight")
+        return await asyncio.shield(pending)
+    metrics.TX_CACHE.inc(result="miss")
+    future = asyncio.get_running_loop().create_future()
+    _tx_inflight[signature] = future
+    parsed = None
+    try:
+        tx_data = await _fetch_transaction(client, signature, wallet_name, context)
+        if tx_data and tx_data.get('blockTime'):
+            parsed = await processing.run(parse_transaction, tx_data)
+            _parsed_tx_cache[signature] = parsed
+    finally:
+        _tx_inflight.pop(signature, None)
+        # waiters get None on failure (429 / error) and simply skip the signature this cycle
+        future.set_result(parsed)
+    return parsed
+
 # --- In-memory Stores ---
 recent_events = {}
 # Structure: recent_events[token_addr] = {
 #   'buys': [{'wallet': address, 'amount': float, 'time': datetime, 'name': string}],
 #   'sells': [{'wallet': address, 'amount': float, 'time': datetime, 'name': string}]
-# }
+# }  (each side sorted by event time)
+# Parallel indexes kept by store_event()/clean_old_events():
+#   _event_times[token][side]   — sorted unix timestamps, so a window is one bisect
+#   _event_wallets[token][side] — wallets present (one event per wallet per side)
+_event_times = {}
+_event_wallets = {}
+# Optional NumPy mirror (EVENT_COLUMNS=1): vectorized window counts for passes with many candidates
+_columns = None
+if event_columns.EVENT_COLUMNS:
+    if event_columns.available():
+        _columns = event_columns.EventColumns()
+    else:
+        logger.warning("EVENT_COLUMNS=1 but numpy is not installed; using per-token window counts")
 notified_events = {}
-last_signatures = {} # Store last seen signature per wallet
+# Tokens whose events changed since the last detection pass; alerts can only fire on new
+# events, so detect_multi_events() looks at these plus tokens with a debounced update pending.
+_dirty_tokens = set()
+_pending_update_tokens = set()
+# minute of event time -> tokens with events in that minute; clean_old_events() only visits expiring tokens
+_expiry_buckets = {}
+# token -> buyers that belong to a known co-buy cluster (helpers/clusters.py), fed by store_event()
+_cluster_entries = {}
+# token -> stored events still without a cap (filled by _fill_caps once the token is interesting)
+_uncapped = {}
+_fill_inflight = {}
 
 # --- Notification Functions (remains the same) ---
-async def send_discord_message(message, chat_id: str | int = None, dedupe_key: str | None = None):
-    if not DISCORD_WEBHOOK_URL:
+def send_discord_message(message, thread_key=None, edit: bool = False) -> None:
+    """Hand the alert to the batching Discord sink (edit=True replaces the embed posted under thread_key)."""
+    sink = get_discord_sink(DISCORD_WEBHOOK_URL)
+    if sink is None:
         return
-    # Filter by allowed chat ids if set
-    try:
-        if DISCORD_ALLOWED_CHAT_IDS:
-            cid = str(chat_id) if chat_id is not None else None
-            if cid is None or cid not in DISCORD_ALLOWED_CHAT_IDS:
-                return
-    except Exception:
-        pass
-    # Dedupe
-    try:
-        if dedupe_key:
-            now = perf_counter()
-            ts = _discord_dedupe.get(dedupe_key)
-            if ts and (now - ts) < max(1, DISCORD_DEDUPE_TTL_SECONDS):
-                return
-            _discord_dedupe[dedupe_key] = now
-    except Exception:
-        pass
-    try:
-        async with httpx.AsyncClient() as client:
-            # Convert HTML-ish to Discord-friendly text
-            raw = str(message)
-            # Replace anchor tags with "Text: URL"
-            raw = re.sub(r'<a\s+href=\"([^\"]+)\">([^<]+)</a>', r'\2: \1', raw)
-            # Basic sanitization
-            discord_message = (
-                raw
-                .replace('\n\n', '\n')
-                .replace('<b>', '**').replace('</b>', '**')
-                .replace('<i>', '*').replace('</i>', '*')
-                .replace('<code>', '`').replace('</code>', '`')
-                .replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
-            )
-            lines = [l for l in discord_message.split('\n') if l.strip()]
-            title = lines[0][:256] if lines else "Multi Event"
-            description = "\n".join(lines[1:])[:4000] if len(lines) > 1 else ''
-            # Try to set embed.url to Dexscreener link
-            dex_url = None
-            m = re.search(r'https?://[^\s]*dexscreener\.com/\S+', discord_message)
-            if m:
-                dex_url = m.group(0)
-            payload = {
-                "embeds": [
-                    {
-                        "title": title,
-                        "description": description,
-                        "color": 0x00C853 if ('Buy' in title or '🔥' in title) else 0xD50000,
-                        **({"url": dex_url} if dex_url else {})
-                    }
-                ]
-            }
-            # Fallback to content if embeds not allowed
-            try:
-                resp = await client.post(DISCORD_WEBHOOK_URL, json=payload, timeout=10)
-                if resp.status_code >= 400:
-                    await client.post(DISCORD_WEBHOOK_URL, json={"content": discord_message}, timeout=10)
-            except Exception:
-                await client.post(DISCORD_WEBHOOK_URL, json={"content": discord_message}, timeout=10)
-        logger.info("Discord notification sent.")
-    except Exception as e:
-        logger.error(f"Failed to send Discord message: {e}")
+    if edit and thread_key is not None:
+        sink.edit(message, thread_key)
+    else:
+        sink.post(message, thread_key)
 
 
 # Helper to format window label nicely (supports seconds/minutes)
@@ -244,9 +394,30 @@ def _format_window_label(window_seconds: int) -> str:
     m, s = divmod(ws, 60)
     return f"≤{m}m" if s == 0 else f"≤{m}m{s}s"
 
-def format_notification(event_type: str, token_info: dict, participants: list, window_minutes: int, is_update: bool = False, total_participants: list | None = None, recent_exits: list | None = None) -> str:
+def window_stats(participants: list) -> dict:
+    """Aggregates of one window's participants: wallets, SOL sum and min/avg/max entry cap."""
+    caps = []
+    sol = 0.0
+    for p in participants:
+        sol += abs(p.get('amount') or 0.0)
+        try:
+            cv = float(p.get('cap') or 0)
+        except Exception:
+            cv = 0.0
+        if cv > 0:
+            caps.append(cv)
+    return {
+        'wallets': len(participants), 'sol': sol,
+        'cap_min': min(caps) if caps else None,
+        'cap_avg': sum(caps) / len(caps) if caps else None,
+        'cap_max': max(caps) if caps else None,
+    }
+
+def format_notification(event_type: str, token_info: dict, participants: list, window_minutes: int, is_update: bool = False, stats: dict | None = None) -> str:
     is_buy = "Buy" in event_type
-    if is_buy:
+    if "CLUSTER" in event_type:
+        title = "🧩 <b>Cluster Entry</b> 🧩"
+    elif is_buy:
         title = "📈 <b>Updates Multibuy Wallets</b> 📈" if is_update else "🔥 <b>Multi-Buy Alert</b> 🔥"
     else:
         title = "📉 <b>Updates Multisell Wallets</b> 📉" if is_update else "🚨 <b>Multi-Sell Alert</b> 🚨"
@@ -270,22 +441,16 @@ def format_notification(event_type: str, token_info: dict, participants: list, w
     pair_addr = str(token_info.get('pair_address', '')).strip()
     dex_href = f"https://dexscreener.com/solana/{(pair_addr or raw_addr)}"
 
-    # Window-only stats (current participants argument)
-    caps = []
-    for p in participants:
-        try:
-            cv = float(p.get('cap') or 0)
-        except Exception:
-            cv = 0.0
-        if cv > 0:
-            caps.append(cv)
+    # Window-only stats: precomputed by the detector (window_stats), or derived from participants
+    stats = stats or window_stats(participants)
     cap_line = None
-    if caps:
-        cmin = int(min(caps))
-        cavg = int(sum(caps) / len(caps))
-        cmax = int(max(caps))
+    if stats.get('cap_min') is not None:
         label = "Entry caps" if is_buy else "Exit caps"
-        cap_line = f"📊 <b>{label}:</b> min ${cmin:,} · avg ${cavg:,} · max ${cmax:,}"
+        cap_line = f"📊 <b>{label}:</b> min ${int(stats['cap_min']):,} · avg ${int(stats['cap_avg']):,} · max ${int(stats['cap_max']):,}"
+    score_line = f"⚖️ <b>Score:</b> {stats['score']:.1f}" if stats.get('score') is not None else None
+    cluster_line = None
+    if stats.get('cluster_affinity'):
+        cluster_line = f"🧩 <b>Cluster:</b> {stats['wallets']} wallets that co-entered ~{stats['cluster_affinity']:.1f} tokens together recently"
 
     # (Удалено) Total stats across lookback — больше не выводим
     # (Удалено) Recent exits/opposite-side info — больше не выводим
@@ -300,6 +465,8 @@ def format_notification(event_type: str, token_info: dict, participants: list, w
         f"🔎 <a href=\"https://kolscan.io/tokens\">Kolscan Tokens</a> · <a href=\"https://kolscan.io/trades\">Kolscan Trades</a> · <a href=\"https://kolscan.io/leaderboard\">Leaderboard</a>",
         f"💰 <b>Market Cap:</b> {html_escape(market_cap_str)}",
         cap_line,
+        score_line,
+        cluster_line,
         "",
         f"👛 <b>{participant_label}:</b>",
     ]
@@ -310,35 +477,92 @@ def format_notification(event_type: str, token_info: dict, participants: list, w
         short_addr = f"{w[:4]}...{w[-4:]}" if isinstance(w, str) and len(w) > 8 else w
         short_addr = html_escape(short_addr)
         lines.append(f"– {name} ({short_addr}): {amount_str} SOL")
-    return "\n".join([l for l in lines if l is not None and l != ""]) 
+    # Validate/escape against Telegram's HTML subset once, so the single HTML send always parses
+    return render_telegram_html("\n".join([l for l in lines if l is not None and l != ""]))
 
-async def send_notification(context: ContextTypes.DEFAULT_TYPE, message, chat_id: str):
+def _cast_chat_id(chat_id):
     # Приведение chat_id к int, если это строка из цифр
     try:
-        chat_id_cast = int(chat_id) if isinstance(chat_id, str) and chat_id.isdigit() else chat_id
+        return int(chat_id) if isinstance(chat_id, str) and chat_id.isdigit() else chat_id
     except Exception:
-        chat_id_cast = chat_id
-    try:
-        await context.bot.send_message(chat_id=chat_id_cast, text=message, parse_mode='HTML', disable_web_page_preview=True)
-        logger.info(f"Telegram notification sent to chat_id: {chat_id_cast} (HTML)")
-    except Exception as e:
-        logger.warning(f"HTML send failed, retrying MarkdownV2. Err: {e}")
-        try:
-            await context.bot.send_message(chat_id=chat_id_cast, text=message, parse_mode='MarkdownV2')
-            logger.info(f"Telegram notification (MarkdownV2) sent to chat_id: {chat_id_cast}")
-        except Exception as e2:
-            logger.warning(f"MarkdownV2 failed, retrying plain text. Err: {e2}")
-            try:
-                await context.bot.send_message(chat_id=chat_id_cast, text=message)
-                logger.info(f"Telegram notification (plain) sent to chat_id: {chat_id_cast}")
-            except Exception as e3:
-                logger.error(f"Failed to send Telegram message to {chat_id_cast}: {e3}")
-    # Discord forward with dedupe
+        return chat_id
+
+async def send_notification(context: ContextTypes.DEFAULT_TYPE, message, chat_id: str):
+    """Queue the alert for delivery; returns immediately so detection is never blocked by Telegram."""
+    chat_id_cast = _cast_chat_id(chat_id)
+    application = getattr(context, 'application', context)
+    queue = get_delivery_queue(application)
+    future = queue.submit(chat_id_cast, message, parse_mode='HTML', disable_web_page_preview=True)
+    dlog(f"Telegram notification queued for chat_id: {chat_id_cast} depth={queue.depth()}")
+    return future
+
+def _remember_message_id(thread_key: tuple, chat_id, future: asyncio.Future) -> None:
     try:
-        key = f"{chat_id}|" + (message.split('\n',1)[0] if isinstance(message, str) else "")
-        await send_discord_message(message, chat_id=str(chat_id_cast), dedupe_key=key)
+        msg = future.result()
     except Exception:
-        pass
+        return
+    if msg is not None and getattr(msg, 'message_id', None):
+        _alert_message_ids.setdefault(thread_key, {})[chat_id] = msg.message_id
+
+def _subscribed_chats(application) -> list:
+    """Chats with a running tracker receive every alert."""
+    tasks = getattr(application, "_runtime_tracking_tasks", {}) or {}
+    return [cid for cid, chat_tasks in tasks.items() if chat_tasks]
+
+async def _build_alert(kind: str, token_addr: str, side_label: str, window_seconds: int, participants: list, token_info: dict, extra_stats: dict | None = None) -> dict | None:
+    """Render an alert once; returns None if the identical alert was already emitted."""
+    key = (token_addr, side_label, kind, int(window_seconds or 0), frozenset(p['wallet'] for p in participants))
+    if key in _emitted_alerts:
+        return None
+    _emitted_alerts[key] = True
+    # UPDATE alerts are edits of the initial message, so they keep its title and show everyone
+    event_type = {'prealert': f"{side_label.title()} PRE-ALERT", 'cluster': f"{side_label.title()} CLUSTER"}.get(kind, side_label.title())
+    # aggregates over the shown participants only, computed once and reused by the renderer
+    stats = window_stats(participants)
+    stats.update(extra_stats or {})
+    # string building runs on the processing executor, off the event loop
+    message = await processing.run(format_notification, event_type, token_info, participants, window_seconds, stats=stats)
+    return {
+        'key': key, 'kind': kind, 'token': token_addr, 'side': side_label, 'window': window_seconds,
+        'participants': participants, 'stats': stats, 'token_info': token_info, 'message': message,
+        # token info was fetched right before rendering
+        'enriched_at': time.time(),
+    }
+
+async def publish_alert(application, alert: dict, chat_ids: list) -> None:
+    """Deliver one rendered alert to every subscribed chat and post it to Discord exactly once.
+
+    UPDATE alerts edit the chat's initial alert message (and the original Discord embed)
+    with the full participant list; chats that never got the initial alert get a new message.
+    """
+    thread_key = (alert['token'], alert['side'])
+    is_update = alert['kind'] == 'update'
+    metrics.ALERTS_TOTAL.inc(kind=alert['kind'], side=alert['side'])
+    # Latency from the newest triggering event being parsed to the alert being queued
+    seen = [p.get('seen_at') for p in alert['participants'] if p.get('seen_at')]
+    if seen:
+        metrics.PARSE_TO_ALERT.observe(max(0.0, time.time() - max(seen)), kind=alert['kind'])
+    trace = tracing.new_trace(alert)
+
+    def _on_delivered(f: asyncio.Future) -> None:
+        if not f.cancelled() and f.exception() is None and f.result() is not None:
+            tracing.mark_delivered(trace)
+    message_ids = _alert_message_ids.get(thread_key) or {}
+    queue = get_delivery_queue(application)
+    for chat_id in chat_ids:
+        chat_id_cast = _cast_chat_id(chat_id)
+        if is_update and chat_id_cast in message_ids:
+            queue.submit_edit(chat_id_cast, message_ids[chat_id_cast], alert['message'], parse_mode='HTML', disable_web_page_preview=True).add_done_callback(_on_delivered)
+            continue
+        future = await send_notification(application, alert['message'], chat_id)
+        future.add_done_callback(_on_delivered)
+        if alert['kind'] in ('initial', 'update'):
+            future.add_done_callback(lambda f, c=chat_id_cast: _remember_message_id(thread_key, c, f))
+    if DISCORD_WEBHOOK_URL and (not DISCORD_ALLOWED_CHAT_IDS or any(str(c) in DISCORD_ALLOWED_CHAT_IDS for c in chat_ids)):
+        if is_update:
+            send_discord_message(alert['message'], thread_key=thread_key, edit=True)
+        else:
+            send_discord_message(alert['message'], thread_key=thread_key if alert['kind'] == 'initial' else None)
 
 # --- Data Fetching & Analysis ---
 async def get_token_info(token_address):
@@ -349,17 +573,49 @@ async def get_token_info(token_address):
             ts = cached.get('ts', 0)
             data = cached.get('data') or {}
             if (perf_counter() - ts) < DEX_TTL_SECONDS and float(data.get('market_cap') or 0) > 0:
+                metrics.TOKEN_INFO_CACHE.inc(result="hit")
                 return data
     except Exception:
         pass
+    metrics.TOKEN_INFO_CACHE.inc(result="miss")
+
+    # Local price engine first: a recent parsed swap × supply gives the cap without any price API
+    local = await _local_token_info(token_address) if price_engine.PRICE_ENGINE_ENABLED else None
+    if local and local['symbol'] != 'N/A':
+        metrics.TOKEN_INFO_SOURCE.inc(source="trade")
+        return local
+    try:
+        result = await _external_token_info(token_address)
+    except Exception as e:
+        if not local:
+            raise
+        dlog(f"external token info failed token={token_address} err={e}, using trade price")
+        result = {"market_cap": 0.0}
+    if result["market_cap"] <= 0 and local:
+        # not indexed by the price APIs yet (fresh token): the trade-implied cap is all there is
+        metrics.TOKEN_INFO_SOURCE.inc(source="trade")
+        return local
+    metrics.TOKEN_INFO_SOURCE.inc(source="external")
+
+    # Cache only positive MC
+    try:
+        if result["market_cap"] > 0:
+            _token_info_cache[token_address] = {"ts": perf_counter(), "data": result}
+            price_engine.set_meta(token_address, result["symbol"], result["address"], result["pair_address"])
+            price_engine.set_supply(token_address, result["supply"])
+    except Exception:
+        pass
+    return result
 
-    tokens_url = f"https://api.dexscreener.com/latest/dex/tokens/{token_address}"
-    pairs_url = f"https://api.dexscreener.com/latest/dex/pairs/solana/{token_address}"
+async def _external_token_info(token_address: str) -> dict:
+    """Cap/price from Dexscreener, then Birdeye/Jupiter price × supply."""
+    tokens_url = f"{DEXSCREENER_API_BASE}/latest/dex/tokens/{token_address}"
+    pairs_url = f"{DEXSCREENER_API_BASE}/latest/dex/pairs/solana/{token_address}"
 
     default_headers = {"User-Agent": "multibuybot/1.0", "Accept": "application/json"}
 
     async def _fetch(url: str):
-        async with httpx.AsyncClient(headers=default_headers) as client:
+        async with httpx.AsyncClient(verify=SSL_CONTEXT, headers=default_headers) as client:
             resp = await client.get(url, timeout=10)
             dlog(f"DexScreener status={resp.status_code} for token={token_address} url={url}")
             if resp.status_code != 200:
@@ -388,29 +644,11 @@ async def get_token_info(token_address):
         return pairs_sorted[0]
 
     # RPC fallback for token supply
-    async def _get_token_supply_local(mint_address: str) -> float:
-        try:
-            async with httpx.AsyncClient(headers=default_headers) as client:
-                payload = {"jsonrpc": "2.0", "id": 1, "method": "getTokenSupply", "params": [mint_address]}
-                resp = await rpc_post(client, payload, timeout=15.0)
-            body = resp.json() if resp is not None else {}
-            value = (body.get('result') or {}).get('value') or {}
-            amount_raw = value.get('amount', '0')
-            decimals = int(value.get('decimals', 0) or 0)
-            amount_float = float(amount_raw or 0)
-            denom = float(10 ** max(decimals, 0))
-            supply = amount_float / denom if denom > 0 else 0.0
-            dlog(f"getTokenSupply {mint_address} -> {supply}")
-            return supply
-        except Exception as e:
-            dlog(f"getTokenSupply failed token={mint_address} err={e}")
-            return 0.0
-
     # 1) Try /tokens
     data = await _fetch(tokens_url)
     if not data or not data.get('pairs'):
         # Try chain-qualified tokens endpoint as well
-        data = await _fetch(f"https://api.dexscreener.com/latest/dex/tokens/solana/{token_address}")
+        data = await _fetch(f"{DEXSCREENER_API_BASE}/latest/dex/tokens/solana/{token_address}")
     if not data or not data.get('pairs'):
         # 2) fallback /pairs
         data = await _fetch(pairs_url)
@@ -456,7 +694,7 @@ async def get_token_info(token_address):
             # If still no MC, try price * supply (first with Dex price, later with Birdeye/Jupiter fallback)
             if market_cap <= 0 and price_usd > 0:
                 mint_addr = address
-                supply_used = await _get_token_supply_local(mint_addr)
+                supply_used = await get_token_supply(mint_addr)
                 if supply_used > 0:
                     market_cap = price_usd * supply_used
                     dlog(f"fallback MC via price*supply: price={price_usd}, supply={supply_used}, mc={market_cap}")
@@ -468,9 +706,9 @@ async def get_token_info(token_address):
         if BIRDEYE_API_KEY:
             try:
                 birdeye_headers = {**default_headers, "x-chain": "solana", "X-API-KEY": BIRDEYE_API_KEY}
-                async with httpx.AsyncClient(headers=birdeye_headers) as client:
+                async with httpx.AsyncClient(verify=SSL_CONTEXT, headers=birdeye_headers) as client:
                     r = await client.get(
-                        f"https://public-api.birdeye.so/defi/price?address={mint_for_price}",
+                        f"{BIRDEYE_API_BASE}/defi/price?address={mint_for_price}",
                         timeout=10
                     )
                 if r.status_code == 200:
@@ -483,9 +721,9 @@ async def get_token_info(token_address):
         # Jupiter final fallback
         if fallback_price <= 0:
             try:
-                async with httpx.AsyncClient(headers=default_headers) as client:
+                async with httpx.AsyncClient(verify=SSL_CONTEXT, headers=default_headers) as client:
                     rj = await client.get(
-                        f"https://price.jup.ag/v4/price?ids={mint_for_price}", timeout=10
+                        f"{JUPITER_PRICE_API_BASE}/v4/price?ids={mint_for_price}", timeout=10
                     )
                 if rj.status_code == 200:
                     j = rj.json() or {}
@@ -497,7 +735,7 @@ async def get_token_info(token_address):
                 dlog(f"Jupiter price fetch failed token={mint_for_price} err={e}")
         if fallback_price > 0:
             if supply_used <= 0:
-                supply_used = await _get_token_supply_local(mint_for_price)
+                supply_used = await get_token_supply(mint_for_price)
             if supply_used > 0:
                 market_cap = fallback_price * supply_used
                 if price_usd <= 0:
@@ -506,20 +744,61 @@ async def get_token_info(token_address):
 
     dlog(f"[MC] token={token_address} symbol={symbol} dex_mc={dex_mc} fdv={fdv} price_usd={price_usd} supply={supply_used} final_mc={market_cap}")
 
+    if supply_used <= 0 and market_cap > 0 and price_usd > 0:
+        supply_used = market_cap / price_usd
     result = {
         "market_cap": float(market_cap or 0),
         "symbol": symbol,
         "address": address,
         "pair_address": pair_address,
+        "price_usd": float(price_usd or 0),
+        "supply": float(supply_used or 0),
     }
+    return result
 
-    # Cache only positive MC
+async def _local_token_info(token_address: str) -> dict | None:
+    """get_token_info() result from the last trades seen by the bot, None without a recent trade."""
+    price_sol = price_engine.last_price_sol(token_address)
+    if price_sol is None:
+        return None
+    sol_usd = await _get_sol_price_usd()
+    supply = await get_token_supply(token_address) if sol_usd > 0 else 0.0
+    market_cap = price_engine.market_cap(price_sol, sol_usd, supply)
+    if market_cap <= 0:
+        return None
+    meta = price_engine.get_meta(token_address) or {}
+    dlog(f"[MC local] token={token_address} price_sol={price_sol} sol_usd={sol_usd} supply={supply} mc={market_cap}")
+    return {
+        "market_cap": market_cap,
+        "symbol": meta.get('symbol', 'N/A'),
+        "address": meta.get('address', token_address),
+        "pair_address": meta.get('pair_address', ''),
+        "price_usd": price_sol * sol_usd,
+        "supply": supply,
+    }
+
+async def get_token_supply(mint_address: str) -> float:
+    """Token supply in UI units (getTokenSupply), cached by the price engine; 0.0 on failure."""
+    cached = price_engine.get_supply(mint_address)
+    if cached:
+        return cached
     try:
-        if result["market_cap"] > 0:
-            _token_info_cache[token_address] = {"ts": perf_counter(), "data": result}
-    except Exception:
-        pass
-    return result
+        async with httpx.AsyncClient(verify=SSL_CONTEXT) as client:
+            payload = {"jsonrpc": "2.0", "id": 1, "method": "getTokenSupply", "params": [mint_address]}
+            resp = await rpc_post(client, payload, timeout=15.0)
+        body = jsoncodec.loads(resp.content) if resp is not None else {}
+        value = (body.get('result') or {}).get('value') or {}
+        amount_raw = value.get('amount', '0')
+        decimals = int(value.get('decimals', 0) or 0)
+        amount_float = float(amount_raw or 0)
+        denom = float(10 ** max(decimals, 0))
+        supply = amount_float / denom if denom > 0 else 0.0
+        dlog(f"getTokenSupply {mint_address} -> {supply}")
+        price_engine.set_supply(mint_address, supply)
+        return supply
+    except Exception as e:
+        dlog(f"getTokenSupply failed token={mint_address} err={e}")
+        return 0.0
 
 async def _get_sol_price_usd() -> float:
     now = perf_counter()
@@ -531,8 +810,8 @@ async def _get_sol_price_usd() -> float:
     price = 0.0
     # Try Dexscreener price for SOL mint
     try:
-        async with httpx.AsyncClient() as client:
-            r = await client.get("https://api.dexscreener.com/latest/dex/tokens/So11111111111111111111111111111111111111112", timeout=10)
+        async with httpx.AsyncClient(verify=SSL_CONTEXT) as client:
+            r = await client.get(f"{DEXSCREENER_API_BASE}/latest/dex/tokens/So11111111111111111111111111111111111111112", timeout=10)
             if r.status_code == 200:
                 data = r.json() or {}
                 pairs = data.get("pairs") or []
@@ -547,9 +826,9 @@ async def _get_sol_price_usd() -> float:
     if price <= 0 and BIRDEYE_API_KEY:
         try:
             headers = {"x-chain": "solana", "X-API-KEY": BIRDEYE_API_KEY}
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(verify=SSL_CONTEXT) as client:
                 r = await client.get(
-                    "https://public-api.birdeye.so/defi/price?address=So11111111111111111111111111111111111111112",
+                    f"{BIRDEYE_API_BASE}/defi/price?address=So11111111111111111111111111111111111111112",
                     headers=headers, timeout=10
                 )
                 if r.status_code == 200:
@@ -573,230 +852,328 @@ def _cap_ok(market_cap: float) -> bool:
         return False
     return True
 
-async def analyze_and_store_transactions(wallets_to_track):
+async def _record_event(token_addr: str, side_key: str, wallet_address: str, wallet_name: str, amount: float, event_time: datetime, log: bool = False, discovered_at: float | None = None, fetched_at: float | None = None, token_amount: float | None = None) -> bool:
+    """Store one buy/sell in recent_events (one entry per wallet per side); caps are filled in stages.
+
+    discovered_at/fetched_at (unix seconds) feed the per-alert latency trace. token_amount is the
+    token delta of the swap; with the SOL amount it gives the implied price used for the entry cap.
     """
-    Fetches latest transactions wallet by wallet with delays, mimicking the original SolanaTrackerBot
-    to ensure maximum reliability and avoid rate limits.
+    if _has_event(token_addr, side_key, wallet_address):
+        return False
+    if log:
+        logger.info(f"{'BUY' if side_key == 'buys' else 'SELL'} EVENT: {wallet_name} {'bought' if side_key == 'buys' else 'sold'} {token_addr}")
+    price_sol = price_engine.implied_price_sol(amount, token_amount)
+    price_engine.record_trade(token_addr, price_sol, event_time.timestamp())
+    stored = store_event(token_addr, side_key, wallet_address, wallet_name, amount, event_time, None,
+                         seen_at=time.time(), discovered_at=discovered_at, fetched_at=fetched_at, price_sol=price_sol)
+    if not stored:
+        return False
+    # Most tokens never get a second wallet: no Dexscreener/RPC lookup until this side is interesting
+    if ENRICH_INTEREST_THRESHOLD <= 0 or window_count(token_addr, side_key, MAX_LOOKBACK_MINUTES * 60, time.time()) >= ENRICH_INTEREST_THRESHOLD:
+        await _fill_caps_once(token_addr)
+    else:
+        metrics.ENRICH_DEFERRED.inc()
+    if EVENT_RECORD_PATH:
+        event = next((e for e in reversed(recent_events.get(token_addr, {}).get(side_key, [])) if e['wallet'] == wallet_address), {})
+        _append_event_record(token_addr, side_key, wallet_address, wallet_name, amount, event_time, event.get('cap'))
+    return True
+
+async def _fill_caps_once(token_addr: str) -> None:
+    """Run _fill_caps for the token, sharing one in-flight run between concurrent events."""
+    task = _fill_inflight.get(token_addr)
+    if task is None:
+        task = asyncio.ensure_future(_fill_caps(token_addr))
+        _fill_inflight[token_addr] = task
+        task.add_done_callback(lambda _t: _fill_inflight.pop(token_addr, None))
+    try:
+        left = await asyncio.shield(task)
+        if len(_uncapped.get(token_addr) or ()) > len(left):
+            # events stored while the shared run was already past its pass
+            await _fill_caps(token_addr)
+    except Exception as e:
+        # caps stay queued in _uncapped; the token's next event retries
+        dlog(f"cap fill failed token={token_addr} err={e}")
+
+async def _fill_caps(token_addr: str) -> list:
+    """Backfill the caps of the token's stored events; returns the ones still without a cap.
+
+    Implied swap price (SOL per token) × SOL/USD × supply, so every event gets the cap at its
+    own entry; the current cap (get_token_info) for events without a token amount. The supply
+    is cached by the price engine, so later events cost no lookup. Events neither source
+    could price go back to _uncapped for the next attempt.
     """
-    async with httpx.AsyncClient() as client:
-        for wallet in wallets_to_track:
-            try:
-                dlog(f"Analyze wallet={wallet['name']} {wallet['address']}")
-                # 1. Get latest signature for the wallet
-                payload = {
-                    "jsonrpc": "2.0", "id": 1, "method": "getSignaturesForAddress",
-                    "params": [wallet['address'], {"limit": 1}] # Only need the most recent one
-                }
-                response = await rpc_post(client, payload, timeout=20)
-                dlog(f"getSignaturesForAddress status={response.status_code} wallet={wallet['name']}")
-                
-                # Gently handle 429 errors by just skipping this cycle for this wallet
-                if response.status_code == 429:
-                    logger.warning(f"Rate limited for {wallet['name']}. Skipping this cycle.")
-                    await asyncio.sleep(2) # Extra wait time
-                    continue
-                response.raise_for_status()
-
-                body = {}
-                try:
-                    body = response.json()
-                except Exception:
-                    body = {}
-                # Fallback to legacy method if needed
-                if isinstance(body.get('error'), dict) and 'method not found' in str(body['error'].get('message','')).lower():
-                    payload = {
-                        "jsonrpc": "2.0", "id": 1, "method": "getConfirmedSignaturesForAddress2",
-                        "params": [wallet['address'], {"limit": 1}]
-                    }
-                    response = await rpc_post(client, payload, timeout=20)
-                    if response.status_code == 429:
-                        logger.warning(f"Rate limited (fallback) for {wallet['name']}. Skipping.")
-                        await asyncio.sleep(2)
-                        continue
-                    response.raise_for_status()
-                    body = response.json()
-
-                signatures_data = body.get('result', [])
-                dlog(f"signatures count={len(signatures_data)} wallet={wallet['name']}")
-                if not signatures_data:
-                    continue
-
-                latest_signature = signatures_data[0]['signature']
-                if last_signatures.get(wallet['address']) == latest_signature:
-                    continue # No new transactions
-                last_signatures[wallet['address']] = latest_signature
-
-                # 2. Get the full transaction details
-                tx_payload = {
-                    "jsonrpc": "2.0", "id": 1, "method": "getTransaction",
-                    "params": [latest_signature, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}]
-                }
-                tx_data = None
-                # 2a) Попробовать через SolanaTrackerBot (TTL cache)
-                if ST_WALLET_TRACKER is not None:
-                    try:
-                        details = await ST_WALLET_TRACKER.get_transaction_details(latest_signature)  # type: ignore
-                        if isinstance(details, dict):
-                            tx_data = details.get('result')
-                    except Exception as e:
-                        logger.warning(f"ST_WALLET_TRACKER.get_transaction_details failed: {e}")
-                # 2b) Фолбэк: прямой RPC
-                if tx_data is None:
-                    tx_response = await rpc_post(client, tx_payload, timeout=20)
-                    dlog(f"getTransaction status={tx_response.status_code} sig={latest_signature}")
-                    if tx_response.status_code == 429:
-                        logger.warning(f"Rate limited getting tx details for {wallet['name']}. Skipping.")
-                        await asyncio.sleep(2)
-                        continue
-                    tx_response.raise_for_status()
-                    tx_data = tx_response.json().get('result')
-                if not tx_data: continue
-
-                # 3. Process the transaction (use wallet index for SOL change)
-                pre_balances = tx_data.get("meta", {}).get("preTokenBalances", [])
-                post_balances = tx_data.get("meta", {}).get("postTokenBalances", [])
-                changes = {}
-                for balance in pre_balances:
-                    if balance.get('owner') == wallet['address']:
-                        addr = balance.get('mint')
-                        changes[addr] = changes.get(addr, 0) - _to_float_token_amount(balance.get('uiTokenAmount'))
-                for balance in post_balances:
-                    if balance.get('owner') == wallet['address']:
-                        addr = balance.get('mint')
-                        changes[addr] = changes.get(addr, 0) + _to_float_token_amount(balance.get('uiTokenAmount'))
-                # Compute SOL delta for this wallet to classify buy/sell
-                meta = tx_data.get('meta', {})
-                account_keys = tx_data.get('transaction', {}).get('message', {}).get('accountKeys', [])
-                pubkeys = [k.get('pubkey') if isinstance(k, dict) else k for k in account_keys]
-                sol_change = 0.0
-                if pubkeys and wallet['address'] in pubkeys:
-                    idx = pubkeys.index(wallet['address'])
-                    try:
-                        sol_change = (meta.get('postBalances', [0]*len(pubkeys))[idx] - meta.get('preBalances', [0]*len(pubkeys))[idx]) / 1e9
-                    except Exception:
-                        sol_change = 0.0
-                dlog(f"tx sig={latest_signature} sol_change={sol_change}")
-                event_time = datetime.fromtimestamp(tx_data.get('blockTime'), tz=timezone.utc)
-                if datetime.now(timezone.utc) - event_time > timedelta(minutes=MAX_LOOKBACK_MINUTES):
-                    continue
-                if sol_change < 0:
-                    for token_addr, change in changes.items():
-                        if change > 0 and token_addr != "So11111111111111111111111111111111111111112":
-                            recent_events.setdefault(token_addr, {"buys": [], "sells": []})
-                            if not any(e['wallet'] == wallet['address'] for e in recent_events[token_addr]['buys']):
-                                logger.info(f"New BUY: {wallet['name']} bought {token_addr}")
-                                # Снимок капы на момент события
-                                try:
-                                    token_info_snapshot = await get_token_info(token_addr)
-                                    cap_snapshot = token_info_snapshot.get('market_cap') if token_info_snapshot else None
-                                except Exception:
-                                    cap_snapshot = None
-                                recent_events[token_addr]['buys'].append({"wallet": wallet['address'], "amount": abs(sol_change), "time": event_time, "name": wallet['name'], "cap": cap_snapshot})
-                elif sol_change > 0:
-                    for token_addr, change in changes.items():
-                        if change < 0 and token_addr != "So11111111111111111111111111111111111111112":
-                            recent_events.setdefault(token_addr, {"buys": [], "sells": []})
-                            if not any(e['wallet'] == wallet['address'] for e in recent_events[token_addr]['sells']):
-                                logger.info(f"New SELL: {wallet['name']} sold {token_addr}")
-                                try:
-                                    token_info_snapshot = await get_token_info(token_addr)
-                                    cap_snapshot = token_info_snapshot.get('market_cap') if token_info_snapshot else None
-                                except Exception:
-                                    cap_snapshot = None
-                                recent_events[token_addr]['sells'].append({"wallet": wallet['address'], "amount": sol_change, "time": event_time, "name": wallet['name'], "cap": cap_snapshot})
-            except httpx.HTTPStatusError as e:
-                logger.warning(f"HTTP error for {wallet['name']}: {e}") # Log as warning, don't crash
-            except Exception as e:
-                logger.error(f"Error processing wallet {wallet['name']}: {e}", exc_info=True)
-            
-            await asyncio.sleep(1) # Small delay between each wallet to be respectful to the API
+    pending = _uncapped.get(token_addr)
+    if not pending:
+        return []
+    supply = await get_token_supply(token_addr)
+    sol_usd = await _get_sol_price_usd() if supply else 0.0
+    current_cap = 0.0
+    if not supply or any(not e.get('price_sol') for e in pending):
+        token_info = await get_token_info(token_addr)
+        current_cap = float((token_info or {}).get('market_cap') or 0)
+    pending = _uncapped.pop(token_addr, [])
+    for event in pending:
+        if event.get('price_sol') and supply > 0 and sol_usd > 0:
+            event['cap'] = event['price_sol'] * sol_usd * supply
+            metrics.CAP_FILLS.inc(source="implied")
+        elif current_cap > 0:
+            event['cap'] = current_cap
+            metrics.CAP_FILLS.inc(source="snapshot")
+    left = [e for e in pending if e.get('cap') is None]
+    if left and token_addr in recent_events:
+        _uncapped.setdefault(token_addr, [])[:0] = left
+    return left
+
+def _append_event_record(token_addr, side_key, wallet_address, wallet_name, amount, event_time, cap) -> None:
+    """Append the event to EVENT_RECORD_PATH in the helpers.replay JSONL format."""
+    global _event_record_file
+    try:
+        if _event_record_file is None:
+            _event_record_file = open(EVENT_RECORD_PATH, 'a', encoding='utf-8', buffering=1)
+        _event_record_file.write(jsoncodec.dumps({
+            "ts": event_time.timestamp(), "token": token_addr, "side": 'buy' if side_key == 'buys' else 'sell',
+            "wallet": wallet_address, "name": wallet_name, "sol": amount, "cap": cap,
+        }) + "\n")
+    except Exception as e:
+        dlog(f"event record write failed: {e}")
+
+def window_participants(token_addr: str, side_key: str, seconds: float, now_ts: float) -> list:
+    """Events of one side within the last `seconds` (a slice of the time-sorted list)."""
+    times = _event_times.get(token_addr, {}).get(side_key)
+    if not times:
+        return []
+    return recent_events[token_addr][side_key][bisect_left(times, now_ts - seconds):]
+
+def window_count(token_addr: str, side_key: str, seconds: float, now_ts: float) -> int:
+    """Unique wallets of one side within the last `seconds` — O(log n), nothing is copied."""
+    times = _event_times.get(token_addr, {}).get(side_key)
+    return len(times) - bisect_left(times, now_ts - seconds) if times else 0
+
+def _has_event(token_addr: str, side_key: str, wallet_address: str) -> bool:
+    wallets = _event_wallets.get(token_addr)
+    return bool(wallets) and wallet_address in wallets[side_key]
+
+def store_event(token_addr: str, side_key: str, wallet_address: str, wallet_name: str, amount: float, event_time: datetime, cap: float | None = None, **fields) -> bool:
+    """Insert an already-parsed event (no I/O) in time order and mark the token for the next detection pass."""
+    wallets = _event_wallets.setdefault(token_addr, {"buys": set(), "sells": set()})[side_key]
+    if wallet_address in wallets:
+        return False
+    wallets.add(wallet_address)
+    side_events = recent_events.setdefault(token_addr, {"buys": [], "sells": []})[side_key]
+    times = _event_times.setdefault(token_addr, {"buys": [], "sells": []})[side_key]
+    ts = event_time.timestamp()
+    idx = bisect_right(times, ts)  # almost always the end: events arrive roughly in order
+    times.insert(idx, ts)
+    event = {"wallet": wallet_address, "amount": amount, "time": event_time, "name": wallet_name, "cap": cap, **fields}
+    side_events.insert(idx, event)
+    if cap is None:
+        _uncapped.setdefault(token_addr, []).append(event)
+    if _columns is not None:
+        _columns.append(token_addr, side_key, wallet_address, ts)
+    scoring.add_event(token_addr, side_key, wallet_address, amount, ts)
+    if side_key == 'buys' and clusters.CLUSTER_ALERTS:
+        _observe_cluster(token_addr, wallet_address, side_events, times, ts)
+    _dirty_tokens.add(token_addr)
+    _expiry_buckets.setdefault(int(event_time.timestamp() // 60), set()).add(token_addr)
+    return True
 
-async def clean_old_events():
-    now = datetime.now(timezone.utc)
+def _observe_cluster(token_addr: str, wallet_address: str, side_events: list, times: list, ts: float) -> None:
+    """Pair the buy with co-buyers of the token around ts; remember members of known clusters."""
+    span = clusters.CLUSTER_PAIR_WINDOW_SECONDS
+    lo, hi = bisect_left(times, ts - span), bisect_right(times, ts + span)
+    partners = [e['wallet'] for e in side_events[lo:hi] if e['wallet'] != wallet_address]
+    hits = clusters.get_index().observe(wallet_address, partners, ts)
+    if hits:
+        members = _cluster_entries.setdefault(token_addr, set())
+        members.add(wallet_address)
+        members.update(hits)
+
+async def clean_old_events(now: datetime | None = None):
+    now = now or datetime.now(timezone.utc)
     retention = timedelta(minutes=MAX_LOOKBACK_MINUTES)
-    for token_addr, events in list(recent_events.items()):
-        events['buys'] = [e for e in events['buys'] if now - e['time'] <= retention]
-        events['sells'] = [e for e in events['sells'] if now - e['time'] <= retention]
+    # Only tokens with an event in a fully expired minute can have something to drop
+    cutoff_bucket = int((now - retention).timestamp() // 60)
+    expiring = set()
+    for bucket in [b for b in _expiry_buckets if b < cutoff_bucket]:
+        expiring |= _expiry_buckets.pop(bucket)
+    cutoff_ts = (now - retention).timestamp()
+    if _columns is not None:
+        _columns.expire(cutoff_ts)
+    for token_addr in expiring:
+        events = recent_events.get(token_addr)
+        if not events:
+            continue
+        for side_key in ('buys', 'sells'):
+            times = _event_times[token_addr][side_key]
+            drop = bisect_left(times, cutoff_ts)
+            if drop:
+                _event_wallets[token_addr][side_key].difference_update(e['wallet'] for e in events[side_key][:drop])
+                del events[side_key][:drop]
+                del times[:drop]
         if not events['buys'] and not events['sells']:
             del recent_events[token_addr]
-
-async def check_for_multi_events(context: ContextTypes.DEFAULT_TYPE, chat_id: str):
-    now = datetime.now(timezone.utc)
-    windows_sorted = MULTI_WINDOWS_SECONDS
-    for token_addr, events in list(recent_events.items()):
-        # Prepare notification state for this token
-        state = notified_events.setdefault(token_addr, {
-            'buy': {'wallets': set(), 'windows': set(), 'prealert': False},
-            'sell': {'wallets': set(), 'windows': set(), 'prealert': False},
-        })
-
-        # Helper to handle one side (buy or sell)
-        for side_key in ('buys', 'sells'):
-            side_label = 'buy' if side_key == 'buys' else 'sell'
-            participants_all = [e for e in events.get(side_key, []) if now - e['time'] <= timedelta(minutes=MAX_LOOKBACK_MINUTES)]
-            wallets_all = {p['wallet'] for p in participants_all}
-            dlog(f"token={token_addr} side={side_label} total={len(wallets_all)} within lookback")
-
-            # Pre-alert: ранний сигнал при достижении 2+ уникальных кошельков (по умолчанию)
-            if ENABLE_PREALERT and not state[side_label]['windows'] and not state[side_label].get('prealert', False):
-                for w in windows_sorted:
-                    window_participants = [p for p in events.get(side_key, []) if now - p['time'] <= timedelta(seconds=w)]
-                    unique_wallets = {p['wallet'] for p in window_participants}
-                    if len(unique_wallets) >= PREALERT_THRESHOLD:
-                        try:
-                            token_info = await get_token_info(token_addr)
-                        except Exception:
-                            token_info = {"market_cap": 0.0, "symbol": "N/A", "address": token_addr}
-                        # Opposite side in lookback for context
-                        opposite = 'sells' if side_key == 'buys' else 'buys'
-                        recent_exits = [p for p in events.get(opposite, []) if now - p['time'] <= timedelta(minutes=MAX_LOOKBACK_MINUTES)]
-                        msg = format_notification(
-                            f"{side_label.title()} PRE-ALERT", token_info, window_participants, w, is_update=False,
-                            total_participants=[p for p in events.get(side_key, []) if now - p['time'] <= timedelta(minutes=MAX_LOOKBACK_MINUTES)],
-                            recent_exits=recent_exits
-                        )
-                        await send_notification(context, msg, chat_id)
-                        state[side_label]['prealert'] = True
+            del _event_times[token_addr]
+            del _event_wallets[token_addr]
+            _cluster_entries.pop(token_addr, None)
+            _uncapped.pop(token_addr, None)
+            scoring.forget(token_addr)
+
+def _cluster_affinity(members: set, now_ts: float) -> float:
+    """Mean pairwise affinity (≈ tokens co-entered recently) within a cluster."""
+    index = clusters.get_index()
+    ordered = sorted(members)
+    pairs = [index.affinity(a, b, now_ts) for i, a in enumerate(ordered) for b in ordered[i + 1:]]
+    return sum(pairs) / len(pairs) if pairs else 0.0
+
+async def _detect_token(token_addr: str, now: datetime, now_ts: float, lookback: float, count, enrich, alerts: list) -> None:
+    """One token of a detection pass; fired alerts are appended to alerts."""
+    events = recent_events.get(token_addr)
+    if not events:
+        _pending_update_tokens.discard(token_addr)
+        return
+    # Prepare notification state for this token
+    state = notified_events.setdefault(token_addr, {
+        'buy': {'wallets': set(), 'windows': set(), 'prealert': False},
+        'sell': {'wallets': set(), 'windows': set(), 'prealert': False},
+    })
+
+    # Cluster entry: members of a known co-buy cluster are entering — fires before the wallet threshold
+    # and takes the place of the buy pre-alert (same early stage, same score gate)
+    members = _cluster_entries.get(token_addr)
+    if (members and len(members) >= clusters.CLUSTER_MIN_WALLETS
+            and not state['buy']['windows'] and not state['buy'].get('cluster')):
+        buy_score = scoring.score(token_addr, 'buys', now_ts)
+        if buy_score < scoring.PREALERT_SCORE_THRESHOLD:
+            metrics.SCORE_GATED.inc(side='buy')
+            dlog(f"[SCORE] token={token_addr} cluster score={buy_score:.2f} < {scoring.PREALERT_SCORE_THRESHOLD}")
+        else:
+            token_info = await enrich(token_addr)
+            if token_info and _cap_ok(token_info.get('market_cap', 0)):
+                span = clusters.CLUSTER_PAIR_WINDOW_SECONDS
+                participants = [e for e in window_participants(token_addr, 'buys', span, now_ts) if e['wallet'] in members]
+                if len(participants) >= clusters.CLUSTER_MIN_WALLETS:
+                    stats = {'cluster_affinity': _cluster_affinity(members, now_ts)}
+                    if scoring.MULTI_SCORE_THRESHOLD > 0:
+                        stats['score'] = buy_score
+                    alert = await _build_alert('cluster', token_addr, 'buy', span, participants, token_info, extra_stats=stats)
+                    if alert:
+                        alerts.append(alert)
+                    state['buy']['cluster'] = True
+                    state['buy']['prealert'] = True
+            else:
+                _dirty_tokens.add(token_addr)
+
+    # Helper to handle one side (buy or sell). Windows are counted by bisecting the
+    # sorted timestamps; participant lists are sliced only for an alert that fires.
+    for side_key in ('buys', 'sells'):
+        side_label = 'buy' if side_key == 'buys' else 'sell'
+        side_score = scoring.score(token_addr, side_key, now_ts)
+        score_stats = {'score': side_score} if scoring.MULTI_SCORE_THRESHOLD > 0 else None
+        dlog(f"token={token_addr} side={side_label} total={window_count(token_addr, side_key, lookback, now_ts)} within lookback score={side_score:.2f}")
+
+        # Pre-alert: ранний сигнал при достижении 2+ уникальных кошельков (по умолчанию)
+        if (ENABLE_PREALERT and not state[side_label]['windows'] and not state[side_label].get('prealert', False)
+                and side_score >= scoring.PREALERT_SCORE_THRESHOLD):
+            for w in MULTI_WINDOWS_SECONDS:
+                if count(token_addr, side_key, w, now_ts) >= PREALERT_THRESHOLD:
+                    try:
+                        token_info = await enrich(token_addr)
+                    except Exception:
+                        token_info = {"market_cap": 0.0, "symbol": "N/A", "address": token_addr}
+                    alert = await _build_alert(
+                        'prealert', token_addr, side_label, w, window_participants(token_addr, side_key, w, now_ts), token_info,
+                        extra_stats=score_stats
+                    )
+                    if alert:
+                        alerts.append(alert)
+                    state[side_label]['prealert'] = True
+                    break
+
+        # Updates: new wallets joined after initial alert. Joins are debounced here —
+        # the edit goes out once joins pause for UPDATE_DEBOUNCE_SECONDS (or after UPDATE_MAX_DELAY_SECONDS).
+        if ENABLE_UPDATES and state[side_label]['windows']:
+            side_state = state[side_label]
+            participants_all = window_participants(token_addr, side_key, lookback, now_ts)
+            new_wallets = {p['wallet'] for p in participants_all} - side_state['wallets']
+            if new_wallets:
+                side_state['wallets'].update(new_wallets)
+                side_state['last_join'] = now
+                side_state['pending_since'] = side_state.get('pending_since') or now
+                _pending_update_tokens.add(token_addr)
+            pending_since = side_state.get('pending_since')
+            if pending_since and (
+                (now - side_state['last_join']).total_seconds() >= UPDATE_DEBOUNCE_SECONDS
+                or (now - pending_since).total_seconds() >= UPDATE_MAX_DELAY_SECONDS
+            ):
+                # enrich first: if it raises, the update stays pending and is retried next pass
+                token_info = await enrich(token_addr)
+                side_state['pending_since'] = None
+                if not state['buy' if side_label == 'sell' else 'sell'].get('pending_since'):
+                    _pending_update_tokens.discard(token_addr)
+                if token_info and _cap_ok(token_info.get('market_cap', 0)):
+                    alert = await _build_alert(
+                        'update', token_addr, side_label, min(side_state['windows']), participants_all, token_info
+                    )
+                    if alert:
+                        alerts.append(alert)
+
+        # Initial detection: earliest window only
+        if not state[side_label]['windows']:
+            for w in MULTI_WINDOWS_SECONDS:
+                unique = count(token_addr, side_key, w, now_ts)
+                dlog(f"[WINDOW] token={token_addr} side={side_label} w={w} unique={unique}")
+                if unique >= MULTI_EVENT_THRESHOLD:
+                    if side_score < scoring.MULTI_SCORE_THRESHOLD:
+                        # enough wallets but too little weight: no enrichment; new events re-mark the token
+                        metrics.SCORE_GATED.inc(side=side_label)
+                        dlog(f"[SCORE] token={token_addr} side={side_label} score={side_score:.2f} < {scoring.MULTI_SCORE_THRESHOLD}")
                         break
-
-            # Updates: new wallets joined after initial alert
-            if ENABLE_UPDATES and state[side_label]['windows']:
-                new_wallets = wallets_all - state[side_label]['wallets']
-                if new_wallets:
-                    token_info = await get_token_info(token_addr)
+                    token_info = await enrich(token_addr)
                     if token_info and _cap_ok(token_info.get('market_cap', 0)):
-                        new_participants = [p for p in participants_all if p['wallet'] in new_wallets]
-                        # recent exits: opposite side in lookback
-                        opposite = 'sells' if side_key == 'buys' else 'buys'
-                        recent_exits = [p for p in events.get(opposite, []) if now - p['time'] <= timedelta(minutes=MAX_LOOKBACK_MINUTES)]
-                        msg = format_notification(
-                            f"{side_label.title()} UPDATE", token_info, new_participants, min(windows_sorted), is_update=True,
-                            total_participants=participants_all, recent_exits=recent_exits
-                        )
-                        await send_notification(context, msg, chat_id)
-                        state[side_label]['wallets'].update(new_wallets)
-
-            # Initial detection: earliest window only
-            if not state[side_label]['windows']:
-                for w in windows_sorted:
-                    window_participants = [p for p in events.get(side_key, []) if now - p['time'] <= timedelta(seconds=w)]
-                    unique_wallets = {p['wallet'] for p in window_participants}
-                    dlog(f"[WINDOW] token={token_addr} side={side_label} w={w} unique={len(unique_wallets)}")
-                    if len(unique_wallets) >= MULTI_EVENT_THRESHOLD:
-                        token_info = await get_token_info(token_addr)
-                        if token_info and _cap_ok(token_info.get('market_cap', 0)):
-                            # recent exits: opposite side in lookback
-                            opposite = 'sells' if side_key == 'buys' else 'buys'
-                            recent_exits = [p for p in events.get(opposite, []) if now - p['time'] <= timedelta(minutes=MAX_LOOKBACK_MINUTES)]
-                            msg = format_notification(
-                                side_label.title(), token_info, window_participants, w, is_update=False,
-                                total_participants=[p for p in events.get(side_key, []) if now - p['time'] <= timedelta(minutes=MAX_LOOKBACK_MINUTES)],
-                                recent_exits=recent_exits
-                            )
-                            await send_notification(context, msg, chat_id)
-                            state[side_label]['wallets'].update(unique_wallets)
-                            state[side_label]['windows'].add(w)
-                            break  # earliest window wins
+                        participants = window_participants(token_addr, side_key, w, now_ts)
+                        alert = await _build_alert('initial', token_addr, side_label, w, participants, token_info,
+                                                   extra_stats=score_stats)
+                        if alert:
+                            alerts.append(alert)
+                        if side_key == 'buys':
+                            scoring.record_hit(p['wallet'] for p in participants)
+                        state[side_label]['wallets'].update(p['wallet'] for p in participants)
+                        state[side_label]['windows'].add(w)
+                    else:
+                        # cap out of bounds (or no data yet) → re-check on the next pass
+                        _dirty_tokens.add(token_addr)
+                    break  # earliest window wins
+
+async def detect_multi_events(now: datetime | None = None, enrich=None) -> list:
+    """Evaluate the shared event store once and return the alerts that fire (token info fetched once per alert)."""
+    now = now or datetime.now(timezone.utc)
+    enrich = enrich or get_token_info
+    windows_sorted = MULTI_WINDOWS_SECONDS
+    alerts = []
+    candidates = _dirty_tokens | _pending_update_tokens
+    _dirty_tokens.clear()
+    now_ts = now.timestamp()
+    lookback = MAX_LOOKBACK_MINUTES * 60
+    count = window_count
+    if _columns is not None and len(candidates) >= event_columns.EVENT_COLUMNS_MIN_CANDIDATES:
+        # one vectorized sweep answers every candidate's window counts for this pass
+        count = _columns.window_counts(now_ts, windows_sorted).get
+    for token_addr in candidates:
+        try:
+            await _detect_token(token_addr, now, now_ts, lookback, count, enrich, alerts)
+        except Exception as e:
+            # one failing lookup must not cost the rest of the pass; re-check this token next time
+            logger.warning(f"Detection failed for token {token_addr}: {e}")
+            _dirty_tokens.add(token_addr)
+    return alerts
+
+async def check_for_multi_events(application, chat_ids: list | None = None):
+    """Detect once for all chats, then fan each rendered alert out to every subscriber."""
+    chat_ids = _subscribed_chats(application) if chat_ids is None else chat_ids
+    if not chat_ids:
+        return
+    for alert in await detect_multi_events():
+        await publish_alert(application, alert, chat_ids)
 
 # --- Simple feed helpers (like SolanaTrackerBot) ---
 def build_simple_tx_message(wallet_name: str, signature: str, tx_data: dict, event_time: datetime) -> str:
@@ -828,11 +1205,143 @@ def build_simple_tx_message(wallet_name: str, signature: str, tx_data: dict, eve
     except Exception:
         return "\n".join(lines)
 
+async def _process_signature(client: httpx.AsyncClient, application, chat_id, wallet_address: str, wallet_name: str, signature: str,
+                             live: bool = True, discovered_at: float | None = None, discovered_ts: float | None = None,
+                             record=None) -> None:
+    """Fetch (or reuse) the parsed transaction and record the wallet's buys/sells from it.
+
+    live=False is the backfill/coldstart path: no per-tx feed, no event logging, no trace timestamps.
+    record replaces _record_event (ingest workers stream events to the main process instead).
+    """
+    record = record or _record_event
+    parsed = await get_parsed_transaction(client, signature, wallet_name, "" if live else "(backfill)")
+    if not parsed:
+        return
+    changes, sol_change = project_owner(parsed, wallet_address)
+    if live and discovered_at is not None:
+        metrics.SIGNATURE_TO_PARSE.observe(perf_counter() - discovered_at)
+    event_time = datetime.fromtimestamp(parsed['block_time'], tz=timezone.utc)
+    # фильтр по давности
+    if datetime.now(timezone.utc) - event_time > timedelta(minutes=MAX_LOOKBACK_MINUTES):
+        return
+
+    # Simple per-tx feed (optional, like SolanaTrackerBot)
+    if live and SIMPLE_TX_FEED and parsed.get('raw') and application is not None:
+        try:
+            msg = build_simple_tx_message(wallet_name, signature, parsed['raw'], event_time)
+            get_delivery_queue(application).submit(_cast_chat_id(chat_id), msg)
+        except Exception as e:
+            logger.warning(f"Failed to send simple feed message: {e}")
+
+    trace_kwargs = {}
+    if live:
+        # cache hit from another wallet: the tx was "fetched" no earlier than this wallet discovered it
+        fetched_ts = max(parsed.get('fetched_at') or 0.0, discovered_ts or 0.0) or None
+        trace_kwargs = {'log': True, 'discovered_at': discovered_ts, 'fetched_at': fetched_ts}
+    # Классификация по изменению токен-баланса (игнорируем SOL-дельту)
+    traded = {t: c for t, c in changes.items() if t not in IGNORED_MINTS and c}
+    token_amount = _implied_token_amount(changes)
+    for token_addr, change in traded.items():
+        if change > 0:
+            await record(token_addr, 'buys', wallet_address, wallet_name, abs(sol_change), event_time, token_amount=token_amount, **trace_kwargs)
+        else:
+            await record(token_addr, 'sells', wallet_address, wallet_name, sol_change, event_time, token_amount=token_amount, **trace_kwargs)
+
+async def _poll_wallet(client: httpx.AsyncClient, wallet_address: str, wallet_name: str, last_sigs_by_wallet: dict):
+    """New signatures of one wallet since the last poll.
+
+    Returns (signatures oldest first, live, discovered_at perf_counter, discovered_ts) or None when there
+    is nothing to do. live=False marks the first poll of a wallet (backfill/coldstart). Updates last_sigs_by_wallet.
+    """
+    # 1) Get the latest signatures newer than what we've already seen (with method fallback if needed)
+    last_seen_signatures = last_sigs_by_wallet.get(wallet_address)
+    options = {"limit": SIGNATURES_LIMIT, "commitment": READ_COMMITMENT}
+    if last_seen_signatures:
+        options["until"] = last_seen_signatures[0]
+    payload = {
+        "jsonrpc": "2.0", "id": 1, "method": "getSignaturesForAddress",
+        "params": [wallet_address, options]
+    }
+    dlog(f"seq:getSignatures wallet={wallet_name}")
+    response = await rpc_post(client, payload, timeout=30.0)
+    body = {}
+    try:
+        body = jsoncodec.loads(response.content)
+    except Exception:
+        body = {}
+    if isinstance(body.get('error'), dict) and 'method not found' in str(body['error'].get('message','')).lower():
+        payload = {
+            "jsonrpc": "2.0", "id": 1, "method": "getConfirmedSignaturesForAddress2",
+            "params": [wallet_address, options]
+        }
+        response = await rpc_post(client, payload, timeout=30.0)
+        body = None
+
+    if response.status_code == 429:
+        logger.warning(f"Rate limited on getSignatures for {wallet_name}, skip sleep.")
+        return None
+    response.raise_for_status()
+
+    if body is None:
+        body = jsoncodec.loads(response.content)
+    result = body.get('result') or []
+    if not result:
+        if not last_seen_signatures:
+            await asyncio.sleep(0.2)
+        # (с "until" пустой ответ — просто нет новых сигнатур)
+        return None
+
+    discovered_at = perf_counter()
+    discovered_ts = time.time()
+    current_signatures = [item['signature'] for item in result]
+    # упавшие транзакции не меняют балансы — не тратим на них getTransaction
+    failed_signatures = {item['signature'] for item in result if item.get('err')}
+    if not last_seen_signatures:
+        # Первичная инициализация. По желанию обработаем последние N сигнатур как "новые";
+        # без бэкфилла (холодный старт) — хотя бы 1 последнюю сигнатуру
+        candidates = [sig for sig in current_signatures if sig not in failed_signatures]
+        new_signatures = candidates[:BACKFILL_ON_START] if BACKFILL_ON_START > 0 else candidates[:1]
+        if new_signatures:
+            logger.info(f"Backfill {len(new_signatures)} tx{'' if BACKFILL_ON_START > 0 else ' (coldstart)'} for {wallet_name}.")
+        # Запоминаем и после бэкфилла/холодного старта, иначе каждый цикл снова пойдёт сюда
+        last_sigs_by_wallet[wallet_address] = current_signatures
+        return list(reversed(new_signatures)), False, discovered_at, discovered_ts
+
+    new_signatures = [sig for sig in current_signatures
+                      if sig not in last_seen_signatures and sig not in failed_signatures]
+    if new_signatures:
+        logger.info(f"Found {len(new_signatures)} new transaction(s) for {wallet_name}.")
+    # with "until" the response only holds newer signatures: keep the seen list rolling
+    last_sigs_by_wallet[wallet_address] = (current_signatures + last_seen_signatures)[:max(SIGNATURES_LIMIT, 10)]
+    return list(reversed(new_signatures)), True, discovered_at, discovered_ts
+
+async def scan_wallet(client: httpx.AsyncClient, wallet_address: str, wallet_name: str, last_sigs_by_wallet: dict,
+                      application=None, chat_id=None, record=None) -> None:
+    """Poll one wallet and record the buys/sells in its new transactions (via record, default _record_event)."""
+    polled = await _poll_wallet(client, wallet_address, wallet_name, last_sigs_by_wallet)
+    if polled is None:
+        return
+    signatures, live, discovered_at, discovered_ts = polled
+    for signature in signatures:
+        try:
+            if live:
+                await _process_signature(client, application, chat_id, wallet_address, wallet_name, signature,
+                                         live=True, discovered_at=discovered_at, discovered_ts=discovered_ts, record=record)
+            else:
+                await _process_signature(client, application, chat_id, wallet_address, wallet_name, signature,
+                                         live=False, record=record)
+        except Exception as e:
+            if live:
+                logger.error(f"Error processing transaction {signature} for {wallet_name}: {e}", exc_info=True)
+
 async def sequential_tracker(chat_id: str, application):
     """
     Параллельная обработка кошельков батчами с ограничением по concurrency,
     чтобы ускорить сканирование и сохранить контроль над rate-limit.
     """
+    if ingest_workers.INGEST_WORKERS > 0:
+        await _sharded_tracker(chat_id, application)
+        return
     # Per-chat last seen signatures map
     if not hasattr(application, "_runtime_last_sigs_by_chat"):
         application._runtime_last_sigs_by_chat = {}
@@ -841,12 +1350,14 @@ async def sequential_tracker(chat_id: str, application):
     while True:
         try:
             user_session_data = application.user_data[int(chat_id)]
-            wallets_to_track = [w for w in user_session_data.get('wallets', []) if w.get('is_tracking')]
+            reg = wr.get_registry(application.bot_data)
+            scoring.sync_ranks(reg)
+            wallets_to_track = wr.tracked_wallets(reg, wr.get_user_state(application.bot_data, user_session_data))
             if not wallets_to_track:
                 await asyncio.sleep(POLL_INTERVAL_SECONDS)
                 continue
 
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(verify=SSL_CONTEXT) as client:
                 cycle_started = perf_counter()
                 scanned_total = 0
 
@@ -854,292 +1365,9 @@ async def sequential_tracker(chat_id: str, application):
 
                 async def process_wallet(wallet: dict):
                     nonlocal scanned_total
-                    wallet_address = wallet['address']
-                    wallet_name = wallet['name']
                     try:
                         async with sem:
-                            # 1) Get last 10 signatures (with method fallback if needed)
-                            payload = {
-                                "jsonrpc": "2.0", "id": 1, "method": "getSignaturesForAddress",
-                                "params": [wallet_address, {"limit": 10}]
-                            }
-                            dlog(f"seq:getSignatures wallet={wallet_name}")
-                            response = await rpc_post(client, payload, timeout=30.0)
-                            body = {}
-                            try:
-                                body = response.json()
-                            except Exception:
-                                body = {}
-                            if isinstance(body.get('error'), dict) and 'method not found' in str(body['error'].get('message','')).lower():
-                                payload = {
-                                    "jsonrpc": "2.0", "id": 1, "method": "getConfirmedSignaturesForAddress2",
-                                    "params": [wallet_address, {"limit": 10}]
-                                }
-                                response = await rpc_post(client, payload, timeout=30.0)
-
-                            if response.status_code == 429:
-                                logger.warning(f"Rate limited on getSignatures for {wallet_name}, skip sleep.")
-                                return
-                            response.raise_for_status()
-
-                            result = response.json().get('result', [])
-                            if not result:
-                                await asyncio.sleep(0.2)
-                                scanned_total += 1
-                                return
-
-                            current_signatures = [item['signature'] for item in result]
-                            last_seen_signatures = last_sigs_by_wallet.get(wallet_address)
-                            if not last_seen_signatures:
-                                # Первичная инициализация. По желанию обработаем последние N сигнатур как "новые"
-                                if BACKFILL_ON_START > 0:
-                                    new_signatures = current_signatures[:BACKFILL_ON_START]
-                                    if new_signatures:
-                                        logger.info(f"Backfill {len(new_signatures)} tx for {wallet_name}.")
-                                        for signature in reversed(new_signatures):
-                                            tx_payload = {
-                                                "jsonrpc": "2.0", "id": 1, "method": "getTransaction",
-                                                "params": [signature, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}]
-                                            }
-                                            tx_data = None
-                                            # 1) Попробовать через SolanaTrackerBot, если доступен
-                                            if ST_WALLET_TRACKER is not None:
-                                                try:
-                                                    details = await ST_WALLET_TRACKER.get_transaction_details(signature)  # type: ignore
-                                                    if isinstance(details, dict):
-                                                        tx_data = details.get('result')
-                                                except Exception as e:
-                                                    logger.warning(f"ST_WALLET_TRACKER.get_transaction_details(backfill) failed: {e}")
-                                            # 2) Фолбэк: прямой RPC
-                                            if tx_data is None:
-                                                tx_response = await rpc_post(client, tx_payload, timeout=30.0)
-                                                if tx_response.status_code == 429:
-                                                    logger.warning(f"Rate limited on getTransaction(backfill) for {wallet_name}, skip sleep.")
-                                                    continue
-                                                tx_data = tx_response.json().get('result')
-                                            if not tx_data:
-                                                continue
-                                            # Повторно используем обработку ниже — укороченная версия
-                                            try:
-                                                pre_balances = tx_data.get("meta", {}).get("preTokenBalances", [])
-                                                post_balances = tx_data.get("meta", {}).get("postTokenBalances", [])
-                                                changes = {}
-                                                for balance in pre_balances:
-                                                    if balance.get('owner') == wallet_address:
-                                                        addr = balance.get('mint')
-                                                        changes[addr] = changes.get(addr, 0) - _to_float_token_amount(balance.get('uiTokenAmount'))
-                                                for balance in post_balances:
-                                                    if balance.get('owner') == wallet_address:
-                                                        addr = balance.get('mint')
-                                                        changes[addr] = changes.get(addr, 0) + _to_float_token_amount(balance.get('uiTokenAmount'))
-                                                meta = tx_data.get('meta', {})
-                                                account_keys = tx_data.get('transaction', {}).get('message', {}).get('accountKeys', [])
-                                                pubkeys = [k.get('pubkey') if isinstance(k, dict) else k for k in account_keys]
-                                                sol_change = 0.0
-                                                if pubkeys and wallet_address in pubkeys:
-                                                    idx = pubkeys.index(wallet_address)
-                                                    try:
-                                                        sol_change = (meta.get('postBalances', [0]*len(pubkeys))[idx] - meta.get('preBalances', [0]*len(pubkeys))[idx]) / 1e9
-                                                    except Exception:
-                                                        sol_change = 0.0
-                                                event_time = datetime.fromtimestamp(tx_data.get('blockTime'), tz=timezone.utc)
-                                                # фильтр по давности
-                                                if datetime.now(timezone.utc) - event_time > timedelta(minutes=MAX_LOOKBACK_MINUTES):
-                                                    continue
-                                                # Классификация по изменению токен-баланса (игнорируем SOL-дельту)
-                                                for token_addr, change in changes.items():
-                                                    if token_addr in ["So11111111111111111111111111111111111111112", "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v", "Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB"]:
-                                                        continue
-                                                    if change > 0:
-                                                        recent_events.setdefault(token_addr, {"buys": [], "sells": []})
-                                                        if not any(e['wallet'] == wallet_address for e in recent_events[token_addr]['buys']):
-                                                            try:
-                                                                token_info_snapshot = await get_token_info(token_addr)
-                                                                cap_snapshot = token_info_snapshot.get('market_cap') if token_info_snapshot else None
-                                                            except Exception:
-                                                                cap_snapshot = None
-                                                            recent_events[token_addr]['buys'].append({"wallet": wallet_address, "amount": abs(sol_change), "time": event_time, "name": wallet_name, "cap": cap_snapshot})
-                                                    elif change < 0:
-                                                        recent_events.setdefault(token_addr, {"buys": [], "sells": []})
-                                                        if not any(e['wallet'] == wallet_address for e in recent_events[token_addr]['sells']):
-                                                            try:
-                                                                token_info_snapshot = await get_token_info(token_addr)
-                                                                cap_snapshot = token_info_snapshot.get('market_cap') if token_info_snapshot else None
-                                                            except Exception:
-                                                                cap_snapshot = None
-                                                            recent_events[token_addr]['sells'].append({"wallet": wallet_address, "amount": sol_change, "time": event_time, "name": wallet_name, "cap": cap_snapshot})
-                                            except Exception:
-                                                pass
-                                else:
-                                    # Холодный старт без бэкфилла: обработаем хотя бы 1 последнюю сигнатуру
-                                    new_signatures = current_signatures[:1]
-                                    if new_signatures:
-                                        logger.info(f"Backfill 1 tx (coldstart) for {wallet_name}.")
-                                        for signature in reversed(new_signatures):
-                                            tx_payload = {
-                                                "jsonrpc": "2.0", "id": 1, "method": "getTransaction",
-                                                "params": [signature, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}]
-                                            }
-                                            tx_data = None
-                                            if ST_WALLET_TRACKER is not None:
-                                                try:
-                                                    details = await ST_WALLET_TRACKER.get_transaction_details(signature)  # type: ignore
-                                                    if isinstance(details, dict):
-                                                        tx_data = details.get('result')
-                                                except Exception as e:
-                                                    logger.warning(f"ST_WALLET_TRACKER.get_transaction_details(backfill) failed: {e}")
-                                            if tx_data is None:
-                                                tx_response = await rpc_post(client, tx_payload, timeout=30.0)
-                                                if tx_response.status_code == 429:
-                                                    logger.warning(f"Rate limited on getTransaction(backfill) for {wallet_name}, skip sleep.")
-                                                    continue
-                                                tx_data = tx_response.json().get('result')
-                                            if not tx_data:
-                                                continue
-                                            try:
-                                                pre_balances = tx_data.get("meta", {}).get("preTokenBalances", [])
-                                                post_balances = tx_data.get("meta", {}).get("postTokenBalances", [])
-                                                changes = {}
-                                                for balance in pre_balances:
-                                                    if balance.get('owner') == wallet_address:
-                                                        addr = balance.get('mint')
-                                                        changes[addr] = changes.get(addr, 0) - _to_float_token_amount(balance.get('uiTokenAmount'))
-                                                for balance in post_balances:
-                                                    if balance.get('owner') == wallet_address:
-                                                        addr = balance.get('mint')
-                                                        changes[addr] = changes.get(addr, 0) + _to_float_token_amount(balance.get('uiTokenAmount'))
-                                                meta = tx_data.get('meta', {})
-                                                account_keys = tx_data.get('transaction', {}).get('message', {}).get('accountKeys', [])
-                                                pubkeys = [k.get('pubkey') if isinstance(k, dict) else k for k in account_keys]
-                                                sol_change = 0.0
-                                                if pubkeys and wallet_address in pubkeys:
-                                                    idx = pubkeys.index(wallet_address)
-                                                    try:
-                                                        sol_change = (meta.get('postBalances', [0]*len(pubkeys))[idx] - meta.get('preBalances', [0]*len(pubkeys))[idx]) / 1e9
-                                                    except Exception:
-                                                        sol_change = 0.0
-                                                event_time = datetime.fromtimestamp(tx_data.get('blockTime'), tz=timezone.utc)
-                                                if datetime.now(timezone.utc) - event_time > timedelta(minutes=MAX_LOOKBACK_MINUTES):
-                                                    continue
-                                                for token_addr, change in changes.items():
-                                                    if token_addr in ["So11111111111111111111111111111111111111112", "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v", "Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB"]:
-                                                        continue
-                                                    if change > 0:
-                                                        recent_events.setdefault(token_addr, {"buys": [], "sells": []})
-                                                        if not any(e['wallet'] == wallet_address for e in recent_events[token_addr]['buys']):
-                                                            try:
-                                                                token_info_snapshot = await get_token_info(token_addr)
-                                                                cap_snapshot = token_info_snapshot.get('market_cap') if token_info_snapshot else None
-                                                            except Exception:
-                                                                cap_snapshot = None
-                                                            recent_events[token_addr]['buys'].append({"wallet": wallet_address, "amount": abs(sol_change), "time": event_time, "name": wallet_name, "cap": cap_snapshot})
-                                                    elif change < 0:
-                                                        recent_events.setdefault(token_addr, {"buys": [], "sells": []})
-                                                        if not any(e['wallet'] == wallet_address for e in recent_events[token_addr]['sells']):
-                                                            try:
-                                                                token_info_snapshot = await get_token_info(token_addr)
-                                                                cap_snapshot = token_info_snapshot.get('market_cap') if token_info_snapshot else None
-                                                            except Exception:
-                                                                cap_snapshot = None
-                                                            recent_events[token_addr]['sells'].append({"wallet": wallet_address, "amount": sol_change, "time": event_time, "name": wallet_name, "cap": cap_snapshot})
-                                            except Exception:
-                                                pass
-                                
-                            else:
-                                new_signatures = [sig for sig in current_signatures if sig not in last_seen_signatures]
-                                if new_signatures:
-                                    logger.info(f"Found {len(new_signatures)} new transaction(s) for {wallet_name}.")
-                                    for signature in reversed(new_signatures):
-                                        tx_payload = {
-                                            "jsonrpc": "2.0", "id": 1, "method": "getTransaction",
-                                            "params": [signature, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}]
-                                        }
-                                        tx_data = None
-                                        # 1) Если доступен модуль SolanaTrackerBot — используем его функцию
-                                        if ST_WALLET_TRACKER is not None:
-                                            try:
-                                                details = await ST_WALLET_TRACKER.get_transaction_details(signature)  # type: ignore
-                                                if isinstance(details, dict):
-                                                    tx_data = details.get('result')
-                                            except Exception as e:
-                                                logger.warning(f"ST_WALLET_TRACKER.get_transaction_details failed: {e}")
-                                        # 2) Фолбэк на прямой RPC, если по какой-то причине не сработало
-                                        if tx_data is None:
-                                            tx_response = await rpc_post(client, tx_payload, timeout=30.0)
-                                            if tx_response.status_code == 429:
-                                                logger.warning(f"Rate limited on getTransaction for {wallet_name}, skip sleep.")
-                                                continue
-                                            tx_data = tx_response.json().get('result')
-                                        if not tx_data:
-                                            continue
-                                        # Process
-                                        try:
-                                            pre_balances = tx_data.get("meta", {}).get("preTokenBalances", [])
-                                            post_balances = tx_data.get("meta", {}).get("postTokenBalances", [])
-                                            changes = {}
-                                            for balance in pre_balances:
-                                                if balance.get('owner') == wallet_address:
-                                                    addr = balance.get('mint')
-                                                    changes[addr] = changes.get(addr, 0) - _to_float_token_amount(balance.get('uiTokenAmount'))
-                                            for balance in post_balances:
-                                                if balance.get('owner') == wallet_address:
-                                                    addr = balance.get('mint')
-                                                    changes[addr] = changes.get(addr, 0) + _to_float_token_amount(balance.get('uiTokenAmount'))
-
-                                            meta = tx_data.get('meta', {})
-                                            account_keys = tx_data.get('transaction', {}).get('message', {}).get('accountKeys', [])
-                                            pubkeys = [k.get('pubkey') if isinstance(k, dict) else k for k in account_keys]
-                                            sol_change = 0.0
-                                            if pubkeys and wallet_address in pubkeys:
-                                                idx = pubkeys.index(wallet_address)
-                                                try:
-                                                    sol_change = (meta.get('postBalances', [0]*len(pubkeys))[idx] - meta.get('preBalances', [0]*len(pubkeys))[idx]) / 1e9
-                                                except Exception:
-                                                    sol_change = 0.0
-                                            event_time = datetime.fromtimestamp(tx_data.get('blockTime'), tz=timezone.utc)
-                                            # фильтр по давности
-                                            if datetime.now(timezone.utc) - event_time > timedelta(minutes=MAX_LOOKBACK_MINUTES):
-                                                continue
-
-                                            # Simple per-tx feed (optional, like SolanaTrackerBot)
-                                            if SIMPLE_TX_FEED:
-                                                try:
-                                                    msg = build_simple_tx_message(wallet_name, signature, tx_data, event_time)
-                                                    try:
-                                                        chat_id_cast = int(chat_id) if isinstance(chat_id, str) and chat_id.isdigit() else chat_id
-                                                    except Exception:
-                                                        chat_id_cast = chat_id
-                                                    await application.bot.send_message(chat_id_cast, msg)
-                                                except Exception as e:
-                                                    logger.warning(f"Failed to send simple feed message: {e}")
-
-                                            # Классификация по изменению токен-баланса (игнорируем SOL-дельту)
-                                            for token_addr, change in changes.items():
-                                                if token_addr in ["So11111111111111111111111111111111111111112", "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v", "Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB"]:
-                                                    continue
-                                                if change > 0:
-                                                    recent_events.setdefault(token_addr, {"buys": [], "sells": []})
-                                                    if not any(e['wallet'] == wallet_address for e in recent_events[token_addr]['buys']):
-                                                        logger.info(f"BUY EVENT: {wallet_name} bought {token_addr}")
-                                                        try:
-                                                            token_info_snapshot = await get_token_info(token_addr)
-                                                            cap_snapshot = token_info_snapshot.get('market_cap') if token_info_snapshot else None
-                                                        except Exception:
-                                                            cap_snapshot = None
-                                                        recent_events[token_addr]['buys'].append({"wallet": wallet_address, "amount": abs(sol_change), "time": event_time, "name": wallet_name, "cap": cap_snapshot})
-                                                elif change < 0:
-                                                    recent_events.setdefault(token_addr, {"buys": [], "sells": []})
-                                                    if not any(e['wallet'] == wallet_address for e in recent_events[token_addr]['sells']):
-                                                        logger.info(f"SELL EVENT: {wallet_name} sold {token_addr}")
-                                                        try:
-                                                            token_info_snapshot = await get_token_info(token_addr)
-                                                            cap_snapshot = token_info_snapshot.get('market_cap') if token_info_snapshot else None
-                                                        except Exception:
-                                                            cap_snapshot = None
-                                                        recent_events[token_addr]['sells'].append({"wallet": wallet_address, "amount": sol_change, "time": event_time, "name": wallet_name, "cap": cap_snapshot})
-                                        except Exception as e:
-                                            logger.error(f"Error processing transaction {signature} for {wallet_name}: {e}", exc_info=True)
-                                    last_sigs_by_wallet[wallet_address] = current_signatures
+                            await scan_wallet(client, wallet['address'], wallet['name'], last_sigs_by_wallet, application, chat_id)
                     finally:
                         # small pause between wallets
                         await asyncio.sleep(float(os.getenv("WALLET_SPACING_SECONDS", "0.1")))
@@ -1149,15 +1377,32 @@ async def sequential_tracker(chat_id: str, application):
                 tasks = [asyncio.create_task(process_wallet(w)) for w in wallets_to_track]
                 await asyncio.gather(*tasks, return_exceptions=True)
                 elapsed = perf_counter() - cycle_started
+                metrics.SCAN_CYCLE_SECONDS.observe(elapsed)
                 dlog(f"scan cycle chat={chat_id} scanned={scanned_total}/{len(wallets_to_track)} elapsed={elapsed:.1f}s avg_per_wallet={(elapsed/scanned_total) if scanned_total else 0:.2f}s")
         except Exception as e:
             logger.error(f"Unexpected error in sequential_tracker loop for chat {chat_id}: {e}", exc_info=True)
         await asyncio.sleep(POLL_INTERVAL_SECONDS)
 
+async def _sharded_tracker(chat_id: str, application):
+    """INGEST_WORKERS > 0: polling runs in worker processes; this task only keeps the chat's wallet set current."""
+    pool = ingest_workers.get_ingest_pool(application)
+    try:
+        while True:
+            try:
+                user_session_data = application.user_data[int(chat_id)]
+                reg = wr.get_registry(application.bot_data)
+                scoring.sync_ranks(reg)
+                pool.set_chat_wallets(chat_id, wr.tracked_wallets(reg, wr.get_user_state(application.bot_data, user_session_data)))
+            except Exception as e:
+                logger.error(f"Unexpected error in sharded tracker for chat {chat_id}: {e}", exc_info=True)
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+    finally:
+        pool.set_chat_wallets(chat_id, [])
+
 async def start_multibuy_tracker(chat_id, application):
     # This is now the single source of truth, no more confusion
     user_session_data = application.user_data[int(chat_id)]
-    wallets_to_track = [w for w in user_session_data.get('wallets', []) if w.get('is_tracking')]
+    wallets_to_track = wr.tracked_wallets(wr.get_registry(application.bot_data), wr.get_user_state(application.bot_data, user_session_data))
     dlog(f"start_multibuy_tracker chat={chat_id} wallets_to_track={len(wallets_to_track)}")
     dlog(f"addresses={[w['address'] for w in wallets_to_track]}")
     
@@ -1183,11 +1428,10 @@ async def start_multibuy_tracker(chat_id, application):
         seq_task = asyncio.create_task(sequential_tracker(str(chat_id), application))
         runtime_tasks_by_chat[seq_key] = seq_task
 
-    # Start the central monitoring task
-    monitor_task_key = f"{chat_id}_monitor"
-    if monitor_task_key not in runtime_tasks_by_chat:
-        monitor_task = asyncio.create_task(monitor_for_multievents(chat_id, application))
-        runtime_tasks_by_chat[monitor_task_key] = monitor_task
+    # Start the single application-wide monitor (detection is shared by all chats)
+    monitor_task = getattr(application, "_runtime_alert_monitor", None)
+    if monitor_task is None or monitor_task.done():
+        application._runtime_alert_monitor = asyncio.create_task(monitor_for_multievents(application))
 
 async def stop_multibuy_tracker(chat_id, context):
     user_session_data = context.application.user_data[int(chat_id)]
@@ -1210,47 +1454,15 @@ async def stop_multibuy_tracker(chat_id, context):
 
 WINDOW_CHECK_INTERVAL_SECONDS = int(os.getenv("WINDOW_CHECK_INTERVAL_SECONDS", "5"))
 
-async def monitor_for_multievents(chat_id, application):
+async def monitor_for_multievents(application):
     """
     This is the central task that periodically checks the collected events 
-    for multi-buy/sell patterns and sends notifications.
+    for multi-buy/sell patterns and sends notifications to every tracking chat.
     """
     while True:
-        await check_for_multi_events(application, str(chat_id))
-        await clean_old_events()
-        await asyncio.sleep(max(1, WINDOW_CHECK_INTERVAL_SECONDS)) # configurable frequency 
-
-async def cache_cleanup_job(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Periodically remove old cached browser data to avoid disk fill."""
-    if not CACHE_CLEANUP_ENABLED:
-        return
-    removed_bytes = 0
-    now_ts = time.time()
-    max_age = CACHE_CLEANUP_MAX_AGE_DAYS * 86400
-    for raw in CACHE_CLEANUP_TARGETS:
         try:
-            base = os.path.expanduser(os.path.expandvars(raw))
-            if not os.path.exists(base):
-                continue
-            # Walk and remove entries older than threshold
-            for root, dirs, files in os.walk(base, topdown=False):
-                for name in files:
-                    fp = os.path.join(root, name)
-                    try:
-                        if (now_ts - os.path.getmtime(fp)) > max_age:
-                            removed_bytes += os.path.getsize(fp)
-                            os.remove(fp)
-                    except Exception:
-                        pass
-                for name in dirs:
-                    dp = os.path.join(root, name)
-                    try:
-                        if not os.listdir(dp) or (now_ts - os.path.getmtime(dp)) > max_age:
-                            # remove empty or stale dirs
-                            shutil.rmtree(dp, ignore_errors=True)
-                    except Exception:
-                        pass
-        except Exception:
-            continue
-    if removed_bytes > 0:
-        logger.info(f"Cache cleanup removed ~{int(removed_bytes/1024/1024)} MB") 
\ No newline at end of file
+            await check_for_multi_events(application)
+        except Exception as e:
+            logger.error(f"Error in multi-event monitor: {e}", exc_info=True)
+        await clean_old_events()
+        await asyncio.sleep(max(1, WINDOW_CHECK_INTERVAL_SECONDS)) # configurable frequency
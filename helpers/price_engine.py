@@ -0,0 +1,81 @@
+# helpers/price_engine.py
+"""Local price engine: token prices from the swaps we already parse.
+
+Every recorded swap with a known token delta gives an implied price in SOL per token
+(|SOL delta| / |token delta|). The engine keeps the last PRICE_ENGINE_TRADES of them
+per mint for PRICE_ENGINE_MAX_AGE_SECONDS and quotes their median, so one odd fill
+(multi-hop route, fee-heavy tiny buy) does not move the price.
+
+With the SOL/USD price (multibuy_logic._get_sol_price_usd, cached) and the mint's
+supply (getTokenSupply, cached TOKEN_SUPPLY_TTL_SECONDS) that is a market cap at the
+last trade, so get_token_info() only asks Dexscreener & co. when no recent trade
+exists. Brand-new tokens that Dexscreener has not indexed yet get a cap as well.
+Symbol / pair address come from the metadata cache, filled by earlier external lookups.
+"""
+import os
+import time
+from collections import deque
+from statistics import median
+
+from cachetools import TTLCache
+
+PRICE_ENGINE_ENABLED = os.getenv("PRICE_ENGINE_ENABLED", "1") == "1"
+PRICE_ENGINE_MAX_AGE_SECONDS = int(os.getenv("PRICE_ENGINE_MAX_AGE_SECONDS", "120"))
+PRICE_ENGINE_TRADES = int(os.getenv("PRICE_ENGINE_TRADES", "5"))
+TOKEN_SUPPLY_TTL_SECONDS = int(os.getenv("TOKEN_SUPPLY_TTL_SECONDS", "3600"))
+TOKEN_META_TTL_SECONDS = int(os.getenv("TOKEN_META_TTL_SECONDS", "86400"))
+
+_trades = TTLCache(maxsize=50000, ttl=PRICE_ENGINE_MAX_AGE_SECONDS)  # mint -> deque[(ts, price_sol)]
+_supply = TTLCache(maxsize=50000, ttl=TOKEN_SUPPLY_TTL_SECONDS)     # mint -> supply (UI units)
+_meta = TTLCache(maxsize=50000, ttl=TOKEN_META_TTL_SECONDS)         # mint -> {'symbol', 'address', 'pair_address'}
+
+
+def implied_price_sol(sol_amount: float, token_amount: float | None) -> float | None:
+    """SOL per token of one swap, or None when the token side is unknown."""
+    if not token_amount or not sol_amount:
+        return None
+    return abs(sol_amount) / abs(token_amount)
+
+
+def record_trade(mint: str, price_sol: float | None, ts: float | None = None) -> None:
+    if not price_sol or price_sol <= 0:
+        return
+    trades = _trades.get(mint)
+    if trades is None:
+        trades = deque(maxlen=max(1, PRICE_ENGINE_TRADES))
+    trades.append((ts or time.time(), price_sol))
+    _trades[mint] = trades  # re-set refreshes the TTL
+
+
+def last_price_sol(mint: str, max_age: float = PRICE_ENGINE_MAX_AGE_SECONDS, now: float | None = None) -> float | None:
+    """Median of the recent trade prices (SOL per token), None without a trade in max_age."""
+    trades = _trades.get(mint)
+    if not trades:
+        return None
+    cutoff = (now or time.time()) - max_age
+    recent = [p for ts, p in trades if ts >= cutoff]
+    return median(recent) if recent else None
+
+
+def market_cap(price_sol: float | None, sol_usd: float, supply: float | None) -> float:
+    if not price_sol or not supply or sol_usd <= 0:
+        return 0.0
+    return price_sol * sol_usd * supply
+
+
+def get_supply(mint: str) -> float | None:
+    return _supply.get(mint)
+
+
+def set_supply(mint: str, supply: float) -> None:
+    if supply and supply > 0:
+        _supply[mint] = float(supply)
+
+
+def get_meta(mint: str) -> dict | None:
+    return _meta.get(mint)
+
+
+def set_meta(mint: str, symbol: str, address: str, pair_address: str = '') -> None:
+    if symbol and symbol != 'N/A':
+        _meta[mint] = {'symbol': symbol, 'address': address or mint, 'pair_address': pair_address or ''}
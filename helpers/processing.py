@@ -0,0 +1,126 @@
+# helpers/processing.py
+"""Executor-backed stage for CPU-bound work that used to run on the event loop.
+
+Transaction parsing, alert rendering and the HTML → Discord embed conversion go
+through run(): jobs wait in a bounded queue (PROCESSING_QUEUE_SIZE, callers block
+when it is full) and PROCESSING_WORKERS dispatchers hand them to the executor in
+batches of up to PROCESSING_BATCH, so a burst costs a few executor round trips
+instead of one per job.
+
+PROCESSING_EXECUTOR: "thread" (default), "process" (spawned workers; jobs must be
+picklable module-level functions) or "off" (run inline on the loop, old behaviour).
+Loop lag itself is measured by helpers/watchdog.py.
+"""
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+PROCESSING_EXECUTOR = os.getenv("PROCESSING_EXECUTOR", "thread").lower()
+PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", str(min(4, os.cpu_count() or 1))))
+PROCESSING_QUEUE_SIZE = int(os.getenv("PROCESSING_QUEUE_SIZE", "1000"))
+PROCESSING_BATCH = int(os.getenv("PROCESSING_BATCH", "32"))
+
+
+def _run_batch(calls: list) -> list:
+    """Executor side: [(fn, args, kwargs)] → [(ok, result | exception)]."""
+    out = []
+    for fn, args, kwargs in calls:
+        try:
+            out.append((True, fn(*args, **kwargs)))
+        except Exception as e:
+            out.append((False, e))
+    return out
+
+
+class ProcessingStage:
+    def __init__(self, mode: str = PROCESSING_EXECUTOR, workers: int = PROCESSING_WORKERS,
+                 queue_size: int = PROCESSING_QUEUE_SIZE, batch: int = PROCESSING_BATCH):
+        self.mode = mode if mode in ("thread", "process") else "off"
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.batch = max(1, batch)
+        self._executor = None
+        self._queue: asyncio.Queue | None = None
+        self._dispatchers: list = []
+        self.jobs_total = 0
+
+    def _ensure_started(self) -> None:
+        if self._queue is not None:
+            return
+        if self.mode == "process":
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=mp.get_context("spawn"))
+        else:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="processing")
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        metrics.PROCESSING_QUEUE_DEPTH.set_function(self._queue.qsize)
+        self._dispatchers = [asyncio.create_task(self._dispatch(), name=f"processing-{i}") for i in range(self.workers)]
+        logger.info(f"Processing stage started: {self.mode} x{self.workers}, queue={self.queue_size}, batch={self.batch}")
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the executor and return its result (or raise its exception)."""
+        self.jobs_total += 1
+        if self.mode == "off":
+            return fn(*args, **kwargs)
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, args, kwargs, future))  # backpressure when the queue is full
+        return await future
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, _run_batch, [(fn, a, kw) for fn, a, kw, _ in batch])
+            except Exception as e:
+                # e.g. unpicklable job in process mode or a broken pool
+                results = [(False, e)] * len(batch)
+            metrics.PROCESSING_BATCH_SECONDS.observe(time.perf_counter() - started)
+            for (_, _, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    async def stop(self) -> None:
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._dispatchers = []
+        self._queue = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_stage: ProcessingStage | None = None
+
+
+def get_processing_stage() -> ProcessingStage:
+    global _stage
+    if _stage is None:
+        _stage = ProcessingStage()
+    return _stage
+
+
+async def run(fn, *args, **kwargs):
+    return await get_processing_stage().run(fn, *args, **kwargs)
+
+
+async def stop_processing_stage() -> None:
+    global _stage
+    if _stage is not None:
+        stage, _stage = _stage, None
+        await stage.stop()
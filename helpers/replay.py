@@ -0,0 +1,252 @@
+# helpers/replay.py
+"""Replay parsed swap events through the detector on a virtual clock.
+
+    python -m helpers.replay events.jsonl[.gz] [--windows 30s,1,5] [--threshold 3] [--prealert 2]
+    python -m helpers.replay --synthetic 1000000 --wallets 500 --tokens 20000
+    python -m helpers.replay --tx-archive ./tx_archive
+
+One JSON object per line, ordered by time:
+    {"ts": 1729000000.5, "token": "<mint>", "side": "buy", "wallet": "<address>",
+     "name": "kol1", "sol": 1.25, "cap": 120000}
+"ts" is unix seconds (or an ISO-8601 string); "name", "sol" and "cap" are optional.
+A live bot writes this format when EVENT_RECORD_PATH is set. --tx-archive re-parses the
+raw transactions captured under TX_ARCHIVE_DIR instead (events of every signer).
+
+Events go straight into the shared event store (no RPC, no price APIs); detection runs
+every --check-interval virtual seconds with an offline enrich() that returns the last
+cap seen for the token (or --cap). Nothing is sent anywhere: fired alerts are counted,
+printed and optionally written to --alerts-out.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from helpers import jsoncodec, multibuy_logic as mlogic, scoring
+from helpers.tx_archive import TxArchive
+
+
+def _parse_ts(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def load_events(path: str):
+    """Yield event dicts from a JSONL (optionally .gz) file."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield jsoncodec.loads(line)
+
+
+def tx_signers(tx: dict) -> list:
+    message = (tx.get('transaction') or {}).get('message') or {}
+    keys = message.get('accountKeys') or []
+    if keys and isinstance(keys[0], dict):
+        return [k.get('pubkey') for k in keys if k.get('signer')]
+    required = int((message.get('header') or {}).get('numRequiredSignatures') or 1)
+    return list(keys[:required])
+
+
+def events_from_archive(directory: str):
+    """Stream events re-parsed from raw archived transactions (one per signer and mint)."""
+    archive = TxArchive(directory)
+    try:
+        for _, tx in archive.iter_records():
+            if not tx or not tx.get('blockTime') or (tx.get('meta') or {}).get('err'):
+                continue
+            for owner in tx_signers(tx):
+                changes, sol_change = mlogic.wallet_token_changes(tx, owner)
+                for mint, change in changes.items():
+                    if mint in mlogic.IGNORED_MINTS or not change:
+                        continue
+                    yield {"ts": tx['blockTime'], "token": mint, "side": "buy" if change > 0 else "sell",
+                           "wallet": owner, "name": owner, "sol": abs(sol_change)}
+    finally:
+        archive.close()
+
+
+def synthetic_events(count: int, wallets: int = 200, tokens: int = 50000, events_per_second: float = 10.0,
+                     hot_every_seconds: float = 60.0, cluster_size: int = 4, cluster_spread_seconds: float = 45.0,
+                     seed: int = 1, start_ts: float | None = None):
+    """Deterministic stream: uniform background trades plus clusters of buys on 'hot' mints."""
+    rng = random.Random(seed)
+    wallet_ids = [f"W{i:06d}" for i in range(wallets)]
+    token_ids = [f"T{i:07d}" for i in range(tokens)]
+    caps = {t: rng.uniform(20_000, 2_000_000) for t in token_ids}
+    ts = start_ts if start_ts is not None else 1_700_000_000.0
+    next_hot = ts
+    pending = []  # cluster buys not emitted yet, kept sorted by time
+    emitted = 0
+    while emitted < count:
+        ts += rng.expovariate(events_per_second)
+        while hot_every_seconds > 0 and next_hot <= ts:
+            mint = rng.choice(token_ids)
+            for w in rng.sample(wallet_ids, min(cluster_size, wallets)):
+                pending.append((next_hot + rng.uniform(0, cluster_spread_seconds), w, mint))
+            pending.sort()
+            next_hot += hot_every_seconds
+        while pending and pending[0][0] <= ts and emitted < count:
+            pts, w, mint = pending.pop(0)
+            yield {"ts": pts, "token": mint, "side": "buy", "wallet": w, "name": w, "sol": round(rng.uniform(0.5, 5), 3), "cap": caps[mint]}
+            emitted += 1
+        if emitted >= count:
+            break
+        mint = rng.choice(token_ids)
+        w = rng.choice(wallet_ids)
+        yield {"ts": ts, "token": mint, "side": "buy" if rng.random() < 0.6 else "sell", "wallet": w, "name": w,
+               "sol": round(rng.uniform(0.1, 3), 3), "cap": caps[mint]}
+        emitted += 1
+
+
+async def replay(events, check_interval: float = 5.0, default_cap: float = 100_000.0,
+                 cleanup_interval: float = 60.0, on_alert=None) -> dict:
+    """Feed events into the detector on a virtual clock; returns a summary dict."""
+    last_cap: dict = {}
+
+    async def enrich(token_addr: str) -> dict:
+        counters["enrich_calls"] += 1
+        return {"market_cap": last_cap.get(token_addr, default_cap), "symbol": token_addr[:6],
+                "address": token_addr, "pair_address": ""}
+
+    alerts_by_kind: dict = {}
+    counters = {"events": 0, "stored": 0, "passes": 0, "alerts": 0, "enrich_calls": 0}
+    detect_seconds = 0.0
+    next_check = None
+    next_cleanup = None
+    first_ts = last_ts = None
+
+    async def run_pass(now_ts: float) -> None:
+        nonlocal detect_seconds
+        now = datetime.fromtimestamp(now_ts, tz=timezone.utc)
+        t0 = time.perf_counter()
+        fired = await mlogic.detect_multi_events(now=now, enrich=enrich)
+        detect_seconds += time.perf_counter() - t0
+        counters["passes"] += 1
+        for alert in fired:
+            counters["alerts"] += 1
+            alerts_by_kind[alert['kind']] = alerts_by_kind.get(alert['kind'], 0) + 1
+            if on_alert:
+                on_alert(now_ts, alert)
+
+    wall_started = time.perf_counter()
+    for ev in events:
+        ts = _parse_ts(ev['ts'])
+        if first_ts is None:
+            first_ts = ts
+            next_check = ts + check_interval
+            next_cleanup = ts + cleanup_interval
+        last_ts = ts
+        while next_check <= ts:
+            await run_pass(next_check)
+            next_check += check_interval
+        if next_cleanup <= ts:
+            await mlogic.clean_old_events(now=datetime.fromtimestamp(ts, tz=timezone.utc))
+            next_cleanup = ts + cleanup_interval
+        side_key = 'buys' if str(ev.get('side', 'buy')).lower().startswith('b') else 'sells'
+        if ev.get('cap') is not None:
+            last_cap[ev['token']] = float(ev['cap'])
+        sol = float(ev.get('sol') or 0.0)
+        counters["events"] += 1
+        # live stores SOL spent / received as positive amounts on both sides
+        if mlogic.store_event(ev['token'], side_key, ev['wallet'], ev.get('name') or ev['wallet'], abs(sol),
+                              datetime.fromtimestamp(ts, tz=timezone.utc), ev.get('cap'), seen_at=ts):
+            counters["stored"] += 1
+    if last_ts is not None:
+        # drain: let debounced updates fire after the last event
+        end = last_ts + max(mlogic.UPDATE_DEBOUNCE_SECONDS, mlogic.UPDATE_MAX_DELAY_SECONDS) + check_interval
+        while next_check <= end:
+            await run_pass(next_check)
+            next_check += check_interval
+    wall = time.perf_counter() - wall_started
+    return {
+        **counters,
+        "alerts_by_kind": alerts_by_kind,
+        "virtual_seconds": round((last_ts - first_ts) if first_ts is not None else 0.0, 1),
+        "wall_seconds": round(wall, 3),
+        "events_per_second": round(counters["events"] / wall, 1) if wall else 0.0,
+        "detect_seconds": round(detect_seconds, 3),
+        "avg_pass_ms": round(detect_seconds / counters["passes"] * 1000, 3) if counters["passes"] else 0.0,
+        "windows_seconds": list(mlogic.MULTI_WINDOWS_SECONDS),
+        "threshold": mlogic.MULTI_EVENT_THRESHOLD,
+        "prealert_threshold": mlogic.PREALERT_THRESHOLD if mlogic.ENABLE_PREALERT else None,
+        "score_threshold": scoring.MULTI_SCORE_THRESHOLD,
+    }
+
+
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m helpers.replay", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("path", nargs="?", help="JSONL(.gz) event file")
+    ap.add_argument("--synthetic", type=int, default=0, help="generate N synthetic events instead of reading a file")
+    ap.add_argument("--tx-archive", help="re-parse raw transactions from a TX_ARCHIVE_DIR")
+    ap.add_argument("--wallets", type=int, default=200)
+    ap.add_argument("--tokens", type=int, default=50000)
+    ap.add_argument("--rate", type=float, default=10.0, help="synthetic events per virtual second")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--windows", help="override MULTI_WINDOWS, e.g. 30s,1,5,10")
+    ap.add_argument("--threshold", type=int, help="override MULTI_EVENT_THRESHOLD")
+    ap.add_argument("--prealert", type=int, help="override PREALERT_THRESHOLD (0 disables pre-alerts)")
+    ap.add_argument("--score-threshold", type=float, help="override MULTI_SCORE_THRESHOLD (helpers/scoring.py)")
+    ap.add_argument("--check-interval", type=float, default=float(mlogic.WINDOW_CHECK_INTERVAL_SECONDS))
+    ap.add_argument("--cap", type=float, default=100_000.0, help="market cap for events without one")
+    ap.add_argument("--no-render", action="store_true", help="skip alert HTML rendering (detector cost only)")
+    ap.add_argument("--alerts-out", help="write fired alerts as JSONL")
+    ap.add_argument("--show", type=int, default=10, help="print the first N alerts")
+    return ap.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    if not args.path and not args.synthetic and not args.tx_archive:
+        sys.exit("give an event file, --tx-archive DIR or --synthetic N")
+    if args.windows:
+        mlogic.MULTI_WINDOWS_SECONDS = mlogic.parse_windows(args.windows) or mlogic.MULTI_WINDOWS_SECONDS
+    if args.threshold is not None:
+        mlogic.MULTI_EVENT_THRESHOLD = args.threshold
+    if args.prealert is not None:
+        mlogic.ENABLE_PREALERT = args.prealert > 0
+        mlogic.PREALERT_THRESHOLD = args.prealert
+    if args.score_threshold is not None:
+        scoring.MULTI_SCORE_THRESHOLD = args.score_threshold
+    if args.no_render:
+        mlogic.format_notification = lambda *a, **kw: ""
+    mlogic.MAX_LOOKBACK_MINUTES = max(mlogic.MAX_LOOKBACK_MINUTES, int(max(mlogic.MULTI_WINDOWS_SECONDS) / 60) + 1)
+
+    if args.synthetic:
+        events = synthetic_events(args.synthetic, args.wallets, args.tokens, args.rate, seed=args.seed)
+    elif args.tx_archive:
+        events = events_from_archive(args.tx_archive)
+    else:
+        events = load_events(args.path)
+    out = open(args.alerts_out, 'w', encoding='utf-8') if args.alerts_out else None
+    shown = 0
+
+    def on_alert(now_ts: float, alert: dict) -> None:
+        nonlocal shown
+        row = {"at": now_ts, "kind": alert['kind'], "token": alert['token'], "side": alert['side'],
+               "window": alert['window'], "wallets": sorted(p['wallet'] for p in alert['participants'])}
+        if out:
+            out.write(json.dumps(row) + "\n")
+        if shown < args.show:
+            shown += 1
+            at = datetime.fromtimestamp(now_ts, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{at} {row['kind']:<8} {row['side']:<4} {row['token']} window={timedelta(seconds=row['window'])} wallets={len(row['wallets'])}")
+
+    try:
+        report = asyncio.run(replay(events, check_interval=args.check_interval, default_cap=args.cap, on_alert=on_alert))
+    finally:
+        if out:
+            out.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
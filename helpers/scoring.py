@@ -0,0 +1,91 @@
+# helpers/scoring.py
+"""Weighted multibuy score: SOL size, wallet reputation and time decay.
+
+Each stored event adds
+
+    wallet_weight × (SCORE_WALLET_POINTS + SCORE_SOL_POINTS × min(|sol|, SCORE_MAX_SOL))
+
+to a per token/side accumulator that halves every SCORE_HALF_LIFE_SECONDS, so the
+current score is O(1) to update and to read (no pass over the window). With the
+defaults three 0.1 SOL buys score ~3 and three 50 SOL entries ~18.
+
+wallet_weight = rank weight × hit weight:
+  * rank: position in the Kolscan leaderboard scrape (registry 'kol' order); #1 gets
+    1 + SCORE_RANK_BONUS, the last KOL ~1, wallets outside the list 1.
+  * hit rate: share of the wallet's buys that ended up in a multibuy alert, with a
+    Beta(1, 1) prior, mapped to 0.5 … 1.5 (no history → 1.0).
+
+detect_multi_events() requires score >= MULTI_SCORE_THRESHOLD (0 → off) next to the
+wallet-count threshold, and checks it before get_token_info, so low-value clusters
+never cost an enrichment call.
+"""
+import os
+
+MULTI_SCORE_THRESHOLD = float(os.getenv("MULTI_SCORE_THRESHOLD", "0"))
+PREALERT_SCORE_THRESHOLD = float(os.getenv("PREALERT_SCORE_THRESHOLD", "0"))
+SCORE_HALF_LIFE_SECONDS = float(os.getenv("SCORE_HALF_LIFE_SECONDS", "900"))
+SCORE_WALLET_POINTS = float(os.getenv("SCORE_WALLET_POINTS", "1.0"))
+SCORE_SOL_POINTS = float(os.getenv("SCORE_SOL_POINTS", "0.1"))
+SCORE_MAX_SOL = float(os.getenv("SCORE_MAX_SOL", "50"))
+SCORE_RANK_BONUS = float(os.getenv("SCORE_RANK_BONUS", "1.0"))
+
+_scores: dict = {}        # (token, side_key) -> [score, ts of last update]
+_rank_weights: dict = {}  # wallet -> rank weight
+_rank_key = None          # registry KOL order the weights were built from
+_wallet_buys: dict = {}   # wallet -> buys seen
+_wallet_hits: dict = {}   # wallet -> buys that made it into a multibuy alert
+
+
+def _decay(seconds: float) -> float:
+    return 0.5 ** (max(0.0, seconds) / max(1.0, SCORE_HALF_LIFE_SECONDS))
+
+
+def sync_ranks(reg: dict) -> None:
+    """Rebuild rank weights when the KOL list in the wallet registry changed."""
+    global _rank_key, _rank_weights
+    kol = reg.get('kol') or []
+    key = tuple(kol)  # order matters: a reshuffled leaderboard has the same kol_mask
+    if key == _rank_key:
+        return
+    entries = reg.get('entries') or []
+    n = len(kol)
+    _rank_weights = {entries[wid]['address']: 1.0 + SCORE_RANK_BONUS * (n - rank) / n
+                     for rank, wid in enumerate(kol) if wid < len(entries)}
+    _rank_key = key
+
+
+def wallet_weight(wallet: str) -> float:
+    hit_rate = (_wallet_hits.get(wallet, 0) + 1) / (_wallet_buys.get(wallet, 0) + 2)
+    return _rank_weights.get(wallet, 1.0) * (0.5 + hit_rate)
+
+
+def add_event(token_addr: str, side_key: str, wallet: str, amount: float, ts: float) -> None:
+    # weight from the history before this buy: a first buy scores at the neutral 1.0
+    points = wallet_weight(wallet) * (SCORE_WALLET_POINTS + SCORE_SOL_POINTS * min(abs(amount or 0.0), SCORE_MAX_SOL))
+    if side_key == 'buys':
+        _wallet_buys[wallet] = _wallet_buys.get(wallet, 0) + 1
+    entry = _scores.get((token_addr, side_key))
+    if entry is None:
+        _scores[(token_addr, side_key)] = [points, ts]
+    elif ts >= entry[1]:
+        entry[0] = entry[0] * _decay(ts - entry[1]) + points
+        entry[1] = ts
+    else:
+        # late event: decay its points to the accumulator's time instead
+        entry[0] += points * _decay(entry[1] - ts)
+
+
+def score(token_addr: str, side_key: str, now_ts: float) -> float:
+    entry = _scores.get((token_addr, side_key))
+    return entry[0] * _decay(now_ts - entry[1]) if entry else 0.0
+
+
+def record_hit(wallets) -> None:
+    """The wallets' buys made it into a multibuy alert."""
+    for wallet in wallets:
+        _wallet_hits[wallet] = _wallet_hits.get(wallet, 0) + 1
+
+
+def forget(token_addr: str) -> None:
+    _scores.pop((token_addr, 'buys'), None)
+    _scores.pop((token_addr, 'sells'), None)
@@ -0,0 +1,266 @@
+# helpers/sqlite_persistence.py
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from typing import Any, Dict, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+_BOT_DATA_KEY = "bot_data"
+_CALLBACK_DATA_KEY = "callback_data"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS singletons (key TEXT PRIMARY KEY, data BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS conversations (name TEXT NOT NULL, key BLOB NOT NULL, state BLOB NOT NULL, PRIMARY KEY (name, key))",
+)
+
+
+def _dumps(obj: Any) -> bytes:
+    return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+
+class SqlitePersistence(BasePersistence):
+    """Row-per-user persistence on SQLite.
+
+    Unlike PicklePersistence, which rewrites the whole file on every change,
+    each user/chat is stored as its own pickled row and only rows whose
+    serialized content actually changed are written. All file I/O runs on a
+    dedicated single-thread executor, so flushes never block the event loop.
+    """
+
+    def __init__(
+        self,
+        filepath: str = "bot_data.sqlite3",
+        store_data: Optional[PersistenceInput] = None,
+        update_interval: float = 60,
+        legacy_pickle_path: Optional[str] = "bot_data.pickle",
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = filepath
+        self.legacy_pickle_path = legacy_pickle_path
+        # One writer thread → sqlite access is serialized without explicit locks
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-persistence")
+        self._conn: Optional[sqlite3.Connection] = None
+        # Digest of the last written blob per row; used to skip unchanged rows
+        self._user_digests: Dict[int, bytes] = {}
+        self._chat_digests: Dict[int, bytes] = {}
+        self._singleton_digests: Dict[str, bytes] = {}
+        self._conversations: Dict[str, dict] = {}
+
+    # --- executor / connection helpers ---
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.filepath, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for stmt in _SCHEMA:
+                conn.execute(stmt)
+            conn.commit()
+            self._conn = conn
+            self._maybe_import_legacy_pickle(conn)
+        return self._conn
+
+    def _maybe_import_legacy_pickle(self, conn: sqlite3.Connection) -> None:
+        """One-time migration from the old PicklePersistence file."""
+        path = self.legacy_pickle_path
+        if not path or not os.path.exists(path):
+            return
+        has_rows = conn.execute(
+            "SELECT EXISTS(SELECT 1 FROM user_data) OR EXISTS(SELECT 1 FROM singletons)"
+        ).fetchone()[0]
+        if has_rows:
+            return
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Could not import legacy pickle persistence {path}: {e}")
+            return
+        if not isinstance(data, dict):
+            return
+        with conn:
+            for uid, udata in (data.get("user_data") or {}).items():
+                conn.execute("INSERT OR REPLACE INTO user_data (id, data) VALUES (?, ?)", (int(uid), _dumps(udata)))
+            for cid, cdata in (data.get("chat_data") or {}).items():
+                conn.execute("INSERT OR REPLACE INTO chat_data (id, data) VALUES (?, ?)", (int(cid), _dumps(cdata)))
+            if data.get("bot_data") is not None:
+                conn.execute("INSERT OR REPLACE INTO singletons (key, data) VALUES (?, ?)", (_BOT_DATA_KEY, _dumps(data["bot_data"])))
+            if data.get("callback_data") is not None:
+                conn.execute("INSERT OR REPLACE INTO singletons (key, data) VALUES (?, ?)", (_CALLBACK_DATA_KEY, _dumps(data["callback_data"])))
+            for name, conv in (data.get("conversations") or {}).items():
+                for key, state in (conv or {}).items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                        (name, _dumps(key), _dumps(state)),
+                    )
+        logger.info(f"Imported legacy pickle persistence from {path} into {self.filepath}")
+
+    # --- sync DB operations (executor thread only) ---
+    def _load_rows(self, table: str) -> Dict[int, bytes]:
+        conn = self._connect()
+        return {row[0]: row[1] for row in conn.execute(f"SELECT id, data FROM {table}")}
+
+    def _load_singleton(self, key: str) -> Optional[bytes]:
+        row = self._connect().execute("SELECT data FROM singletons WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _write_row(self, table: str, row_id: int, blob: bytes) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute(f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)", (row_id, blob))
+
+    def _delete_row(self, table: str, row_id: int) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+
+    def _write_singleton(self, key: str, blob: bytes) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO singletons (key, data) VALUES (?, ?)", (key, blob))
+
+    def _load_conversations(self, name: str) -> list:
+        conn = self._connect()
+        return conn.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+
+    def _write_conversation(self, name: str, key_blob: bytes, state_blob: Optional[bytes]) -> None:
+        conn = self._connect()
+        with conn:
+            if state_blob is None:
+                conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key_blob))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                    (name, key_blob, state_blob),
+                )
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.commit()
+                self._conn.close()
+            finally:
+                self._conn = None
+
+    # --- BasePersistence API: loading ---
+    async def get_user_data(self) -> Dict[int, dict]:
+        rows = await self._run(self._load_rows, "user_data")
+        result = {}
+        for uid, blob in rows.items():
+            self._user_digests[uid] = _digest(blob)
+            result[uid] = pickle.loads(blob)
+        return result
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        rows = await self._run(self._load_rows, "chat_data")
+        result = {}
+        for cid, blob in rows.items():
+            self._chat_digests[cid] = _digest(blob)
+            result[cid] = pickle.loads(blob)
+        return result
+
+    async def get_bot_data(self) -> dict:
+        blob = await self._run(self._load_singleton, _BOT_DATA_KEY)
+        if blob is None:
+            return {}
+        self._singleton_digests[_BOT_DATA_KEY] = _digest(blob)
+        return pickle.loads(blob)
+
+    async def get_callback_data(self):
+        blob = await self._run(self._load_singleton, _CALLBACK_DATA_KEY)
+        if blob is None:
+            return None
+        self._singleton_digests[_CALLBACK_DATA_KEY] = _digest(blob)
+        return pickle.loads(blob)
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = await self._run(self._load_conversations, name)
+        conv = {pickle.loads(k): pickle.loads(s) for k, s in rows}
+        self._conversations[name] = conv
+        return deepcopy(conv)
+
+    # --- BasePersistence API: incremental writes ---
+    # Serialization happens on the loop (the data may be mutated concurrently,
+    # and one user's dict is small); only the disk write goes to the executor.
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        blob = _dumps(data)
+        digest = _digest(blob)
+        if self._user_digests.get(user_id) == digest:
+            return
+        self._user_digests[user_id] = digest
+        await self._run(self._write_row, "user_data", user_id, blob)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        blob = _dumps(data)
+        digest = _digest(blob)
+        if self._chat_digests.get(chat_id) == digest:
+            return
+        self._chat_digests[chat_id] = digest
+        await self._run(self._write_row, "chat_data", chat_id, blob)
+
+    async def update_bot_data(self, data: dict) -> None:
+        blob = _dumps(data)
+        digest = _digest(blob)
+        if self._singleton_digests.get(_BOT_DATA_KEY) == digest:
+            return
+        self._singleton_digests[_BOT_DATA_KEY] = digest
+        await self._run(self._write_singleton, _BOT_DATA_KEY, blob)
+
+    async def update_callback_data(self, data) -> None:
+        blob = _dumps(data)
+        digest = _digest(blob)
+        if self._singleton_digests.get(_CALLBACK_DATA_KEY) == digest:
+            return
+        self._singleton_digests[_CALLBACK_DATA_KEY] = digest
+        await self._run(self._write_singleton, _CALLBACK_DATA_KEY, blob)
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        conv = self._conversations.setdefault(name, {})
+        if conv.get(key) == new_state:
+            return
+        if new_state is None:
+            conv.pop(key, None)
+        else:
+            conv[key] = new_state
+        await self._run(
+            self._write_conversation, name, _dumps(key), None if new_state is None else _dumps(new_state)
+        )
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._user_digests.pop(user_id, None)
+        await self._run(self._delete_row, "user_data", user_id)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._chat_digests.pop(chat_id, None)
+        await self._run(self._delete_row, "chat_data", chat_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        # Every update is committed as it happens; just release the connection.
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,142 @@
+# helpers/tg_html.py
+"""Local validation of Telegram's HTML parse mode.
+
+render_telegram_html() takes HTML-ish text and returns markup that the Bot API
+is guaranteed to accept: only supported tags/attributes survive, every tag is
+closed and properly nested, stray '<', '>' and '&' are escaped, unsupported
+named entities are replaced, and the visible text is cut to the message limit.
+"""
+from html import escape, unescape
+from html.parser import HTMLParser
+
+# https://core.telegram.org/bots/api#html-style
+_SIMPLE_TAGS = {"b", "strong", "i", "em", "u", "ins", "s", "strike", "del", "code", "pre", "tg-spoiler", "blockquote"}
+_ATTR_TAGS = {
+    "a": {"href"},
+    "span": {"class"},
+    "tg-emoji": {"emoji-id"},
+    "code": {"class"},
+    "blockquote": {"expandable"},
+}
+_VOID_ATTRS = {"expandable"}
+# Telegram counts message length in UTF-16 code units after entity parsing
+TELEGRAM_TEXT_LIMIT = 4096
+_ELLIPSIS = "…"
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class _TelegramHTMLSanitizer(HTMLParser):
+    def __init__(self, max_len: int):
+        super().__init__(convert_charrefs=False)
+        self.max_len = max_len
+        self.out: list[str] = []
+        self.stack: list[str] = []
+        self.visible = 0
+        self.truncated = False
+
+    # --- text ---
+    def _emit_text(self, text: str) -> None:
+        if self.truncated or not text:
+            return
+        n = _utf16_len(text)
+        if self.visible + n > self.max_len:
+            room = max(0, self.max_len - self.visible - 1)
+            cut = text.encode("utf-16-le")[: room * 2].decode("utf-16-le", errors="ignore")
+            self.out.append(escape(cut, quote=False) + _ELLIPSIS)
+            self.visible = self.max_len
+            self.truncated = True
+            return
+        self.out.append(escape(text, quote=False))
+        self.visible += n
+
+    def handle_data(self, data):
+        self._emit_text(data)
+
+    def handle_entityref(self, name):
+        # Decode and re-escape: Telegram only knows &lt; &gt; &amp; &quot;, unknown refs become literal text
+        self._emit_text(unescape(f"&{name};"))
+
+    def handle_charref(self, name):
+        self._emit_text(unescape(f"&#{name};"))
+
+    def handle_comment(self, data):
+        pass
+
+    def handle_decl(self, decl):
+        pass
+
+    def unknown_decl(self, data):
+        pass
+
+    def handle_pi(self, data):
+        pass
+
+    # --- tags ---
+    def _allowed_here(self, tag: str) -> bool:
+        if not self.stack:
+            return True
+        top = self.stack[-1]
+        if top == "pre":
+            return tag == "code"
+        if top == "code":
+            return False
+        if tag == "a" and "a" in self.stack:
+            return False
+        return True
+
+    def handle_starttag(self, tag, attrs):
+        if self.truncated:
+            return
+        if tag == "br":
+            self._emit_text("\n")
+            return
+        if tag not in _SIMPLE_TAGS and tag not in _ATTR_TAGS:
+            self._emit_text(self.get_starttag_text() or "")
+            return
+        if not self._allowed_here(tag):
+            return
+        allowed = _ATTR_TAGS.get(tag, set())
+        kept = [(k, v) for k, v in attrs if k in allowed]
+        if tag == "a" and not any(k == "href" and v for k, v in kept):
+            return
+        if tag == "span" and not any(k == "class" and v == "tg-spoiler" for k, v in kept):
+            return
+        if tag == "tg-emoji" and not any(k == "emoji-id" and v for k, v in kept):
+            return
+        if tag == "code":
+            kept = [(k, v) for k, v in kept if k == "class" and v and v.startswith("language-") and self.stack[-1:] == ["pre"]]
+        rendered = "".join(
+            f" {k}" if k in _VOID_ATTRS else f' {k}="{escape(v or "", quote=True)}"' for k, v in kept
+        )
+        self.out.append(f"<{tag}{rendered}>")
+        self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # Telegram has no void elements; treat <br/> as a newline, drop the rest
+        if tag == "br":
+            self._emit_text("\n")
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            return
+        while self.stack:
+            top = self.stack.pop()
+            self.out.append(f"</{top}>")
+            if top == tag:
+                break
+
+    def result(self) -> str:
+        self.close()
+        while self.stack:
+            self.out.append(f"</{self.stack.pop()}>")
+        return "".join(self.out)
+
+
+def render_telegram_html(text: str, max_len: int = TELEGRAM_TEXT_LIMIT) -> str:
+    """Return a version of `text` that Telegram's HTML parse mode always accepts."""
+    parser = _TelegramHTMLSanitizer(max_len)
+    parser.feed(str(text or ""))
+    return parser.result()
@@ -0,0 +1,113 @@
+# helpers/tracing.py
+"""Per-alert latency traces: block time → discovery → fetch → parse → enrichment → delivery.
+
+Every published alert gets one trace built from its newest triggering event. Traces
+are kept in a ring buffer (ALERT_TRACE_BUFFER) and logged as one JSON line once the
+first chat has received the alert; summarize() turns them into percentiles per stage.
+All timestamps are unix seconds.
+"""
+import json
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+ALERT_TRACE_BUFFER = int(os.getenv("ALERT_TRACE_BUFFER", "500"))
+
+# (label, from, to) — consecutive stages plus the end-to-end staleness
+STAGES = (
+    ("block→discovery", "block_time", "discovered_at"),
+    ("discovery→fetch", "discovered_at", "fetched_at"),
+    ("fetch→parse", "fetched_at", "parsed_at"),
+    ("parse→enrich", "parsed_at", "enriched_at"),
+    ("enrich→queue", "enriched_at", "queued_at"),
+    ("queue→delivery", "queued_at", "delivered_at"),
+    ("block→delivery", "block_time", "delivered_at"),
+)
+
+_traces: deque = deque(maxlen=max(1, ALERT_TRACE_BUFFER))
+
+
+def new_trace(alert: dict) -> dict:
+    """Start a trace for an alert that is about to be queued."""
+    participants = alert.get('participants') or []
+    trigger = max(participants, key=lambda p: p.get('seen_at') or 0, default={})
+    block_time = trigger.get('time')
+    return {
+        'token': alert.get('token'),
+        'side': alert.get('side'),
+        'kind': alert.get('kind'),
+        'window': alert.get('window'),
+        'wallet': trigger.get('wallet'),
+        'block_time': block_time.timestamp() if hasattr(block_time, 'timestamp') else block_time,
+        'discovered_at': trigger.get('discovered_at'),
+        'fetched_at': trigger.get('fetched_at'),
+        'parsed_at': trigger.get('seen_at'),
+        'enriched_at': alert.get('enriched_at'),
+        'queued_at': time.time(),
+        'delivered_at': None,
+        'chats': 0,
+    }
+
+
+def mark_delivered(trace: dict, ts: float | None = None) -> None:
+    """Record a successful delivery; the first one closes the trace."""
+    trace['chats'] += 1
+    if trace['delivered_at'] is not None:
+        return
+    trace['delivered_at'] = ts or time.time()
+    _traces.append(trace)
+    try:
+        logger.info(f"alert_trace {json.dumps(trace, default=str)}")
+    except Exception:
+        pass
+
+
+def recent_traces(limit: int | None = None) -> list:
+    items = list(_traces)
+    return items[-limit:] if limit else items
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(traces: list | None = None) -> dict:
+    """{stage: {'n', 'p50', 'p90', 'p99', 'max'}} over the buffered traces (seconds)."""
+    traces = recent_traces() if traces is None else traces
+    out = {}
+    for label, start, end in STAGES:
+        values = sorted(
+            t[end] - t[start] for t in traces
+            if t.get(start) is not None and t.get(end) is not None
+        )
+        if not values:
+            continue
+        out[label] = {
+            'n': len(values),
+            'p50': _percentile(values, 0.50),
+            'p90': _percentile(values, 0.90),
+            'p99': _percentile(values, 0.99),
+            'max': values[-1],
+        }
+    return out
+
+
+def format_summary(traces: list | None = None) -> str:
+    """HTML table for the /latency admin command."""
+    stats = summarize(traces)
+    if not stats:
+        return "No alert traces yet."
+    lines = [f"<b>Alert latency</b> (last {len(recent_traces())} alerts, seconds)", "<pre>"]
+    lines.append(f"{'stage':<16}{'n':>5}{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}")
+    for label, s in stats.items():
+        lines.append(f"{label:<16}{s['n']:>5}{s['p50']:>8.1f}{s['p90']:>8.1f}{s['p99']:>8.1f}{s['max']:>8.1f}")
+    lines.append("</pre>")
+    return "\n".join(lines)
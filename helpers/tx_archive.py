@@ -0,0 +1,267 @@
+# helpers/tx_archive.py
+"""Compressed archive of raw getTransaction payloads, keyed by signature.
+
+Records are appended to rotating segment files under TX_ARCHIVE_DIR as
+{"signature": ..., "tx": {...}} JSON lines, each line compressed as its own
+zstd frame (if `zstandard` is installed) or gzip member. Whole segments therefore
+stream like ordinary .zst/.gz JSONL files, while index.tsv
+(signature, segment, offset, length) lets get() decompress a single record.
+
+The bot goes through aget_archive() (index load on a thread) and aput()/aget():
+compression, writes, rotation and index rewrites run on one dedicated archive
+thread, off the event loop and in order. get() checks the record's signature, so
+a stale index entry is a miss, never another transaction.
+"""
+import asyncio
+import gzip
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import jsoncodec
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard  # type: ignore
+except Exception:  # optional dependency
+    zstandard = None
+
+TX_ARCHIVE_DIR = os.getenv("TX_ARCHIVE_DIR", "")  # empty → capture disabled
+TX_ARCHIVE_SEGMENT_BYTES = int(os.getenv("TX_ARCHIVE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+TX_ARCHIVE_MAX_SEGMENTS = int(os.getenv("TX_ARCHIVE_MAX_SEGMENTS", "0"))  # 0 → keep everything
+TX_ARCHIVE_COMPRESSION = os.getenv("TX_ARCHIVE_COMPRESSION", "zstd" if zstandard else "gzip")
+
+INDEX_NAME = "index.tsv"
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3, write_content_size=True).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data: bytes, segment: str) -> bytes:
+    if segment.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .zst segments")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _open_segment_stream(path: str):
+    """Text stream over a whole segment (all frames/members)."""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .zst segments")
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+class TxArchive:
+    def __init__(self, directory: str, segment_bytes: int = TX_ARCHIVE_SEGMENT_BYTES,
+                 max_segments: int = TX_ARCHIVE_MAX_SEGMENTS, compression: str = TX_ARCHIVE_COMPRESSION):
+        self.directory = directory
+        self.segment_bytes = max(1024, segment_bytes)
+        self.max_segments = max(0, max_segments)
+        self.codec = "zstd" if compression == "zstd" and zstandard is not None else "gzip"
+        self.ext = ".jsonl.zst" if self.codec == "zstd" else ".jsonl.gz"
+        self._index: dict = {}  # signature -> (segment, offset, length)
+        self._segment = None
+        self._segment_fh = None
+        self._index_fh = None
+        self._executor: ThreadPoolExecutor | None = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    # --- segments ---
+    def segments(self) -> list:
+        return sorted(n for n in os.listdir(self.directory) if n.startswith("seg-") and n.endswith((".jsonl.gz", ".jsonl.zst")))
+
+    def _load_index(self) -> None:
+        path = os.path.join(self.directory, INDEX_NAME)
+        present = set(self.segments())
+        dropped = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4:
+                        dropped += 1
+                        continue
+                    sig, segment, offset, length = parts
+                    if segment not in present:
+                        dropped += 1
+                        continue
+                    self._index[sig] = (segment, int(offset), int(length))
+        if dropped:
+            self._rewrite_index()
+        logger.info(f"tx archive {self.directory}: {len(self._index)} transactions in {len(present)} segments ({self.codec})")
+
+    def _rewrite_index(self) -> None:
+        path = os.path.join(self.directory, INDEX_NAME)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for sig, (segment, offset, length) in self._index.items():
+                f.write(f"{sig}\t{segment}\t{offset}\t{length}\n")
+        os.replace(tmp, path)
+
+    def _open_for_append(self) -> None:
+        existing = [s for s in self.segments() if s.endswith(self.ext)]
+        if self._segment is None and existing:
+            last = existing[-1]
+            if os.path.getsize(os.path.join(self.directory, last)) < self.segment_bytes:
+                self._segment = last
+        if self._segment is None:
+            segments = self.segments()
+            number = int(segments[-1][4:10]) + 1 if segments else 1
+            self._segment = f"seg-{number:06d}{self.ext}"
+        self._segment_fh = open(os.path.join(self.directory, self._segment), "ab")
+        if self._index_fh is None:
+            self._index_fh = open(os.path.join(self.directory, INDEX_NAME), "a", encoding="utf-8")
+
+    def _rotate(self) -> None:
+        self._segment_fh.close()
+        self._segment_fh = None
+        number = int(self._segment[4:10]) + 1
+        self._segment = f"seg-{number:06d}{self.ext}"
+        self._open_for_append()
+        if self.max_segments:
+            removed = set()
+            for old in self.segments()[:-self.max_segments]:
+                try:
+                    os.remove(os.path.join(self.directory, old))
+                except OSError:
+                    continue
+                removed.add(old)
+            if removed:
+                # one index rewrite per rotation, however many segments went
+                self._index = {s: loc for s, loc in self._index.items() if loc[0] not in removed}
+                self._rewrite_index()
+                self._index_fh.close()
+                self._index_fh = open(os.path.join(self.directory, INDEX_NAME), "a", encoding="utf-8")
+
+    # --- records ---
+    def __contains__(self, signature: str) -> bool:
+        return signature in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def put(self, signature: str, tx: dict) -> bool:
+        """Append one transaction; returns False if the signature is already archived."""
+        if not signature or signature in self._index:
+            return False
+        if self._segment_fh is None:
+            self._open_for_append()
+        blob = _compress(jsoncodec.dumpb({"signature": signature, "tx": tx}) + b"\n", self.codec)
+        offset = self._segment_fh.tell()
+        self._segment_fh.write(blob)
+        self._segment_fh.flush()
+        self._index[signature] = (self._segment, offset, len(blob))
+        self._index_fh.write(f"{signature}\t{self._segment}\t{offset}\t{len(blob)}\n")
+        self._index_fh.flush()
+        if offset + len(blob) >= self.segment_bytes:
+            self._rotate()
+        return True
+
+    def get(self, signature: str) -> dict | None:
+        loc = self._index.get(signature)
+        if loc is None:
+            self.misses += 1
+            return None
+        segment, offset, length = loc
+        try:
+            with open(os.path.join(self.directory, segment), "rb") as f:
+                f.seek(offset)
+                record = jsoncodec.loads(_decompress(f.read(length), segment))
+        except Exception as e:
+            logger.warning(f"tx archive read failed for {signature}: {e}")
+            self._index.pop(signature, None)
+            self.misses += 1
+            return None
+        if record.get("signature") != signature:
+            # stale or foreign index entry: never serve another transaction
+            logger.warning(f"tx archive index points {signature} at {record.get('signature')}, dropped")
+            self._index.pop(signature, None)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return record.get("tx")
+
+    # --- async access (archive thread) ---
+    def _run(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix="tx-archive")
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def aput(self, signature: str, tx: dict) -> bool:
+        if not signature or signature in self._index:
+            return False
+        return await self._run(self.put, signature, tx)
+
+    async def aget(self, signature: str) -> dict | None:
+        if signature not in self._index:
+            self.misses += 1
+            return None
+        return await self._run(self.get, signature)
+
+    def iter_records(self):
+        """Stream (signature, tx) over every segment in write order."""
+        if self._segment_fh is not None:
+            self._segment_fh.flush()
+        for segment in self.segments():
+            with _open_segment_stream(os.path.join(self.directory, segment)) as f:
+                for line in f:
+                    if line.strip():
+                        record = jsoncodec.loads(line)
+                        yield record.get("signature"), record.get("tx")
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for fh in (self._segment_fh, self._index_fh):
+            if fh is not None:
+                fh.close()
+        self._segment_fh = self._index_fh = None
+
+
+_archive: TxArchive | None = None
+_opening: asyncio.Future | None = None
+
+
+def get_archive() -> TxArchive | None:
+    """Process-wide archive under TX_ARCHIVE_DIR, or None when capture is disabled."""
+    global _archive
+    if not TX_ARCHIVE_DIR:
+        return None
+    if _archive is None:
+        _archive = TxArchive(TX_ARCHIVE_DIR)
+    return _archive
+
+
+async def aget_archive() -> TxArchive | None:
+    """get_archive() for the event loop: the first open (reading index.tsv) runs on a thread."""
+    global _archive, _opening
+    if not TX_ARCHIVE_DIR:
+        return None
+    if _archive is None:
+        if _opening is None:
+            _opening = asyncio.ensure_future(asyncio.to_thread(TxArchive, TX_ARCHIVE_DIR))
+        opening = _opening
+        try:
+            archive = await asyncio.shield(opening)
+        except Exception as e:
+            logger.warning(f"tx archive {TX_ARCHIVE_DIR} could not be opened: {e}")
+            if _opening is opening:
+                _opening = None
+            return None
+        if _archive is None:
+            _archive = archive
+    return _archive
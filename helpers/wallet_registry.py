@@ -0,0 +1,202 @@
+# helpers/wallet_registry.py
+"""Shared wallet registry + compact per-user wallet state.
+
+bot_data['wallet_registry'] holds every known wallet exactly once:
+    {'entries': [{'address': str, 'name': str}, ...],   # id == list index, append-only
+     'index': {address: id},
+     'kol': [id, ...],                                    # current KOL list, scrape order
+     'kol_mask': int}                                     # bitmap of 'kol'
+
+user_data['wallet_state'] only stores bitmaps over registry ids:
+    {'kol': bool,      # user follows the shared KOL list
+     'extra': int,     # manually added / kept wallets outside the KOL list
+     'hidden': int,    # KOL wallets removed by the user
+     'tracked': int,   # wallets selected for tracking (always visible)
+     'names': {id: name}}  # per-user name overrides
+
+A user's visible list is (KOL list minus hidden) + extra + tracked, so
+tracked wallets that drop out of a fresh KOL list stay pinned for free and
+"Select All" / "Deselect All" are a handful of int operations.
+"""
+
+REGISTRY_KEY = 'wallet_registry'
+USER_STATE_KEY = 'wallet_state'
+
+
+def _iter_bits(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def get_registry(bot_data) -> dict:
+    reg = bot_data.get(REGISTRY_KEY)
+    if not isinstance(reg, dict):
+        reg = {'entries': [], 'index': {}, 'kol': [], 'kol_mask': 0}
+        bot_data[REGISTRY_KEY] = reg
+    return reg
+
+
+def intern_wallet(reg: dict, address: str, name: str | None = None) -> int:
+    wid = reg['index'].get(address)
+    if wid is None:
+        wid = len(reg['entries'])
+        reg['entries'].append({'address': address, 'name': name or address})
+        reg['index'][address] = wid
+    return wid
+
+
+def set_kol_wallets(reg: dict, wallets: list) -> list:
+    """Replace the shared KOL list with a fresh scrape; canonical names follow the scrape."""
+    ids = []
+    seen = set()
+    for w in wallets:
+        addr = w.get('address')
+        if not addr or addr in seen:
+            continue
+        seen.add(addr)
+        wid = intern_wallet(reg, addr, w.get('name'))
+        if w.get('name'):
+            reg['entries'][wid]['name'] = w['name']
+        ids.append(wid)
+    mask = 0
+    for wid in ids:
+        mask |= 1 << wid
+    reg['kol'] = ids
+    reg['kol_mask'] = mask
+    return ids
+
+
+def get_user_state(bot_data, user_data) -> dict:
+    """Return the user's wallet state, migrating a legacy user_data['wallets'] list on first access."""
+    st = user_data.get(USER_STATE_KEY)
+    if isinstance(st, dict):
+        return st
+    reg = get_registry(bot_data)
+    st = {'kol': False, 'extra': 0, 'hidden': 0, 'tracked': 0, 'names': {}}
+    legacy = user_data.pop('wallets', None) or []
+    present_kol = 0
+    for w in legacy:
+        addr = w.get('address') if isinstance(w, dict) else None
+        if not addr:
+            continue
+        wid = intern_wallet(reg, addr, w.get('name'))
+        bit = 1 << wid
+        name = w.get('name')
+        if name and name != reg['entries'][wid]['name']:
+            st['names'][wid] = name
+        if reg['kol_mask'] & bit:
+            present_kol |= bit
+        else:
+            st['extra'] |= bit
+        if w.get('is_tracking'):
+            st['tracked'] |= bit
+    if present_kol:
+        st['kol'] = True
+        st['hidden'] = reg['kol_mask'] & ~present_kol
+    user_data[USER_STATE_KEY] = st
+    return st
+
+
+def _kol_visible_mask(reg: dict, st: dict) -> int:
+    return (reg['kol_mask'] & ~st['hidden']) if st.get('kol') else 0
+
+
+def visible_mask(reg: dict, st: dict) -> int:
+    return _kol_visible_mask(reg, st) | st['extra'] | st['tracked']
+
+
+def user_wallet_ids(reg: dict, st: dict) -> list:
+    """Ordered ids of the user's visible wallets: KOL order first, then the rest by id."""
+    kol_vis = _kol_visible_mask(reg, st)
+    ids = [wid for wid in reg['kol'] if kol_vis >> wid & 1] if kol_vis else []
+    ids.extend(_iter_bits((st['extra'] | st['tracked']) & ~kol_vis))
+    return ids
+
+
+def wallet_count(reg: dict, st: dict) -> int:
+    return visible_mask(reg, st).bit_count()
+
+
+def wallet_name(reg: dict, st: dict, wid: int) -> str:
+    return st['names'].get(wid) or reg['entries'][wid]['name']
+
+
+def wallet_view(reg: dict, st: dict, wid: int) -> dict:
+    return {
+        'name': wallet_name(reg, st, wid),
+        'address': reg['entries'][wid]['address'],
+        'is_tracking': bool(st['tracked'] >> wid & 1),
+    }
+
+
+def tracked_wallets(reg: dict, st: dict) -> list:
+    """[{'name', 'address'}] for every tracked wallet; O(tracked)."""
+    return [
+        {'name': wallet_name(reg, st, wid), 'address': reg['entries'][wid]['address']}
+        for wid in _iter_bits(st['tracked'])
+    ]
+
+
+def _untrack(reg: dict, st: dict, mask: int) -> None:
+    # Wallets only visible because they were tracked (pinned) must stay in the list
+    st['extra'] |= mask & st['tracked'] & ~_kol_visible_mask(reg, st)
+    st['tracked'] &= ~mask
+
+
+def add_wallet(reg: dict, st: dict, address: str, name: str) -> bool:
+    """Add a manual wallet. Returns False if it is already in the user's list."""
+    wid = reg['index'].get(address)
+    if wid is not None and visible_mask(reg, st) >> wid & 1:
+        return False
+    wid = intern_wallet(reg, address, name)
+    if name and name != reg['entries'][wid]['name']:
+        st['names'][wid] = name
+    bit = 1 << wid
+    st['hidden'] &= ~bit
+    st['extra'] |= bit
+    return True
+
+
+def toggle_wallet(reg: dict, st: dict, address: str) -> None:
+    wid = reg['index'].get(address)
+    if wid is None:
+        return
+    bit = 1 << wid
+    if not visible_mask(reg, st) & bit:
+        return
+    if st['tracked'] & bit:
+        _untrack(reg, st, bit)
+    else:
+        st['tracked'] |= bit
+
+
+def remove_wallet(reg: dict, st: dict, address: str) -> None:
+    wid = reg['index'].get(address)
+    if wid is None:
+        return
+    bit = 1 << wid
+    st['tracked'] &= ~bit
+    st['extra'] &= ~bit
+    st['hidden'] |= bit & reg['kol_mask']
+    st['names'].pop(wid, None)
+
+
+def select_all(reg: dict, st: dict) -> None:
+    st['tracked'] |= visible_mask(reg, st)
+
+
+def deselect_all(reg: dict, st: dict) -> None:
+    _untrack(reg, st, st['tracked'])
+
+
+def apply_kol_refresh(reg: dict, st: dict, auto_track: bool = False) -> int:
+    """Per-user smart merge after set_kol_wallets(): follow the fresh list, keep tracked
+    wallets that left it pinned, drop untracked manual extras. Returns pinned count."""
+    st['kol'] = True
+    st['hidden'] = 0
+    st['extra'] = 0
+    if auto_track:
+        st['tracked'] |= reg['kol_mask']
+    return (st['tracked'] & ~reg['kol_mask']).bit_count()
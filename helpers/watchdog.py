@@ -0,0 +1,113 @@
+# helpers/watchdog.py
+"""Event loop watchdog: scheduling lag plus stack traces of whatever blocks the loop.
+
+A heartbeat task on the loop wakes every WATCHDOG_INTERVAL_SECONDS and records how
+late it ran (event_loop_lag_seconds / event_loop_lag_max_seconds). A daemon thread
+watches the heartbeat: once it is more than WATCHDOG_STALL_MS overdue, the loop
+thread is stuck in a synchronous call, so the thread grabs the loop thread's current
+stack (sys._current_frames) and logs it. When the loop recovers the total stall time
+goes to event_loop_stalls_total / event_loop_stall_seconds, and the log line names
+the blocking frame. recent_stalls() keeps the last few for inspection.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_INTERVAL_SECONDS = float(os.getenv("WATCHDOG_INTERVAL_SECONDS", os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.25")))
+WATCHDOG_STALL_MS = float(os.getenv("WATCHDOG_STALL_MS", "100"))  # 0 → lag only, no stack capture
+WATCHDOG_STACK_LIMIT = int(os.getenv("WATCHDOG_STACK_LIMIT", "25"))
+
+_lag_samples: deque = deque(maxlen=4096)
+_stalls: deque = deque(maxlen=50)
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = WATCHDOG_INTERVAL_SECONDS, stall_ms: float = WATCHDOG_STALL_MS):
+        self.interval = max(0.01, interval)
+        self.stall_seconds = max(0.0, stall_ms) / 1000.0
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def start(self) -> "LoopWatchdog":
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop_watchdog")
+        if self.stall_seconds > 0:
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        window: deque = deque()  # (ts, lag) over the last minute for the max gauge
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._beat = time.monotonic()
+            _lag_samples.append(lag)
+            metrics.EVENT_LOOP_LAG.observe(lag)
+            now = time.monotonic()
+            window.append((now, lag))
+            while window and now - window[0][0] > 60:
+                window.popleft()
+            metrics.EVENT_LOOP_LAG_MAX.set(max(v for _, v in window))
+
+    def _watch(self) -> None:
+        poll = max(0.005, self.stall_seconds / 4)
+        stall = None  # {'beat', 'stack', 'frame'} of the stall in progress
+        while not self._stop.wait(poll):
+            overdue = time.monotonic() - self._beat - self.interval
+            if stall is None:
+                if overdue > self.stall_seconds:
+                    stall = {'beat': self._beat, **self._capture()}
+                    logger.warning(f"Event loop blocked for {overdue * 1000:.0f} ms, loop thread is in:\n{stall['stack']}")
+            elif self._beat != stall['beat']:
+                # heartbeat ran again: the stall is over
+                duration = self._beat - stall['beat'] - self.interval
+                metrics.EVENT_LOOP_STALLS.inc()
+                metrics.EVENT_LOOP_STALL_SECONDS.observe(duration)
+                _stalls.append({'ts': time.time(), 'duration': duration, 'frame': stall['frame'], 'stack': stall['stack']})
+                logger.warning(f"Event loop stall ended after {duration * 1000:.0f} ms ({stall['frame']})")
+                stall = None
+
+    def _capture(self) -> dict:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return {'stack': '<loop thread not found>', 'frame': '?'}
+        summary = traceback.extract_stack(frame, limit=WATCHDOG_STACK_LIMIT)
+        top = summary[-1] if summary else None
+        return {
+            'stack': ''.join(traceback.format_list(summary)),
+            'frame': f"{top.filename}:{top.lineno} in {top.name}" if top else '?',
+        }
+
+
+def start_watchdog(interval: float = WATCHDOG_INTERVAL_SECONDS, stall_ms: float = WATCHDOG_STALL_MS) -> LoopWatchdog:
+    """Start the watchdog on the running loop; call stop() on shutdown."""
+    return LoopWatchdog(interval, stall_ms).start()
+
+
+def recent_loop_lag() -> list:
+    return list(_lag_samples)
+
+
+def recent_stalls() -> list:
+    return list(_stalls)
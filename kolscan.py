@@ -3,9 +3,16 @@ import logging
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from playwright_stealth import Stealth
 import os
+from time import perf_counter
+
+from helpers import cache_cleanup, metrics
 
 logger = logging.getLogger(__name__)
 
+def _write_text(path: str, content: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
 async def get_kolscan_wallets():
     """
     Fetches wallets by navigating to the kolscan.io leaderboard, clicking each trader's
@@ -14,9 +21,12 @@ async def get_kolscan_wallets():
     leaderboard_url = "https://kolscan.io/leaderboard"
     wallets = []
     browser = None
+    started = perf_counter()
     try:
         async with Stealth().use_async(async_playwright()) as p:
             browser = await p.chromium.launch(headless=True)
+            # the cache cleanup job must never delete the browser we are running
+            cache_cleanup.protect_path(p.chromium.executable_path)
             page = await browser.new_page()
 
             logger.info(f"Navigating to leaderboard: {leaderboard_url}")
@@ -67,17 +77,20 @@ async def get_kolscan_wallets():
         # In case of a major failure, save debug info
         if 'page' in locals() and page and not page.is_closed():
             debug_dir = 'debug'
-            os.makedirs(debug_dir, exist_ok=True)
+            await asyncio.to_thread(os.makedirs, debug_dir, exist_ok=True)
             screenshot_path = os.path.join(debug_dir, 'kolscan_timeout_screenshot.png')
             html_path = os.path.join(debug_dir, 'kolscan_timeout_page.html')
             await page.screenshot(path=screenshot_path, full_page=True)
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(await page.content())
+            content = await page.content()
+            # file I/O off the event loop: the bot keeps running alerts while this dumps
+            await asyncio.to_thread(_write_text, html_path, content)
             logger.info(f"Saved debug info to {debug_dir}")
     finally:
         if browser:
             await browser.close()
             logger.info("Browser closed.")
             
+    metrics.KOL_SCRAPE_SECONDS.observe(perf_counter() - started)
+    metrics.KOL_SCRAPE_WALLETS.set(len(wallets))
     logger.info(f"Scraping complete. Successfully collected {len(wallets)} wallets.")
     return wallets 
\ No newline at end of file